@@ -1,20 +1,26 @@
-import json
 import sys
 from collections import Counter
 import random
 
+import numpy as np
+
 sys.path.append("../m209 Brian Neal")
-from m209.keylist.generate import generate_key_list, KeyListGenError, generate_lugs, generate_pin_list
+from m209.keylist.generate import generate_key_list, KeyListGenError, generate_lugs
 from m209.keylist.data import GROUP_A, GROUP_B
+from m209.keylist.key_index import key_hash, pin_hash, pin_matrix_hashes
+from m209.keylist.pin_batch import generate_pin_matrix, pin_lists
+
+from key_writer import KeyWriter, FLUSH_EVERY, iter_keys
 DEFAULT_FILENAME = "key.json"
 
 
 
-def _lug_selection(min_overlaps=None, max_overlaps=None):
+def _lug_selection(min_overlaps=None, max_overlaps=None, rng=random):
     while True:
-        rn = random.randint(0, 100)
+        rn = rng.randint(0, 100)
         group = GROUP_A if rn > 10 else GROUP_B
-        selection = random.choice(group)
+        # Copy the selection so that shuffling it does not change the table
+        selection = list(rng.choice(group))
 
         if min_overlaps is None and max_overlaps is None:
             break
@@ -28,7 +34,7 @@ def _lug_selection(min_overlaps=None, max_overlaps=None):
             if min_overlaps <= sum(selection) - 27 <= max_overlaps:
                 break
 
-    random.shuffle(selection)
+    rng.shuffle(selection)
     return selection
 
 
@@ -39,71 +45,80 @@ class KeyGen:
         self.path = path
         self.min_overlaps = None
         self.max_overlaps = None
+        # Optional m209.keylist.lug_index.LugIndex to draw the lug settings from:
+        self.lug_index = None
+        # Optional m209.keylist.key_index.KeyIndex of the full keys (keygen_json) and of the pin
+        # lists (keygen_json_pins) generated so far, e.g. loaded from the training keys when
+        # generating test keys. Equivalent keys in them are rejected and new ones are added. Key
+        # hashes and pin hashes are kept apart, so a pin list cannot be mistaken for a key. Each
+        # worker process adds to its own copies, see key_dedup.py for merging the index of all files.
+        self.key_index = None
+        self.pin_index = None
+        # If True, JSON Lines files that already exist are completed instead of replaced: their
+        # records are kept (and added to the indexes) and only the missing records are generated,
+        # so a killed run can be continued, see key_writer.KeyWriter.
+        self.resume = False
 
     def keygen_json(self, filename, interactive=False):
-        key_lists = None
-
+        """
+        Writes self.count key lists to a JSON file, or a JSON Lines file if filename ends
+        with .jsonl. The keys are streamed to the file as they are generated, see key_writer.py.
+        """
         if interactive:
             print(f"\nGenerating file {filename} ")
-        while True:
-            try:
-                key_lists = [generate_key_list("AA", max_lug_attempts=10000) for _ in range(self.count)]
-                break
-            except KeyListGenError as err:
-                if interactive:
-                    print('Handling run-time error: ', err)
-                continue
 
-        json_dict = []
-
-        for key_list in key_lists:
-            json_dict.append(
-                {"pin_list": key_list.pin_list,
-                 "lugs": key_list.lugs,
-                 "letter_check": key_list.letter_check
-                 }
-            )
-
-        with open(self.path + filename, 'w') as outfile:
-            json.dump(json_dict, outfile)
+        with KeyWriter(self.path + filename, resume=self.resume) as writer:
+            if writer.count and self.key_index is not None:
+                self.key_index.update(key_hash(record["lugs"], record["pin_list"])
+                                      for record in iter_keys(self.path + filename))
+            while writer.count < self.count:
+                while True:
+                    try:
+                        key_list = generate_key_list("AA", max_lug_attempts=10000)
+                    except KeyListGenError as err:
+                        if interactive:
+                            print('Handling run-time error: ', err)
+                        continue
+                    if self.key_index is None or self.key_index.add(key_hash(key_list.lugs, key_list.pin_list)):
+                        break
+
+                writer.write(
+                    {"pin_list": key_list.pin_list,
+                     "lugs": key_list.lugs,
+                     "letter_check": key_list.letter_check
+                     }
+                )
 
     def keygen_json_lugs(self, filename):
-        lugs = []
-
-        for _ in range(self.count):
-            while True:
-                try:
-                    lugs.append(generate_lugs(lug_selection=_lug_selection(self.min_overlaps, self.max_overlaps),
-                                              max_attempts=10000))
-                    break
-                except KeyListGenError as err:
-                    continue
-
-        json_dict = []
-
-        for lug in lugs:
-            json_dict.append(lug)
-
-        with open(self.path + filename, 'w') as outfile:
-            json.dump(json_dict, outfile)
+        """
+        Streams self.count lug settings to a JSON or JSON Lines file, see keygen_json().
+        """
+        with KeyWriter(self.path + filename, resume=self.resume) as writer:
+            while writer.count < self.count:
+                while True:
+                    try:
+                        selection = _lug_selection(self.min_overlaps, self.max_overlaps)
+                        if self.lug_index is not None:
+                            writer.write(self.lug_index.draw(selection))
+                        else:
+                            writer.write(generate_lugs(lug_selection=selection, max_attempts=10000))
+                        break
+                    except KeyListGenError as err:
+                        continue
 
     def keygen_json_pins(self, filename):
-        pin_list = None
-
-        while True:
-            try:
-                pin_list = (generate_pin_list(max_attempts=10000) for _ in range(self.count))
-                break
-            except KeyListGenError as err:
-                continue
-
-        json_dict = []
-
-        for pins in pin_list:
-            json_dict.append(pins)
-
-        with open(self.path + filename, 'w') as outfile:
-            json.dump(json_dict, outfile)
+        """
+        Streams self.count pin lists to a JSON or JSON Lines file, see keygen_json(). The pin
+        lists are dealt and checked as bit matrices of up to FLUSH_EVERY rows.
+        """
+        with KeyWriter(self.path + filename, resume=self.resume) as writer:
+            if writer.count and self.pin_index is not None:
+                self.pin_index.update(pin_hash(pin_list) for pin_list in iter_keys(self.path + filename))
+            while writer.count < self.count:
+                bits = generate_pin_matrix(min(FLUSH_EVERY, self.count - writer.count), max_attempts=10000)
+                if self.pin_index is not None:
+                    bits = bits[np.array([self.pin_index.add(h) for h in pin_matrix_hashes(bits)], dtype=bool)]
+                writer.write_all(pin_lists(bits))
 
 
 def generate_JFB_lug_Settings(key):
@@ -4,6 +4,8 @@ import os
 import sys
 import string
 
+import numpy as np
+
 sys.path.append("../m209 Brian Neal")
 
 from m209.procedure import StdProcedure
@@ -11,6 +13,9 @@ from m209.keylist import KeyList
 from m209.keylist.generate import generate_letter_check
 from m209.converter import M209_ALPHABET_LIST
 from m209.data import KEY_WHEEL_DATA
+from m209.keystream import batch_keystream, lug_counts, pin_bits
+from shard import write_shard
+from key_writer import read_keys
 
 CIPHER_TABLE = list(reversed(string.ascii_uppercase))
 
@@ -38,11 +43,73 @@ def _create_indicators(proc):
     return sys_ind, ext_msg_ind, int_msg_ind
 
 
+def _int_msg_ind_positions(int_msg_ind):
+    """
+    Computes the key wheel positions for an Internal Message Indicator the same way
+    StdProcedure does: letters that aren't valid for a key wheel are skipped.
+    :param int_msg_ind: Internal Message Indicator in the form of a String like "AAAAAA"
+    :return: List of the 6 0-based key wheel positions, or None if int_msg_ind runs out of letters.
+    """
+    it = iter(int_msg_ind)
+    positions = []
+    for letters, _ in KEY_WHEEL_DATA:
+        for indicator in it:
+            if indicator in letters:
+                positions.append(letters.index(indicator))
+                break
+        else:
+            return None
+    return positions
+
+
+def _records(source):
+    """
+    :param source: Key file name, key_writer.TarMember or list of records.
+    :return: A new list of the records of source.
+    """
+    if isinstance(source, list):
+        return list(source)
+    return read_keys(source)
+
+
+def _create_indicators_direct(counts, bits):
+    """
+    Direct keystream version of _create_indicators() for a whole key file at once.
+    For every key a random External Message Indicator and System Indicator are drawn and
+    the System Indicator is enciphered 12 times by the keystream engine.
+    :param counts: (N, 21) array of lug count vectors.
+    :param bits: (N, 131) array of pin bit vectors.
+    :return: List of N Internal Message Indicators and an (N, 6) array of their key wheel positions.
+    """
+    int_msg_inds = [None] * len(counts)
+    positions = np.zeros((len(counts), len(KEY_WHEEL_DATA)), dtype=np.intp)
+    todo = np.arange(len(counts))
+
+    while len(todo):
+        ext_positions = [[random.randrange(len(letters)) for letters, _ in KEY_WHEEL_DATA] for _ in todo]
+        sys_inds = np.array([random.randrange(26) for _ in todo])
+        keystreams = batch_keystream(counts[todo], bits[todo], ext_positions, length=12)
+        sys_ind_enc = (sys_inds[:, None] - keystreams) % 26
+
+        retry = []
+        for i, enc in zip(todo, sys_ind_enc):
+            int_msg_ind = "".join(CIPHER_TABLE[n] for n in enc)
+            int_positions = _int_msg_ind_positions(int_msg_ind)
+            if int_positions is None:
+                retry.append(i)
+                continue
+            int_msg_inds[i] = int_msg_ind
+            positions[i] = int_positions
+        todo = np.array(retry, dtype=np.intp)
+
+    return int_msg_inds, positions
+
+
 class Encrypt:
 
     def __init__(self, key_path="keys/", destin_path="ciphertexts_Gut/", count_a=200,
                  append_plaintext=False, append_ciphertext=True, append_keystream=False,
-                 append_lugs=False, append_pins=False):
+                 append_lugs=False, append_pins=False, direct_keystream=False, output_format="json"):
         self.int_msg_ind = None
         self.gutenberg_en = None
         self.key_path = key_path
@@ -53,6 +120,8 @@ class Encrypt:
         self.append_keystream = append_keystream
         self.append_lugs = append_lugs
         self.append_pins = append_pins
+        self.direct_keystream = direct_keystream
+        self.output_format = output_format
         self.int_msg_ind_preset = False
         self.keys = None
 
@@ -89,16 +158,16 @@ class Encrypt:
                 yield random.choice(self.gutenberg_en)
 
     def load_keys(self, source, filetype):
+        # Key files can be JSON or JSON Lines (.jsonl), and each source can be a filename,
+        # a key_writer.TarMember to stream the keys out of a tar archive, or a list of
+        # records already read, e.g. by key_writer.iter_tar_keys()
         if filetype == "single_json":
-            with open(source, 'r') as infile:
-                self.keys = json.load(infile)
+            self.keys = _records(source)
         if filetype == "pins_n_lugs":
-            with open(source[0], 'r') as infile:
-                lugs = json.load(infile)
-                random.shuffle(lugs)
-            with open(source[1], 'r') as infile:
-                pins = json.load(infile)
-                random.shuffle(pins)
+            lugs = _records(source[0])
+            random.shuffle(lugs)
+            pins = _records(source[1])
+            random.shuffle(pins)
             self.keys = []
             for x in enumerate(zip(pins, lugs)):
                 letter_check = generate_letter_check(x[1][1], x[1][0])
@@ -108,11 +177,16 @@ class Encrypt:
         """
         Encrypts a plaintext with each key in the specified key file.
         Output is a JSON file in destin_path with filename keyfile.split('_')[0] + "_cipher.json"
+        If output_format is "shard", the output is a binary shard (see shard.py) with
+        filename keyfile.split('_')[0] + "_cipher.shard" instead. This requires direct_keystream.
         :param keyfile: Name of the keyfile in key_path.
         """
 
         destination = self.destin_path + keyfile.split('_')[0] + "_cipher.json"
 
+        if self.output_format == "shard" and not self.direct_keystream:
+            raise Exception("shard output requires direct_keystream")
+
         ciphertexts = []
 
         # loads Keys if not already loaded.
@@ -120,6 +194,14 @@ class Encrypt:
             self.load_keys(self.key_path+keyfile, "single_json")
             # raise Exception("Keys not loaded")
 
+        if self.direct_keystream and self.output_format == "shard":
+            self._encrypt_shard(self.destin_path + keyfile.split('_')[0] + "_cipher.shard")
+            return
+        if self.direct_keystream:
+            ciphertexts = self._encrypt_direct()
+            with open(destination, 'w') as outfile:
+                json.dump(ciphertexts, outfile)
+            return
 
         for setting in self.keys:
             x = random.randint(0, 25)
@@ -178,3 +260,70 @@ class Encrypt:
         """ Saves the Ciphertexts and the selected metadata to disk"""
         with open(destination, 'w') as outfile:
             json.dump(ciphertexts, outfile)
+
+    def _direct_keystreams(self):
+        """
+        Computes the displacement values of all loaded keys at once by the keystream
+        engine, without generating plaintexts, enciphering or assembling messages.
+
+        Note that the keystream of encrypt() is reconstructed from the assembled
+        message, so its first 10 letters come from the indicator groups. Here the
+        keystream starts with the first letter enciphered at the Internal Message
+        Indicator, i.e. it equals letters 10 onwards of the reconstructed keystream.
+        :return: Lug count vectors, pin bit vectors, Internal Message Indicators and
+                 an (N, count_a) uint8 array of displacement values (0-25).
+        """
+        counts = np.array([lug_counts(setting[2]) for setting in self.keys])
+        bits = np.array([pin_bits(setting[1]) for setting in self.keys])
+
+        if self.int_msg_ind_preset:
+            int_msg_inds = [self.int_msg_ind] * len(self.keys)
+            int_positions = _int_msg_ind_positions(self.int_msg_ind)
+            if int_positions is None:
+                raise ValueError(f"invalid Internal Message Indicator {self.int_msg_ind!r}: "
+                                 f"it has no valid letter for every key wheel")
+            positions = [int_positions] * len(self.keys)
+        else:
+            int_msg_inds, positions = _create_indicators_direct(counts, bits)
+
+        keystreams = batch_keystream(counts, bits, positions, length=self.count_a) % 26
+        return counts, bits, int_msg_inds, keystreams
+
+    def _encrypt_direct(self):
+        """
+        Direct keystream mode of encrypt(), see _direct_keystreams(). Each record has the
+        same layout as in encrypt(), with an empty ciphertext field and a keystream of
+        count_a letters.
+        :return: List of records.
+        """
+        _, _, int_msg_inds, keystreams = self._direct_keystreams()
+        keystreams += ord('A')
+
+        ciphertexts = []
+        for setting, int_msg_ind, keystream in zip(self.keys, int_msg_inds, keystreams):
+            ciphertexts.append([setting[0], int_msg_ind, ""])
+
+            """ Appends the Keystream if needed """
+            if self.append_keystream:
+                ciphertexts[-1].append(keystream.tobytes().decode('ascii'))
+
+            """ Appends the Pin-Settings if needed """
+            if self.append_pins:
+                ciphertexts[-1].append(setting[1])
+
+            """ Appends the Lug-Settings if needed """
+            if self.append_lugs:
+                ciphertexts[-1].append(setting[2])
+
+        return ciphertexts
+
+    def _encrypt_shard(self, destination):
+        """
+        Direct keystream mode of encrypt() writing a binary shard, see shard.py.
+        The shard always holds the keystreams, pin targets and lug count vectors.
+        :param destination: Filename of the shard.
+        """
+        counts, bits, int_msg_inds, keystreams = self._direct_keystreams()
+        write_shard(destination, keystreams, bits, counts, int_msg_inds,
+                    [setting[0] for setting in self.keys],
+                    metadata={"keystream_offset": "int_msg_ind"})
@@ -0,0 +1,170 @@
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.converter import M209_ALPHABET_LIST
+from m209.data import KEY_WHEEL_DATA
+from m209.keylist.generate import KeyListGenError, generate_lugs
+from m209.keylist.pin_batch import generate_pin_matrix
+from m209.keystream import batch_keystream, lug_counts
+
+from _1_keygen_json import _lug_selection
+from _3_encrypt import CIPHER_TABLE, _int_msg_ind_positions
+from training_data import X_SCALE
+
+"""
+Infinite on-the-fly training data for notebook #4.
+
+Instead of generating keys, ciphertexts and .npy files on disk, random keys are
+drawn with the same rules as KeyGen.keygen_json_lugs() and generate_pin_matrix()
+and their keystreams are simulated in batches by the keystream engine. The
+batches are normalised like the data loaded by training_data.py, so every epoch
+can see fresh keys:
+
+    with KeystreamDataStream(batch_size=1000, input_size=200, y_columns=0) as stream:
+        model.fit(stream, steps_per_epoch=1000, epochs=10)
+
+The keystreams of the JSON ciphertexts of notebooks #2/#6 are reconstructed from
+the assembled message, so their first INDICATOR_LETTERS letters come from the
+indicator groups (System Indicator twice, External Message Indicator, key list
+indicator) and the keystream proper only starts after them. By default the
+stream reproduces this layout, so models see the same input distribution as
+with the .npy files of notebooks #3/#7. With indicator_letters=0 the records
+start at the Internal Message Indicator, like the direct keystream mode and the
+binary shards of Encrypt.
+"""
+
+# Number of indicator letters in front of the keystreams of Encrypt.encrypt():
+INDICATOR_LETTERS = 10
+
+
+def random_lugs(min_overlaps=None, max_overlaps=None):
+    """
+    Draws random lug settings the same way as KeyGen.keygen_json_lugs().
+    :param min_overlaps: Minimum number of overlaps, or None.
+    :param max_overlaps: Maximum number of overlaps, or None.
+    :return: The lug settings.
+    """
+    while True:
+        try:
+            return generate_lugs(lug_selection=_lug_selection(min_overlaps, max_overlaps),
+                                 max_attempts=10000)
+        except KeyListGenError:
+            continue
+
+
+def indicator_prefix(count, length=INDICATOR_LETTERS):
+    """
+    Simulates the first letters of the keystreams Encrypt.encrypt() reconstructs from an
+    assembled message of "A"s: the indicator groups of a random System Indicator, External
+    Message Indicator and key list indicator.
+    :param count: Number of records.
+    :param length: Number of letters, at most INDICATOR_LETTERS.
+    :return: (count, length) uint8 array of displacement values (0-25).
+    """
+    if not 0 <= length <= INDICATOR_LETTERS:
+        raise ValueError(f"length must be between 0 and {INDICATOR_LETTERS}")
+
+    prefix = np.empty((count, length), dtype=np.uint8)
+    for row in prefix:
+        sys_ind = random.choice(M209_ALPHABET_LIST)
+        ext_msg_ind = "".join(random.choice(letters) for letters, _ in KEY_WHEEL_DATA)
+        indicator = random.choice(M209_ALPHABET_LIST) + random.choice(M209_ALPHABET_LIST)
+        letters = (sys_ind * 2 + ext_msg_ind + indicator)[:length]
+        row[:] = [-CIPHER_TABLE.index(letter) % 26 for letter in letters]
+    return prefix
+
+
+def generate_batch(batch_size, input_size, min_overlaps=None, max_overlaps=None,
+                   int_msg_ind="AAAAAA", y_columns=None, indicator_letters=INDICATOR_LETTERS):
+    """
+    Draws batch_size random keys and simulates their keystreams.
+    :param batch_size: Number of records in the batch.
+    :param input_size: Number of keystream letters per record.
+    :param min_overlaps: Minimum number of overlaps, or None.
+    :param max_overlaps: Maximum number of overlaps, or None.
+    :param int_msg_ind: Internal Message Indicator the keystreams start at.
+    :param y_columns: Optional pin index or list of pin indices. All 131 pins if None.
+    :param indicator_letters: Number of indicator letters in front of the keystream, see
+                              indicator_prefix(). INDICATOR_LETTERS matches the JSON ciphertexts,
+                              0 the direct keystream mode of Encrypt.
+    :return: Tuple of float32 np.arrays x of shape (batch_size, input_size) and y.
+    """
+    positions = _int_msg_ind_positions(int_msg_ind)
+    if positions is None:
+        raise ValueError(f"invalid Internal Message Indicator {int_msg_ind!r}")
+    indicator_letters = min(indicator_letters, input_size)
+
+    counts = np.array([lug_counts(random_lugs(min_overlaps, max_overlaps)) for _ in range(batch_size)])
+    bits = generate_pin_matrix(batch_size, max_attempts=10000)
+
+    keystreams = np.empty((batch_size, input_size), dtype=np.uint8)
+    keystreams[:, :indicator_letters] = indicator_prefix(batch_size, indicator_letters)
+    keystreams[:, indicator_letters:] = batch_keystream(counts, bits, [positions] * batch_size,
+                                                        length=input_size - indicator_letters) % 26
+
+    x = np.divide(keystreams, X_SCALE, dtype=np.float32)
+    y = bits.astype(np.float32)
+    if y_columns is not None:
+        y = y[:, y_columns]
+    return x, y
+
+
+def _worker(queue, args):
+    """
+    Worker process: fills the queue with batches forever.
+    """
+    # Forked workers inherit the parent's random state; give each one its own.
+    random.seed()
+    while True:
+        queue.put(generate_batch(*args))
+
+
+class KeystreamDataStream:
+    """
+    An infinite iterator of (x, y) batches that are generated by worker processes
+    into a bounded queue. Use it as a context manager, or call close() when done.
+    """
+    def __init__(self, batch_size=1000, input_size=200, min_overlaps=None, max_overlaps=None,
+                 int_msg_ind="AAAAAA", y_columns=None, workers=None, queue_size=16,
+                 indicator_letters=INDICATOR_LETTERS):
+        """
+        :param workers: Number of worker processes. Defaults to the number of CPU cores.
+        :param queue_size: Maximum number of batches waiting in the queue.
+        The other parameters are as for generate_batch().
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        args = (batch_size, input_size, min_overlaps, max_overlaps, int_msg_ind, y_columns, indicator_letters)
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        self.processes = [multiprocessing.Process(target=_worker, args=(self.queue, args), daemon=True)
+                          for _ in range(workers)]
+        for process in self.processes:
+            process.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.queue.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
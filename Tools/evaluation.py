@@ -0,0 +1,126 @@
+import re
+
+import numpy as np
+
+"""
+Vectorized evaluation of pin models for notebook #8.
+
+The pin index of every model output is worked out once from the model filenames,
+the predictions of all models are stacked into one (N, M) array and scored
+against y[:, pin_index] with a single comparison. The per-file summaries keep
+their histograms, so tables and plots do not need to recompute anything.
+"""
+
+SINGLE_PIN_RE = re.compile(r'_pin_(\d+)\.')
+MULTI_PIN_RE = re.compile(r'_pins_(\d+)-(\d+)\.')
+TEST_FILE_RE = re.compile(r'non-shared-lugs(\d+)-overlaps(\d+)')
+
+# Bins of the two histograms of notebook #8:
+FINE_BINS = 53
+DECILE_BINS = np.arange(0, 110, 10)
+
+
+def pin_indices(filename):
+    """
+    :param filename: Filename of a model, either best_model_wheel_{w}_pin_{p}.h5 or
+                     best_model_wheel_{w}_pins_{first}-{last}.h5.
+    :return: List of the pin indices (0-130) of the model outputs.
+    """
+    match = MULTI_PIN_RE.search(filename)
+    if match:
+        first, last = map(int, match.groups())
+        return list(range(first, last + 1))
+    match = SINGLE_PIN_RE.search(filename)
+    if match:
+        return [int(match.group(1))]
+    raise ValueError(f"no pin index in model filename {filename}")
+
+
+def pin_index_array(filenames):
+    """
+    :param filenames: Filenames of the models, in model order.
+    :return: int array of the pin index of every model output, in the column order of
+             stack_predictions().
+    """
+    return np.array([pin for filename in filenames for pin in pin_indices(filename)], dtype=np.intp)
+
+
+def stack_predictions(x, model_lst, batch_size=1000):
+    """
+    Computes the rounded predictions of all models.
+    :param x: float32 array of shape (N, input_size).
+    :param model_lst: List of single or multi-output models.
+    :return: uint8 array of shape (N, M) where M is the total number of model outputs.
+    """
+    predictions = [model.predict(x, batch_size=batch_size).reshape(len(x), -1) for model in model_lst]
+    return np.concatenate(predictions, axis=1).round().astype(np.uint8)
+
+
+def count_correct_predictions(predictions, y, pin_index):
+    """
+    Counts the number of correct predictions per sample.
+    :param predictions: (N, M) array of rounded predictions, see stack_predictions().
+    :param y: (N, 131) array of pin targets.
+    :param pin_index: (M,) array of pin indices, see pin_index_array().
+    :return: int array of shape (N,).
+    """
+    return np.count_nonzero(predictions == y[:, pin_index], axis=1)
+
+
+def test_file_type(filename):
+    """
+    :param filename: Name of a test data file of notebook #7.
+    :return: Tuple of the number of non-shared lugs and overlaps, or (0, 0).
+    """
+    match = TEST_FILE_RE.search(filename)
+    if match:
+        return tuple(map(int, match.groups()))
+    return 0, 0
+
+
+class AccuracySummary:
+    """
+    Accuracy statistics of one set of test samples.
+    """
+    def __init__(self, correct_counts, num_outputs, non_shared=None, overlaps=None):
+        """
+        :param correct_counts: Number of correct predictions per sample.
+        :param num_outputs: Number of model outputs each sample was scored on.
+        """
+        self.non_shared = non_shared
+        self.overlaps = overlaps
+        self.accuracies = np.asarray(correct_counts) / num_outputs * 100
+        self.mean = float(np.mean(self.accuracies))
+        self.median = float(np.median(self.accuracies))
+        self.fine_counts, self.fine_edges = np.histogram(self.accuracies, bins=FINE_BINS)
+        self.decile_counts, self.decile_edges = np.histogram(self.accuracies, bins=DECILE_BINS)
+
+    def decile_percentages(self):
+        """
+        :return: List of (low, high, percentage of samples) for every 10% accuracy range.
+        """
+        total = self.decile_counts.sum()
+        return [(self.decile_edges[i], self.decile_edges[i + 1], self.decile_counts[i] / total * 100)
+                for i in range(len(self.decile_counts))]
+
+
+def evaluate(x, y, model_lst, pin_index, non_shared=None, overlaps=None):
+    """
+    Scores all models on one set of test samples.
+    :return: AccuracySummary of the samples.
+    """
+    predictions = stack_predictions(x, model_lst)
+    correct_counts = count_correct_predictions(predictions, y, pin_index)
+    return AccuracySummary(correct_counts, len(pin_index), non_shared, overlaps)
+
+
+def accuracy_table(summaries):
+    """
+    :param summaries: List of AccuracySummary objects.
+    :return: The "Overlaps | Non-Shared Lugs | Mean Accuracy | Median Accuracy" table of
+             notebook #8 as a string.
+    """
+    lines = ["Overlaps | Non-Shared Lugs | Mean Accuracy | Median Accuracy", "-" * 50]
+    for s in summaries:
+        lines.append(f"{s.overlaps} | {s.non_shared} | {s.mean:.2f}% | {s.median:.2f}%")
+    return "\n".join(lines)
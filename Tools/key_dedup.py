@@ -0,0 +1,120 @@
+import sys
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.keylist.key_index import KeyIndex, key_hash, lug_hash, pin_hash
+
+from key_writer import iter_keys, iter_tar_keys
+
+"""
+Duplicate and train/test leakage checks for key files.
+
+Every record of a key file is reduced to the 64 bit hash of its canonical form
+(see m209.keylist.key_index), so keys that only differ by swapped bars are found
+as well. The hashes of the training keys are kept in a sorted KeyIndex, and each
+test key is looked up in O(log n):
+
+    train = index_key_files(training_pin_files, "pins")
+    train.save("train_pins.npy")
+    leaks = find_leaks(train, test_pin_files, "pins")
+
+Key files inside tar archives are best indexed with index_key_archives(), which
+reads every archive only once.
+
+The kind of a key file is one of:
+
+    "key"   records [index, pin_list, lugs, letter_check] as loaded by Encrypt, or
+            dicts with "pin_list" and "lugs" as written by KeyGen.keygen_json()
+    "pins"  pin lists, as written by KeyGen.keygen_json_pins()
+    "lugs"  lug settings, as written by KeyGen.keygen_json_lugs()
+"""
+
+
+def record_hash(record, kind):
+    """
+    :param record: A record of a key file.
+    :param kind: "key", "pins" or "lugs".
+    :return: The 64 bit hash of the canonical form of the record.
+    """
+    if kind == "key":
+        if isinstance(record, dict):
+            return key_hash(record["lugs"], record["pin_list"])
+        return key_hash(record[2], record[1])
+    if kind == "pins":
+        return pin_hash(record)
+    if kind == "lugs":
+        return lug_hash(record)
+    raise Exception(f"unknown kind of key file {kind}")
+
+
+def file_hashes(source, kind):
+    """
+    :param source: Name of a key file, or a key_writer.TarMember.
+    :param kind: "key", "pins" or "lugs".
+    :return: uint64 array of the record hashes, in record order.
+    """
+    return np.fromiter((record_hash(record, kind) for record in iter_keys(source)), dtype=np.uint64)
+
+
+def index_key_files(sources, kind, index=None):
+    """
+    Adds the records of key files to an index.
+    :param sources: Names of key files, or key_writer.TarMember sources.
+    :param kind: "key", "pins" or "lugs".
+    :param index: KeyIndex to add to. A new one if None.
+    :return: The KeyIndex.
+    """
+    if index is None:
+        index = KeyIndex()
+    for source in sources:
+        index.update(file_hashes(source, kind))
+    return index
+
+
+def index_key_archives(archives, kind, index=None):
+    """
+    Adds the records of all key files inside tar archives to an index, reading every archive once.
+    :param archives: Names of tar archives, compressed or not.
+    :param kind: "key", "pins" or "lugs".
+    :param index: KeyIndex to add to. A new one if None.
+    :return: The KeyIndex.
+    """
+    if index is None:
+        index = KeyIndex()
+    for archive in archives:
+        for _, records in iter_tar_keys(archive):
+            index.update(record_hash(record, kind) for record in records)
+    return index
+
+
+def find_duplicates(sources, kind):
+    """
+    Finds records that are equivalent to an earlier record of the same or an earlier file.
+    :param sources: Names of key files, or key_writer.TarMember sources.
+    :param kind: "key", "pins" or "lugs".
+    :return: List of (source, record number) tuples of the duplicates.
+    """
+    index = KeyIndex()
+    duplicates = []
+    for source in sources:
+        for i, h in enumerate(file_hashes(source, kind)):
+            if not index.add(h):
+                duplicates.append((source, i))
+    return duplicates
+
+
+def find_leaks(index, sources, kind):
+    """
+    Finds the records of key files that are in an index, e.g. test keys that are also training keys.
+    :param index: KeyIndex, e.g. of the training keys.
+    :param sources: Names of key files, or key_writer.TarMember sources.
+    :param kind: "key", "pins" or "lugs".
+    :return: List of (source, record number) tuples of the records found in the index.
+    """
+    leaks = []
+    for source in sources:
+        found = index.contains(file_hashes(source, kind))
+        leaks += [(source, int(i)) for i in np.flatnonzero(found)]
+    return leaks
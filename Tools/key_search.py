@@ -0,0 +1,276 @@
+import functools
+import math
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.keystream import LUG_TYPES, LUG_TYPE_INDEX, TOTAL_PINS, lug_counts
+from m209.keylist.pin_batch import pin_lists
+from m209.lug_recovery import lug_key_list, recover_counts
+from m209.scoring import DISPLACEMENT_ERRORS, KeystreamScore
+
+from _5_flip_bar_lugs import LUG_SETTING_NEIGHBOURS
+
+"""
+Known-plaintext recovery of the full key: pins and lugs.
+
+The ANNs of notebook #4 predict the pins. search() starts from these predictions
+and from the lug settings m209.lug_recovery derives from them, and runs
+simulated annealing over pins and lugs, scoring each candidate key against the
+known keystream. A key is a lug count vector (the
+number of bars of each entry of m209.keystream.LUG_TYPES, so bars that only
+differ by order are one candidate) and a pin bit vector. The moves are:
+
+    * flip one pin, preferring the pins the ANNs are least sure about
+    * move one lug of a bar to a neighbouring position, see LUG_SETTING_NEIGHBOURS
+
+Candidates are scored by their aggregate displacement error: the sum over all
+letters of the distance between the simulated drum count and the nearest count
+congruent to the known one modulo 26. Unlike the number of matching letters it
+also rewards counts that are only off by one, so it changes smoothly when a lug
+is moved. Every move is evaluated incrementally by m209.scoring.KeystreamScore
+before it is accepted, without simulating the key again.
+
+solve() runs independent restarts on a process pool and stops as soon as one of
+them reproduces the whole keystream:
+
+    probabilities = pin_probabilities(x, model_lst, pin_index)
+    result = solve(keystream, probabilities, restarts=64)
+    print(result.matches, result.length, result.lugs, result.pin_list, result.elapsed)
+
+The keystream is given as the letters of the x data (chr(65 + count % 26)) or as
+drum counts, starting at the key wheel setting key_wheels. Only the count modulo
+26 is known from a plaintext, so that is what is matched.
+"""
+
+DEFAULT_ITERATIONS = 200_000
+DEFAULT_RESTARTS = 32
+LUG_MOVE_RATE = 0.3
+RANDOM_LUG_RATE = 0.1
+T_START = 2.0
+T_END = 0.05
+
+
+def _lug_type(setting):
+    """
+    :param setting: Lug setting of a bar like "1-0", "0-6" or "2-5".
+    :return: Index of the setting in LUG_TYPES.
+    """
+    m, n = (int(x) for x in setting.split('-'))
+    if m and n:
+        return LUG_TYPE_INDEX[(m - 1, n - 1)]
+    return LUG_TYPE_INDEX[(max(m, n) - 1, )]
+
+
+# LUG_TYPE_NEIGHBOURS[t] lists the lug types a bar of type t can be moved to:
+LUG_TYPE_NEIGHBOURS = [sorted({_lug_type(neighbour)
+                               for setting, neighbours in LUG_SETTING_NEIGHBOURS.items()
+                               if _lug_type(setting) == t
+                               for neighbour in neighbours} - {t})
+                       for t in range(len(LUG_TYPES))]
+
+
+def keystream_residues(keystream):
+    """
+    :param keystream: String of keystream letters (chr(65 + count % 26)) or sequence of drum counts.
+    :return: int array of the drum counts modulo 26.
+    """
+    if isinstance(keystream, str):
+        return (np.frombuffer(keystream.encode('ascii'), dtype=np.uint8).astype(np.intp) - 65) % 26
+    return np.asarray(keystream, dtype=np.intp) % 26
+
+
+def pin_probabilities(x, model_lst, pin_index, batch_size=1000):
+    """
+    Collects the pin probabilities predicted by the models for one keystream.
+    :param x: float32 array of shape (input_size,) or (1, input_size), as loaded by training_data.py.
+    :param model_lst: List of single or multi-output models.
+    :param pin_index: (M,) array of the pin indices of the model outputs, see evaluation.pin_index_array().
+    :return: float array of TOTAL_PINS probabilities; 0.5 for pins without a model.
+    """
+    x = np.asarray(x, dtype=np.float32).reshape(1, -1)
+    predictions = np.concatenate([model.predict(x, batch_size=batch_size).reshape(-1) for model in model_lst])
+    probabilities = np.full(TOTAL_PINS, 0.5)
+    probabilities[pin_index] = predictions
+    return probabilities
+
+
+class SearchResult:
+    """
+    The best key found by one or more restarts.
+    """
+    __slots__ = ['score', 'matches', 'length', 'counts', 'bits', 'restart', 'iterations', 'elapsed']
+
+    def __init__(self, score, matches, length, counts, bits, restart, iterations, elapsed=None):
+        """
+        :param score: Score of the key, minus its aggregate displacement error.
+        :param matches: Number of keystream letters the key reproduces.
+        :param length: Length of the keystream.
+        :param counts: Lug count vector of the key.
+        :param bits: Pin bit vector of the key.
+        :param restart: Number of the restart that found the key.
+        :param iterations: Number of iterations that restart ran.
+        :param elapsed: Wall-clock seconds of solve(), or None.
+        """
+        self.score = score
+        self.matches = matches
+        self.length = length
+        self.counts = counts
+        self.bits = bits
+        self.restart = restart
+        self.iterations = iterations
+        self.elapsed = elapsed
+
+    @property
+    def solved(self):
+        return self.score == 0
+
+    @property
+    def lugs(self):
+        """
+        :return: The lug settings in key list format, as accepted by Drum.from_key_list().
+        """
+        return lug_key_list(self.counts)
+
+    @property
+    def pin_list(self):
+        """
+        :return: The pins as a list of 6 strings of effective pins.
+        """
+        return pin_lists(self.bits[None, :])[0]
+
+
+def search(keystream, probabilities=None, iterations=DEFAULT_ITERATIONS, seed=None, key_wheels='AAAAAA',
+           t_start=T_START, t_end=T_END, restart=0, start_lugs=None):
+    """
+    One simulated annealing run. With t_start=0 it is plain hill climbing.
+    :param keystream: Keystream letters or drum counts, see keystream_residues().
+    :param probabilities: Array of TOTAL_PINS predicted pin probabilities, or None for no prediction.
+    :param iterations: Number of moves to try.
+    :param seed: Seed or numpy SeedSequence of the run.
+    :param key_wheels: Six letter key wheel setting at the first keystream letter.
+    :param t_start: Start temperature, in units of the displacement error.
+    :param t_end: Final temperature; the temperature falls geometrically.
+    :param restart: Number of the run, recorded in the result. Run 0 starts from the rounded
+                    probabilities, the other runs draw the start pins from them.
+    :param start_lugs: Optional lug settings (see m209.keystream.make_drum()) to start from. By
+                       default the lug counts are recovered from the keystream and the start pins
+                       (run 0: the probabilities), see m209.lug_recovery.
+    :return: SearchResult of the best key found.
+    """
+    rng = np.random.default_rng(seed)
+    residues = keystream_residues(keystream)
+
+    if probabilities is None:
+        probabilities = np.full(TOTAL_PINS, 0.5)
+    probabilities = np.clip(np.asarray(probabilities, dtype=np.float64), 0, 1)
+    if restart == 0:
+        bits = probabilities >= 0.5
+    else:
+        bits = rng.random(TOTAL_PINS) < probabilities
+    if start_lugs is not None:
+        counts = lug_counts(start_lugs)
+    else:
+        counts = recover_counts(residues, probabilities if restart == 0 else bits, key_wheels)
+
+    score = KeystreamScore(residues, counts, bits, key_wheels, DISPLACEMENT_ERRORS)
+    best = _result(score, restart, 0)
+
+    # Pins the ANNs are unsure about are flipped more often
+    weights = 1.05 - np.abs(2 * probabilities - 1)
+    pin_cdf = np.cumsum(weights / weights.sum())
+
+    temperatures = t_start * (t_end / t_start) ** (np.arange(iterations) / max(iterations - 1, 1)) \
+        if t_start > 0 else np.zeros(iterations)
+    draws = rng.random((iterations, 4))
+
+    done = 0
+    for kind, choice, jump, accept in draws:
+        if best.solved:
+            break
+        done += 1
+
+        if kind < LUG_MOVE_RATE:
+            # Pick a bar at random and move one of its lugs
+            bars = np.cumsum(score.counts)
+            source = int(np.searchsorted(bars, choice * bars[-1], side='right'))
+            neighbours = LUG_TYPE_NEIGHBOURS[source]
+            if jump < RANDOM_LUG_RATE or not neighbours:
+                target = int(rng.integers(len(LUG_TYPES) - 1))
+                target += target >= source
+            else:
+                target = neighbours[int(rng.integers(len(neighbours)))]
+            delta = score.error - score.lug_move_error(source, target)
+        else:
+            pin = min(int(np.searchsorted(pin_cdf, choice, side='right')), TOTAL_PINS - 1)
+            delta = score.error - score.pin_flip_error(pin)
+
+        temperature = temperatures[done - 1]
+        if delta >= 0 or (temperature > 0 and accept < math.exp(delta / temperature)):
+            if kind < LUG_MOVE_RATE:
+                score.move_lug(source, target)
+            else:
+                score.flip_pin(pin)
+            if -score.error > best.score:
+                best = _result(score, restart, done)
+
+    best.iterations = done
+    return best
+
+
+def _result(score, restart, iterations):
+    """
+    :return: SearchResult with a copy of the key of a KeystreamScore.
+    """
+    return SearchResult(-score.error, score.matches(), len(score.residues), score.counts.copy(), score.bits.copy(),
+                        restart, iterations)
+
+
+def _search_restart(keystream, probabilities, iterations, key_wheels, t_start, t_end, task):
+    restart, seed = task
+    return search(keystream, probabilities, iterations, seed, key_wheels, t_start, t_end, restart)
+
+
+def solve(keystream, probabilities=None, restarts=DEFAULT_RESTARTS, iterations=DEFAULT_ITERATIONS, seed=None,
+          key_wheels='AAAAAA', t_start=T_START, t_end=T_END, processes=None, log=None):
+    """
+    Runs independent restarts of search() on a process pool until one reproduces the whole keystream.
+    :param restarts: Number of restarts.
+    :param seed: Master seed; the restarts use children of numpy.random.SeedSequence(seed).
+    :param processes: Number of worker processes. Defaults to the number of CPU cores. With 1, the
+                      restarts run in the current process.
+    :param log: Optional function called with the result of every restart.
+    The other parameters are as for search().
+    :return: SearchResult of the best key, with the wall-clock time in elapsed.
+    """
+    start = time.perf_counter()
+    tasks = list(enumerate(np.random.SeedSequence(seed).spawn(restarts)))
+    worker = functools.partial(_search_restart, keystream, probabilities, iterations, key_wheels, t_start, t_end)
+
+    best = None
+    if processes == 1:
+        results = map(worker, tasks)
+        best = _best_result(results, log)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            # Leaving the pool terminates the restarts still running
+            best = _best_result(pool.imap_unordered(worker, tasks), log)
+
+    best.elapsed = time.perf_counter() - start
+    return best
+
+
+def _best_result(results, log):
+    best = None
+    for result in results:
+        if log is not None:
+            log(result)
+        if best is None or result.score > best.score:
+            best = result
+        if best.solved:
+            break
+    return best
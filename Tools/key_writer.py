@@ -0,0 +1,224 @@
+import codecs
+import json
+import os
+import tarfile
+
+"""
+Streaming writer and reader for key files.
+
+KeyWriter writes key records to a file as they are generated instead of
+collecting the whole file in memory first. The format is chosen by the file
+suffix:
+
+    .jsonl  JSON Lines, one record per line. A killed writer leaves all flushed
+            records readable, read_keys() skips a truncated last line. With
+            resume=True, a writer appends to the complete records of an existing
+            file, so an interrupted run can be continued.
+    other   a JSON list, as written by json.dump(). The list is streamed too, but
+            only a closed file can be read.
+
+The file is flushed every flush_every records, so memory use is bounded by one
+batch of records and partial progress reaches the disk. If the block of a with
+statement raises, a JSON Lines file is flushed and kept for resuming, while a
+JSON list, which could not be read anyway, is deleted.
+
+Key files can also be read straight out of a (compressed) tar archive such as
+overlaps_1-12.tar.gz: tar_members() lists the key files of an archive as
+TarMember sources, which iter_keys() and read_keys() accept in place of a
+filename. The member is decompressed as a stream, nothing is extracted to disk.
+A compressed archive cannot be seeked in, so every TarMember read decompresses
+the archive from the start up to the member. To read many members, walk the
+archive once with iter_tar_keys() instead:
+
+    for name, records in iter_tar_keys("overlaps_1-12.tar.gz"):
+        ...
+"""
+
+FLUSH_EVERY = 1000
+JSONL_SUFFIX = ".jsonl"
+
+
+class KeyWriter:
+    """
+    Writes key records to a JSON or JSON Lines file. Use it as a context manager, or
+    call close() when done.
+    """
+    def __init__(self, filename, flush_every=FLUSH_EVERY, resume=False):
+        """
+        :param filename: Name of the key file. A .jsonl suffix selects JSON Lines.
+        :param flush_every: Number of records between flushes.
+        :param resume: If True and filename is an existing JSON Lines file, its complete records
+                       are kept, a truncated last line is removed, and new records are appended.
+                       count starts at the number of records kept. Otherwise the file is replaced.
+        """
+        self.filename = filename
+        self.flush_every = flush_every
+        self.jsonl = filename.endswith(JSONL_SUFFIX)
+        self.count = 0
+        if resume and self.jsonl and os.path.exists(filename):
+            self.count, size = _complete_lines(filename)
+            os.truncate(filename, size)
+            self.outfile = open(filename, 'a')
+        else:
+            self.outfile = open(filename, 'w')
+        if not self.jsonl:
+            self.outfile.write('[')
+
+    def write(self, record):
+        """
+        Writes one JSON serialisable record.
+        """
+        if self.jsonl:
+            self.outfile.write(json.dumps(record) + '\n')
+        else:
+            self.outfile.write((', ' if self.count else '') + json.dumps(record))
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.outfile.flush()
+
+    def write_all(self, records):
+        """
+        Writes all records of an iterable.
+        """
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        """
+        Completes and closes the file.
+        """
+        if self.outfile.closed:
+            return
+        if not self.jsonl:
+            self.outfile.write(']')
+        self.outfile.close()
+
+    def abort(self):
+        """
+        Stops writing an incomplete file. A JSON Lines file is flushed and closed, so its
+        records can be read or resumed; a JSON list is closed and deleted.
+        """
+        if not self.outfile.closed:
+            self.outfile.close()
+        if not self.jsonl and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def _complete_lines(filename):
+    """
+    :return: Tuple of the number of complete lines of a file and their total size in bytes.
+    """
+    count = 0
+    size = 0
+    with open(filename, 'rb') as infile:
+        for line in infile:
+            if not line.endswith(b'\n'):
+                break
+            count += 1
+            size += len(line)
+    return count, size
+
+
+class TarMember:
+    """
+    A key file inside a tar archive, read without extracting it.
+    """
+    def __init__(self, archive, name):
+        """
+        :param archive: Name of the tar archive, compressed or not (.tar, .tar.gz, ...).
+        :param name: Name of the key file inside the archive.
+        """
+        self.archive = archive
+        self.name = name
+
+    def __repr__(self):
+        return f"TarMember({self.archive!r}, {self.name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, TarMember) and (self.archive, self.name) == (other.archive, other.name)
+
+    def __hash__(self):
+        return hash((self.archive, self.name))
+
+
+def tar_members(archive, suffixes=(".json", JSONL_SUFFIX)):
+    """
+    Lists the key files of a tar archive without extracting it.
+    :param archive: Name of the tar archive, compressed or not.
+    :param suffixes: Suffixes of the members that are key files.
+    :return: List of TarMember sources, sorted by name.
+    """
+    with tarfile.open(archive, 'r|*') as tar:
+        names = [info.name for info in tar if info.isfile() and info.name.endswith(suffixes)]
+    return [TarMember(archive, name) for name in sorted(names)]
+
+
+def _iter_records(infile, jsonl):
+    if not jsonl:
+        yield from json.load(infile)
+        return
+
+    for line in infile:
+        if not line.endswith('\n'):
+            # The writer was stopped in the middle of this record
+            break
+        yield json.loads(line)
+
+
+def _iter_tar_member(source):
+    # Stream mode reads the archive front to back and stops at the member,
+    # so a compressed archive is never decompressed to disk or seeked in.
+    with tarfile.open(source.archive, 'r|*') as tar:
+        for info in tar:
+            if info.name == source.name and info.isfile():
+                infile = codecs.getreader('utf-8')(tar.extractfile(info))
+                yield from _iter_records(infile, source.name.endswith(JSONL_SUFFIX))
+                return
+    raise Exception(f"{source.name} not found in {source.archive}")
+
+
+def iter_tar_keys(archive, suffixes=(".json", JSONL_SUFFIX)):
+    """
+    Reads all key files of a tar archive in one pass, without extracting it.
+    :param archive: Name of the tar archive, compressed or not.
+    :param suffixes: Suffixes of the members that are key files.
+    :return: Iterator of (name, records) tuples in archive order; records is the list of the
+             records of the member, see read_keys().
+    """
+    with tarfile.open(archive, 'r|*') as tar:
+        for info in tar:
+            if info.isfile() and info.name.endswith(suffixes):
+                infile = codecs.getreader('utf-8')(tar.extractfile(info))
+                yield info.name, list(_iter_records(infile, info.name.endswith(JSONL_SUFFIX)))
+
+
+def iter_keys(source):
+    """
+    Iterates over the records of a key file written by KeyWriter or json.dump().
+    :param source: Name of the key file, or a TarMember to read it from a tar archive.
+    :return: Iterator of records. For JSON Lines files a truncated last line is skipped.
+    """
+    if isinstance(source, TarMember):
+        yield from _iter_tar_member(source)
+        return
+
+    with open(source, 'r') as infile:
+        yield from _iter_records(infile, source.endswith(JSONL_SUFFIX))
+
+
+def read_keys(source):
+    """
+    :param source: Name of the key file, or a TarMember.
+    :return: List of the records of a key file, see iter_keys().
+    """
+    return list(iter_keys(source))
+
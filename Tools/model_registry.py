@@ -0,0 +1,208 @@
+import json
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from evaluation import pin_indices
+
+"""
+Registry of the trained pin models for notebook #8.
+
+The models are indexed by (sequence length, wheel, pin) without loading them,
+either from the models_seq_{N}/best_model_wheel_* filenames below the models
+directory or from a MANIFEST file in it. Models are only loaded when they are
+requested and are then kept in an LRU cache whose size is limited by a memory
+budget, so switching between the 52/104/200 model sets of an evaluation sweep
+does not reload files that are still cached:
+
+    registry = ModelRegistry(PATH_MODELS_PARENT)
+    model_lst, pin_index = registry.load(52)
+
+The memory use of a model is estimated by the size of its file.
+"""
+
+MANIFEST = "manifest.json"
+SEQ_DIR_RE = re.compile(r'^models_seq_(\d+)$')
+WHEEL_RE = re.compile(r'_wheel_(\d+)_')
+
+DEFAULT_MEMORY_BUDGET = 4 * 1024 ** 3
+
+
+def _load_keras_model(filename):
+    from tensorflow import keras
+    return keras.models.load_model(filename)
+
+
+class ModelRecord:
+    """
+    The index entry of one model file.
+    """
+    __slots__ = ['seq_length', 'wheel', 'pins', 'filename', 'nbytes']
+
+    def __init__(self, seq_length, wheel, pins, filename, nbytes):
+        """
+        :param seq_length: Input sequence length of the model.
+        :param wheel: Wheel number 0-5.
+        :param pins: List of the pin indices (0-130) of the model outputs.
+        :param filename: Path of the model file.
+        :param nbytes: Estimated memory use of the loaded model.
+        """
+        self.seq_length = seq_length
+        self.wheel = wheel
+        self.pins = pins
+        self.filename = filename
+        self.nbytes = nbytes
+
+    def __repr__(self):
+        return f"ModelRecord({self.seq_length}, {self.wheel}, {self.pins}, {self.filename!r})"
+
+
+class ModelRegistry:
+    """
+    Index of the models below a directory with lazy loading and an LRU cache of loaded
+    models.
+    """
+    def __init__(self, path, memory_budget=DEFAULT_MEMORY_BUDGET, loader=_load_keras_model):
+        """
+        :param path: Directory with a MANIFEST file or models_seq_{N} subdirectories.
+        :param memory_budget: Maximum estimated memory use of the cached models in bytes.
+                              The most recently used model is always kept.
+        :param loader: Function that loads a model from a filename.
+        """
+        self.path = path
+        self.memory_budget = memory_budget
+        self.loader = loader
+        self.records = {}
+        self.cache = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.scan()
+
+    def scan(self):
+        """
+        (Re)builds the index from the manifest or the filenames. Cached models are kept.
+        """
+        manifest = os.path.join(self.path, MANIFEST)
+        if os.path.exists(manifest):
+            entries = self._read_manifest(manifest)
+        else:
+            entries = self._scan_directories()
+
+        self.records = {}
+        for seq_length, wheel, pins, filename in entries:
+            record = ModelRecord(seq_length, wheel, pins, filename, os.path.getsize(filename))
+            for pin in pins:
+                key = (seq_length, wheel, pin)
+                if key in self.records:
+                    raise Exception(f"pin {key} is predicted by {self.records[key].filename} and {filename}")
+                self.records[key] = record
+
+    def _read_manifest(self, manifest):
+        """
+        Reads a manifest with a list of {"file", "seq_length", "wheel", "pins"} entries,
+        where file is relative to the manifest.
+        """
+        with open(manifest, 'r') as infile:
+            entries = json.load(infile)
+        return [(entry["seq_length"], entry["wheel"], list(entry["pins"]), os.path.join(self.path, entry["file"]))
+                for entry in entries]
+
+    def _scan_directories(self):
+        """
+        Indexes the best_model_wheel_* files of the models_seq_{N} subdirectories.
+        """
+        entries = []
+        for directory in sorted(os.listdir(self.path)):
+            match = SEQ_DIR_RE.match(directory)
+            if not match:
+                continue
+            seq_length = int(match.group(1))
+            for file in sorted(os.listdir(os.path.join(self.path, directory))):
+                if 'best' not in file:
+                    continue
+                wheel = WHEEL_RE.search(file)
+                if not wheel:
+                    raise ValueError(f"no wheel number in model filename {file}")
+                entries.append((seq_length, int(wheel.group(1)), pin_indices(file),
+                                os.path.join(self.path, directory, file)))
+        return entries
+
+    def seq_lengths(self):
+        """
+        :return: Sorted list of the sequence lengths with models.
+        """
+        return sorted({seq_length for seq_length, _, _ in self.records})
+
+    def find(self, seq_length, wheel=None):
+        """
+        :param seq_length: Input sequence length.
+        :param wheel: Optional wheel number 0-5.
+        :return: List of the ModelRecords for the sequence length, ordered by their first pin.
+        """
+        records = {id(record): record for (length, w, _), record in self.records.items()
+                   if length == seq_length and (wheel is None or w == wheel)}
+        return sorted(records.values(), key=lambda record: record.pins[0])
+
+    def record(self, seq_length, wheel, pin):
+        """
+        :return: The ModelRecord of the model that predicts the pin.
+        """
+        return self.records[(seq_length, wheel, pin)]
+
+    def get(self, record):
+        """
+        Returns the loaded model of a record, loading it if it is not cached.
+        :param record: A ModelRecord.
+        :return: The model.
+        """
+        entry = self.cache.get(record.filename)
+        if entry is not None:
+            self.cache.move_to_end(record.filename)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        model = self.loader(record.filename)
+        self.cache[record.filename] = (model, record.nbytes)
+        self.nbytes += record.nbytes
+        self._evict()
+        return model
+
+    def model(self, seq_length, wheel, pin):
+        """
+        :return: The loaded model that predicts the pin.
+        """
+        return self.get(self.record(seq_length, wheel, pin))
+
+    def load(self, seq_length, wheel=None):
+        """
+        Loads all models for a sequence length, e.g. for evaluation.stack_predictions().
+        :param seq_length: Input sequence length.
+        :param wheel: Optional wheel number 0-5.
+        :return: List of models and the int array of the pin index of every model output,
+                 see evaluation.pin_index_array().
+        """
+        records = self.find(seq_length, wheel)
+        if not records:
+            raise Exception(f"no models for sequence length {seq_length} in {self.path}")
+        model_lst = [self.get(record) for record in records]
+        pin_index = np.array([pin for record in records for pin in record.pins], dtype=np.intp)
+        return model_lst, pin_index
+
+    def _evict(self):
+        """
+        Drops the least recently used models until the cache fits into the memory budget.
+        """
+        while self.nbytes > self.memory_budget and len(self.cache) > 1:
+            _, (_, nbytes) = self.cache.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def clear(self):
+        """
+        Drops all cached models.
+        """
+        self.cache.clear()
+        self.nbytes = 0
@@ -0,0 +1,454 @@
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tarfile
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.keystream import WHEEL_OFFSETS, WHEEL_SIZES
+
+from seeded_keygen import HASHES_SUFFIX, META_SUFFIX, shard_filename
+
+"""
+Resumable pipeline runner for the data build of notebooks #1-#8.
+
+A pipeline is a list of stages. Every stage processes a list of shards (e.g. key
+files or wheels) and declares the input and output files of each shard. A state
+file records the SHA-256 checksums of the inputs and outputs of every shard that
+completed, and a fingerprint of the parameters of the stage: the arguments its
+functools.partial run function is bound to, such as the seed or the sequence
+length. When the pipeline is run again, a shard is skipped if all of its
+outputs still exist and match their checksums, its inputs are unchanged and
+the stage parameters are the same, so an interrupted build resumes where it
+stopped and a changed input or parameter only redoes what depends on it. The shards of a stage run on a process pool, and the state
+file is updated after every completed shard.
+
+Checksums are cached in the state file by file size and modification time, so
+unchanged files are not read again.
+
+archive_directory() replaces the `tar -zcvf` and `rm -r -f` steps of the
+notebooks that build the overlap and pin archives.
+
+data_pipeline() sets up the stages keygen, encrypt, npy, train and test:
+
+    pipeline = data_pipeline(PATH_DATA, num_shards=20, keys_per_shard=100_000, seed=209)
+    pipeline.run()
+"""
+
+STATE_FILE = "pipeline_state.json"
+CHUNK_SIZE = 1 << 20
+
+
+def file_checksum(filename):
+    """
+    :return: The SHA-256 hex digest of a file.
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _plain(obj):
+    """
+    Converts ranges and NumPy arrays and scalars for run_fingerprint(). Any other type json
+    cannot serialise raises TypeError, as its repr may be shortened or hold an address.
+    """
+    if isinstance(obj, range):
+        return list(obj)
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"stage parameter of type {type(obj).__name__} cannot be fingerprinted")
+
+
+def run_fingerprint(run):
+    """
+    :param run: Run function of a stage, usually a functools.partial. The bound arguments must be
+                JSON serialisable, ranges or NumPy arrays.
+    :return: SHA-256 hex digest of the name of the function and the arguments it is bound to.
+    """
+    bound = []
+    while isinstance(run, functools.partial):
+        bound.append([run.args, run.keywords])
+        run = run.func
+    name = f"{run.__module__}.{run.__qualname__}"
+    data = json.dumps([name, bound], sort_keys=True, default=_plain)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _file_key(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def archive_directory(directory, archive=None, remove=True):
+    """
+    Packs a directory into a gzip compressed tar archive. The archive is written under a temporary
+    name and renamed when complete, and the directory is only removed after that, so an interrupted
+    call can be repeated. If the directory is gone but the archive exists, nothing is done.
+    :param directory: Directory to pack. The archive members are named relative to its parent.
+    :param archive: Name of the archive. Defaults to directory + ".tar.gz".
+    :param remove: If True, the directory is removed once the archive is complete.
+    :return: Name of the archive.
+    """
+    directory = directory.rstrip('/' + os.sep)
+    if archive is None:
+        archive = directory + ".tar.gz"
+    if not os.path.isdir(directory):
+        if os.path.exists(archive):
+            return archive
+        raise Exception(f"{directory} not found")
+
+    temp = archive + ".tmp"
+    with tarfile.open(temp, 'w:gz') as tar:
+        tar.add(directory, arcname=os.path.basename(directory))
+    os.replace(temp, archive)
+    if remove:
+        shutil.rmtree(directory)
+    return archive
+
+
+class Stage:
+    """
+    One step of a pipeline.
+    """
+    def __init__(self, name, run, shards, inputs, outputs, processes=None, params=None):
+        """
+        :param name: Name of the stage.
+        :param run: Picklable function run(shard) that writes the outputs of a shard. The stage
+                    parameters should be bound to it with functools.partial, see run_fingerprint().
+        :param shards: List of the shards of the stage.
+        :param inputs: Function inputs(shard) returning the list of input files of a shard.
+        :param outputs: Function outputs(shard) returning the list of output files of a shard.
+        :param processes: Number of worker processes, or None for the pipeline default.
+                          With 1, the shards run in the current process.
+        :param params: Optional JSON serialisable parameters of the stage. Defaults to the
+                       fingerprint of run. A shard is run again when they change.
+        """
+        self.name = name
+        self.run = run
+        self.shards = list(shards)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.processes = processes
+        self.params = params if params is not None else run_fingerprint(run)
+
+
+def _run_shard(task):
+    """
+    Worker: runs one shard and returns the checksums of its outputs.
+    """
+    name, run, shard, outputs = task
+    run(shard)
+    missing = [filename for filename in outputs if not os.path.exists(filename)]
+    if missing:
+        raise Exception(f"stage {name} shard {shard} did not write {missing}")
+    return shard, {filename: (_file_key(filename), file_checksum(filename)) for filename in outputs}
+
+
+class Pipeline:
+    """
+    Runs stages in order and skips the shards whose outputs are up to date.
+    """
+    def __init__(self, state_file, processes=None):
+        """
+        :param state_file: Name of the JSON file the progress is recorded in.
+        :param processes: Default number of worker processes. Defaults to the number of CPU cores.
+        """
+        self.state_file = state_file
+        self.processes = processes
+        self.stages = []
+        self.state = {"files": {}, "stages": {}}
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as infile:
+                self.state = json.load(infile)
+
+    def add(self, stage):
+        """
+        Appends a stage.
+        """
+        self.stages.append(stage)
+        return stage
+
+    def _save_state(self):
+        """
+        Writes the state file atomically, so a crash cannot leave it half written.
+        """
+        temp = self.state_file + ".tmp"
+        with open(temp, 'w') as outfile:
+            json.dump(self.state, outfile)
+        os.replace(temp, self.state_file)
+
+    def checksum(self, filename):
+        """
+        :return: The checksum of a file, from the cache if its size and modification time are unchanged.
+        """
+        key = _file_key(filename)
+        cached = self.state["files"].get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        checksum = file_checksum(filename)
+        self.state["files"][filename] = [key, checksum]
+        return checksum
+
+    def is_done(self, stage, shard):
+        """
+        :return: True if the outputs of the shard exist, match their checksums and were made
+                 from the current inputs with the current stage parameters.
+        """
+        record = self.state["stages"].get(stage.name, {}).get(str(shard))
+        if record is None or record.get("params") != stage.params:
+            return False
+
+        outputs = stage.outputs(shard)
+        if sorted(outputs) != sorted(record["outputs"]):
+            return False
+        for filename in outputs:
+            if not os.path.exists(filename) or self.checksum(filename) != record["outputs"][filename]:
+                return False
+
+        inputs = stage.inputs(shard)
+        if sorted(inputs) != sorted(record["inputs"]):
+            return False
+        for filename in inputs:
+            if not os.path.exists(filename) or self.checksum(filename) != record["inputs"][filename]:
+                return False
+        return True
+
+    def run_stage(self, stage, log=print):
+        """
+        Runs the shards of a stage that are not up to date.
+        :return: Tuple of the number of shards run and skipped.
+        """
+        todo = [shard for shard in stage.shards if not self.is_done(stage, shard)]
+        skipped = len(stage.shards) - len(todo)
+        log(f"{stage.name}: {len(todo)} to run, {skipped} up to date")
+        if not todo:
+            self._save_state()
+            return 0, skipped
+
+        input_checksums = {}
+        for shard in todo:
+            missing = [filename for filename in stage.inputs(shard) if not os.path.exists(filename)]
+            if missing:
+                raise Exception(f"stage {stage.name} shard {shard} is missing inputs {missing}")
+            input_checksums[shard] = {filename: self.checksum(filename) for filename in stage.inputs(shard)}
+
+        records = self.state["stages"].setdefault(stage.name, {})
+        tasks = [(stage.name, stage.run, shard, stage.outputs(shard)) for shard in todo]
+        processes = stage.processes if stage.processes is not None else self.processes
+
+        def record(result):
+            shard, outputs = result
+            for filename, (key, checksum) in outputs.items():
+                self.state["files"][filename] = [list(key), checksum]
+            records[str(shard)] = {"params": stage.params,
+                                   "inputs": input_checksums[shard],
+                                   "outputs": {filename: checksum for filename, (_, checksum) in outputs.items()}}
+            self._save_state()
+            log(f"{stage.name}: shard {shard} done")
+
+        if processes == 1:
+            for task in tasks:
+                record(_run_shard(task))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for result in pool.imap_unordered(_run_shard, tasks):
+                    record(result)
+
+        return len(todo), skipped
+
+    def run(self, stages=None, log=print):
+        """
+        Runs the stages in order.
+        :param stages: Optional list of stage names to run. All stages if None.
+        :return: Dict of stage name to the tuple of shards run and skipped.
+        """
+        results = {}
+        for stage in self.stages:
+            if stages is None or stage.name in stages:
+                results[stage.name] = self.run_stage(stage, log)
+        return results
+
+
+class DataPaths:
+    """
+    File names of the data build of data_pipeline().
+    """
+    def __init__(self, data_dir, num_shards, seq_length, input_size):
+        self.root = os.path.join(data_dir, "pipeline")
+        self.keys_dir = os.path.join(self.root, "1_keys")
+        self.cipher_dir = os.path.join(self.root, "2_ciphertexts")
+        self.npy_dir = os.path.join(self.root, "3_data_npy")
+        self.models_dir = os.path.join(self.root, "models")
+        self.model_dir = os.path.join(self.models_dir, f"models_seq_{input_size}")
+        self.result_file = os.path.join(self.root, f"test_results_seq_{input_size}.json")
+        self.num_shards = num_shards
+        self.seq_length = seq_length
+
+    def makedirs(self):
+        for directory in (self.keys_dir, self.cipher_dir, self.npy_dir, self.model_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def number(self, shard):
+        return str(shard).zfill(len(str(self.num_shards - 1)))
+
+    def keyfile(self, shard):
+        return os.path.join(self.keys_dir, shard_filename(shard, self.num_shards))
+
+    def cipher(self, shard):
+        return os.path.join(self.cipher_dir, f"{self.number(shard)}_cipher.json")
+
+    def x(self, shard):
+        return os.path.join(self.npy_dir, f"{self.number(shard)}_x_{self.seq_length}_.npy")
+
+    def y(self, shard):
+        return os.path.join(self.npy_dir, f"{self.number(shard)}_y_ALL_.npy")
+
+    def npy_files(self, shards):
+        """
+        :return: List of (x_file, y_file) tuples relative to npy_dir, see training_data.py.
+        """
+        return [(os.path.basename(self.x(shard)), os.path.basename(self.y(shard))) for shard in shards]
+
+    def npy_paths(self, shards):
+        return [os.path.join(self.npy_dir, f) for pair in self.npy_files(shards) for f in pair]
+
+    def model(self, wheel):
+        # As resnet.multi_output_filename(), without importing TensorFlow:
+        first = WHEEL_OFFSETS[wheel]
+        last = first + WHEEL_SIZES[wheel] - 1
+        return os.path.join(self.model_dir, f"best_model_wheel_{wheel}_pins_{first}-{last}.h5")
+
+
+def _keygen(keys_dir, seed, count, num_shards, min_overlaps, max_overlaps, lug_index_file, shard):
+    from seeded_keygen import write_key_shard
+    lug_index = None
+    if lug_index_file is not None:
+        from m209.keylist.lug_index import LugIndex
+        lug_index = LugIndex.load(lug_index_file)
+    write_key_shard(keys_dir, seed, shard, count, num_shards, min_overlaps, max_overlaps, lug_index)
+
+
+def _encrypt(keys_dir, cipher_dir, seq_length, num_shards, shard):
+    from _3_encrypt import Encrypt
+    m209 = Encrypt(destin_path=cipher_dir + '/', count_a=seq_length,
+                   append_ciphertext=False,
+                   append_plaintext=False,
+                   append_keystream=True,
+                   append_lugs=True,
+                   append_pins=True,
+                   direct_keystream=True)
+    keyfile = shard_filename(shard, num_shards)
+    m209.load_keys(os.path.join(keys_dir, keyfile), filetype="single_json")
+    m209.set_int_msg_ind("AAAAAA")
+    m209.encrypt(keyfile)
+
+
+def _npy(data_dir, num_shards, seq_length, input_size, shard):
+    from training_data import cipher_to_npy
+    paths = DataPaths(data_dir, num_shards, seq_length, input_size)
+    cipher_to_npy(paths.cipher(shard), paths.x(shard), paths.y(shard), seq_length)
+
+
+def _train(npy_dir, model_dir, input_size, train_files, records_per_file, epochs, wheel):
+    from resnet import clear_session, train_multi_output, wheel_pins
+    from training_data import load_partial_data
+    pins = list(wheel_pins(wheel))
+    x, y = load_partial_data(npy_dir, train_files, input_size, records_per_file, y_columns=pins)
+    train_multi_output(x, y, pins, model_dir, wheel, epochs=epochs)
+    clear_session()
+
+
+def _test(npy_dir, models_dir, input_size, test_files, records_per_file, result_file, shard):
+    from evaluation import evaluate
+    from model_registry import ModelRegistry
+    from training_data import load_partial_data
+    model_lst, pin_index = ModelRegistry(models_dir).load(input_size)
+    x, y = load_partial_data(npy_dir, test_files, input_size, records_per_file)
+    summary = evaluate(x, y, model_lst, pin_index)
+    with open(result_file, 'w') as outfile:
+        json.dump({"input_size": input_size,
+                   "mean": summary.mean,
+                   "median": summary.median,
+                   "deciles": [[float(low), float(high), float(percentage)]
+                               for low, high, percentage in summary.decile_percentages()]}, outfile)
+
+
+def data_pipeline(data_dir, num_shards, keys_per_shard, seed, seq_length=500, input_size=200, test_shards=1,
+                  min_overlaps=None, max_overlaps=None, lug_index_file=None, records_per_file=100_000,
+                  epochs=10, processes=None):
+    """
+    Sets up the stages of the data build below data_dir/pipeline:
+
+        keygen   1_keys/NN_keys.json           seeded key shards, see seeded_keygen.py
+        encrypt  2_ciphertexts/NN_cipher.json  direct keystreams at "AAAAAA", see Encrypt
+        npy      3_data_npy/NN_x_/NN_y_ files  as in notebook #3
+        train    models/models_seq_{input_size}/  one multi-output model per wheel, see resnet.py
+        test     test_results_seq_{input_size}.json  evaluated on the last test_shards shards
+
+    :param data_dir: The Data directory.
+    :param num_shards: Number of key shards.
+    :param keys_per_shard: Number of keys per shard.
+    :param seed: Master seed of the key generation.
+    :param seq_length: Keystream length of the ciphertexts and .npy files.
+    :param input_size: Input size of the models.
+    :param test_shards: Number of shards held out for the test stage.
+    :param lug_index_file: Optional LugIndex file to draw the lug settings from.
+    :param processes: Number of worker processes of the data stages. Train and test run
+                      in the current process.
+    :return: The Pipeline.
+    """
+    paths = DataPaths(data_dir, num_shards, seq_length, input_size)
+    paths.makedirs()
+
+    shards = range(num_shards)
+    train_shards = shards[:num_shards - test_shards]
+    test_shards = shards[num_shards - test_shards:]
+    train_files = paths.npy_files(train_shards)
+    test_files = paths.npy_files(test_shards)
+
+    pipeline = Pipeline(os.path.join(paths.root, STATE_FILE), processes)
+    pipeline.add(Stage(
+        "keygen",
+        functools.partial(_keygen, paths.keys_dir, seed, keys_per_shard, num_shards, min_overlaps, max_overlaps,
+                          lug_index_file),
+        shards,
+        inputs=lambda shard: [lug_index_file] if lug_index_file is not None else [],
+        outputs=lambda shard: [paths.keyfile(shard), paths.keyfile(shard) + META_SUFFIX,
+                               paths.keyfile(shard) + HASHES_SUFFIX]))
+    pipeline.add(Stage(
+        "encrypt",
+        functools.partial(_encrypt, paths.keys_dir, paths.cipher_dir, seq_length, num_shards),
+        shards,
+        inputs=lambda shard: [paths.keyfile(shard)],
+        outputs=lambda shard: [paths.cipher(shard)]))
+    pipeline.add(Stage(
+        "npy",
+        functools.partial(_npy, data_dir, num_shards, seq_length, input_size),
+        shards,
+        inputs=lambda shard: [paths.cipher(shard)],
+        outputs=lambda shard: [paths.x(shard), paths.y(shard)]))
+    pipeline.add(Stage(
+        "train",
+        functools.partial(_train, paths.npy_dir, paths.model_dir, input_size, train_files, records_per_file, epochs),
+        range(6),
+        inputs=lambda wheel: paths.npy_paths(train_shards),
+        outputs=lambda wheel: [paths.model(wheel)],
+        processes=1))
+    pipeline.add(Stage(
+        "test",
+        functools.partial(_test, paths.npy_dir, paths.models_dir, input_size, test_files, records_per_file,
+                          paths.result_file),
+        [input_size],
+        inputs=lambda shard: [paths.model(wheel) for wheel in range(6)] + paths.npy_paths(test_shards),
+        outputs=lambda shard: [paths.result_file],
+        processes=1))
+    return pipeline
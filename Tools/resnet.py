@@ -0,0 +1,124 @@
+import gc
+
+import numpy as np
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+from tensorflow.keras import layers, models, callbacks, optimizers
+from tensorflow.keras.regularizers import l2
+
+"""
+ResNet models of notebook #4 and a shared-backbone training mode.
+
+Notebook #4 trains one single-output model per pin. train_multi_output() instead
+trains one model whose sigmoid head has an output for every pin of a wheel (or
+for any other set of pins, e.g. all 131), so the data is loaded once per wheel and
+all pins of the wheel are predicted by a single forward pass.
+
+Multi-output models are saved as best_model_wheel_{wheel}_pins_{first}-{last}.h5,
+where first and last are the pin indices (0-130) of the first and last output.
+"""
+
+PINWHEEL_SIZES = [26, 25, 23, 21, 19, 17]
+
+# Index of the first pin of each wheel in the 131 pin targets, plus the total:
+CUMULATIVE_SIZES = np.cumsum([0] + PINWHEEL_SIZES)
+
+
+def wheel_pins(wheel):
+    """
+    :param wheel: Wheel number 0-5.
+    :return: range of the pin indices (0-130) of the wheel.
+    """
+    return range(CUMULATIVE_SIZES[wheel], CUMULATIVE_SIZES[wheel + 1])
+
+
+def multi_output_filename(wheel, pins):
+    """
+    :param wheel: Wheel number 0-5.
+    :param pins: Consecutive pin indices of the model outputs.
+    :return: Filename of a multi-output model.
+    """
+    return f"best_model_wheel_{wheel}_pins_{pins[0]}-{pins[-1]}.h5"
+
+
+def make_resnet(input_length, num_filters=32, num_outputs=1, d1=512, d2=512, ks=5, depth=5, reg_param=0.0002,
+                final_activation='sigmoid'):
+    """
+    The ResNet-like architecture of notebook #4.
+    """
+    inp = layers.Input(shape=(input_length, 1))
+
+    # First convolutional layer
+    conv0 = layers.Conv1D(num_filters, kernel_size=1, padding='same', kernel_regularizer=l2(reg_param))(inp)
+    conv0 = layers.BatchNormalization()(conv0)
+    conv0 = layers.Activation('relu')(conv0)
+
+    # Residual blocks
+    shortcut = conv0
+    for i in range(depth):
+        conv1 = layers.Conv1D(num_filters, kernel_size=ks, padding='same', kernel_regularizer=l2(reg_param))(shortcut)
+        conv1 = layers.BatchNormalization()(conv1)
+        conv1 = layers.Activation('relu')(conv1)
+        conv2 = layers.Conv1D(num_filters, kernel_size=ks, padding='same', kernel_regularizer=l2(reg_param))(conv1)
+        conv2 = layers.BatchNormalization()(conv2)
+        conv2 = layers.Activation('relu')(conv2)
+        shortcut = layers.Add()([shortcut, conv2])
+
+    # Output layers
+    flat1 = layers.Flatten()(shortcut)
+    dense1 = layers.Dense(d1, kernel_regularizer=l2(reg_param))(flat1)
+    dense1 = layers.BatchNormalization()(dense1)
+    dense1 = layers.Activation('relu')(dense1)
+    dense2 = layers.Dense(d2, kernel_regularizer=l2(reg_param))(dense1)
+    dense2 = layers.BatchNormalization()(dense2)
+    dense2 = layers.Activation('relu')(dense2)
+    out = layers.Dense(num_outputs, activation=final_activation, kernel_regularizer=l2(reg_param))(dense2)
+
+    model = models.Model(inputs=inp, outputs=out)
+    return model
+
+
+def predict_pins(model, x, batch_size=1000):
+    """
+    Predicts all outputs of a model in one forward pass.
+    :param model: A single or multi-output model.
+    :param x: float32 array of shape (N, input_length).
+    :return: float32 array of pin probabilities of shape (N, num_outputs).
+    """
+    return model.predict(x, batch_size=batch_size).reshape(len(x), -1)
+
+
+def train_multi_output(x, y, pins, model_path, wheel, num_filters=32, depth=5, batch_size=1000, epochs=10):
+    """
+    Trains one shared-backbone model for several pins.
+    :param x: float32 array of shape (N, input_length), see training_data.py.
+    :param y: float32 array of shape (N, len(pins)) of the targets of the pins.
+    :param pins: Consecutive pin indices (0-130) of the outputs, e.g. wheel_pins(wheel)
+                 or range(131).
+    :param model_path: Directory the best model is saved to, see multi_output_filename().
+    :param wheel: Wheel number used in the filename.
+    :return: The trained model and a float array of the test accuracy of every pin.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=17)
+
+    model = make_resnet(x.shape[1], num_filters=num_filters, depth=depth, num_outputs=len(pins))
+    model.compile(optimizer=optimizers.Adam(), loss='binary_crossentropy', metrics=['binary_accuracy'])
+
+    checkpoint_cb = callbacks.ModelCheckpoint(model_path + '/' + multi_output_filename(wheel, pins),
+                                              save_best_only=True)
+    lr_scheduler_cb = callbacks.LearningRateScheduler(lambda epoch: 1e-3 * 0.95 ** epoch)
+
+    model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, validation_split=0.2,
+              callbacks=[checkpoint_cb, lr_scheduler_cb])
+
+    predictions = predict_pins(model, X_test, batch_size=batch_size).round()
+    accuracies = np.mean(predictions == y_test, axis=0)
+    return model, accuracies
+
+
+def clear_session():
+    """
+    Clears the TensorFlow session and collects garbage to free memory.
+    """
+    tf.keras.backend.clear_session()
+    gc.collect()
@@ -0,0 +1,200 @@
+import functools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.keylist.generate import KeyListGenError, generate_letter_check, generate_lugs
+from m209.keylist.key_index import KeyIndex, key_hash
+from m209.keylist.pin_batch import generate_pin_matrix, pin_lists
+
+from _1_keygen_json import _lug_selection
+from key_writer import KeyWriter
+
+"""
+Deterministic, seedable key generation for notebook #1.
+
+Every key file (shard) is generated from a master seed and its shard number.
+The random number generators of a shard are derived with
+numpy.random.SeedSequence: SeedSequence(seed, spawn_key=(shard,)) is the same
+as the shard-th child of SeedSequence(seed).spawn(), so every shard has its own
+independent random streams, no matter which process generates it or in which
+order. The seed is recorded in a metadata file next to each shard, so any single
+shard can be regenerated on demand instead of archiving all key files.
+
+A shard holds records [index, pin_list, lugs, letter_check] like the keys of
+Encrypt.load_keys(..., "single_json"). Keys that are equivalent to an earlier key
+of the shard, or to a key of an optional exclude index (e.g. the test keys), are
+rejected and replaced, see m209.keylist.key_index. Without rejections a shard is
+the same as without the check, and with them it is still reproducible as long as
+the same exclude index is given.
+"""
+
+KEYS_SUFFIX = "_keys.json"
+META_SUFFIX = ".meta.json"
+HASHES_SUFFIX = ".hashes.npy"
+INDEX_FILE = "key_index.npy"
+
+
+def shard_seed_sequence(seed, shard):
+    """
+    :param seed: Master seed, a non-negative int.
+    :param shard: Shard number.
+    :return: The SeedSequence of the shard.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(shard,))
+
+
+def shard_rngs(seed, shard):
+    """
+    Derives the random number generators of a shard.
+    :param seed: Master seed, a non-negative int.
+    :param shard: Shard number.
+    :return: Tuple of a random.Random for the lug settings and a numpy Generator for the pins.
+    """
+    lug_sequence, pin_sequence = shard_seed_sequence(seed, shard).spawn(2)
+    lug_seed = int.from_bytes(lug_sequence.generate_state(4, dtype=np.uint64).tobytes(), 'little')
+    return random.Random(lug_seed), np.random.default_rng(pin_sequence)
+
+
+def generate_keys(seed, shard, count, min_overlaps=None, max_overlaps=None, lug_index=None, exclude=None,
+                  seen=None):
+    """
+    Generates the keys of a shard, one record at a time.
+    :param seed: Master seed, a non-negative int.
+    :param shard: Shard number.
+    :param count: Number of keys.
+    :param min_overlaps: Minimum number of overlaps, or None.
+    :param max_overlaps: Maximum number of overlaps, or None.
+    :param lug_index: Optional m209.keylist.lug_index.LugIndex to draw the lug settings from.
+    :param exclude: Optional m209.keylist.key_index.KeyIndex of key hashes that must not be generated.
+    :param seen: Optional empty KeyIndex that receives the hashes of the generated keys.
+    :return: Generator of [index, pin_list, lugs, letter_check] records.
+    """
+    lug_rng, pin_rng = shard_rngs(seed, shard)
+    if seen is None:
+        seen = KeyIndex()
+
+    i = 0
+    while i < count:
+        # Generate the missing keys; more than one round only if keys were rejected
+        lugs = []
+        while len(lugs) < count - i:
+            selection = _lug_selection(min_overlaps, max_overlaps, lug_rng)
+            try:
+                if lug_index is not None:
+                    lugs.append(lug_index.draw(selection, rng=lug_rng))
+                else:
+                    lugs.append(generate_lugs(lug_selection=selection, max_attempts=10000, rng=lug_rng))
+            except KeyListGenError:
+                continue
+
+        pins = pin_lists(generate_pin_matrix(len(lugs), rng=pin_rng, max_attempts=10000))
+
+        for pin_list, lug in zip(pins, lugs):
+            h = key_hash(lug, pin_list)
+            if (exclude is not None and h in exclude) or not seen.add(h):
+                continue
+            yield [i, pin_list, lug, generate_letter_check(lug, pin_list)]
+            i += 1
+
+
+def shard_filename(shard, num_shards):
+    """
+    :return: Filename of a shard, numbered like the key files of notebook #1.
+    """
+    return str(shard).zfill(len(str(num_shards - 1))) + KEYS_SUFFIX
+
+
+def write_key_shard(path, seed, shard, count, num_shards, min_overlaps=None, max_overlaps=None, lug_index=None,
+                    exclude=None):
+    """
+    Generates a shard and writes it with its metadata file and the sorted key hashes of the shard.
+    :param path: Directory of the shards.
+    :param num_shards: Total number of shards, used for the filename.
+    The other parameters are as for generate_keys().
+    :return: Filename of the shard.
+    """
+    filename = os.path.join(path, shard_filename(shard, num_shards))
+
+    metadata = {
+        "seed": seed,
+        "shard": shard,
+        "num_shards": num_shards,
+        "count": count,
+        "min_overlaps": min_overlaps,
+        "max_overlaps": max_overlaps,
+        "lug_index": lug_index is not None,
+        "exclude": exclude is not None,
+    }
+
+    seen = KeyIndex()
+    with KeyWriter(filename) as writer:
+        writer.write_all(generate_keys(seed, shard, count, min_overlaps, max_overlaps, lug_index, exclude, seen))
+    seen.save(filename + HASHES_SUFFIX)
+    with open(filename + META_SUFFIX, 'w') as outfile:
+        json.dump(metadata, outfile)
+
+    return filename
+
+
+def write_key_shards(path, seed, num_shards, count, processes=None, min_overlaps=None, max_overlaps=None,
+                     lug_index=None, exclude=None):
+    """
+    Generates and writes shards 0 to num_shards-1 in parallel. The key hashes of all shards are
+    merged into the index file INDEX_FILE in path, which can be passed as exclude index to a later
+    key generation or used for a leakage check, see key_dedup.py.
+    :param seed: Master seed, or None to draw a fresh one from the OS.
+    :param processes: Number of worker processes. Defaults to the number of CPU cores.
+    The other parameters are as for write_key_shard().
+    :return: The master seed and the list of shard filenames.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    worker = functools.partial(write_key_shard, path, seed, count=count, num_shards=num_shards,
+                               min_overlaps=min_overlaps, max_overlaps=max_overlaps, lug_index=lug_index,
+                               exclude=exclude)
+    with multiprocessing.Pool(processes) as pool:
+        filenames = pool.map(worker, range(num_shards))
+
+    # The shards are generated in parallel, so keys shared by two shards can only be found here
+    index = KeyIndex()
+    duplicates = sum(index.update(np.load(filename + HASHES_SUFFIX)) for filename in filenames)
+    index.save(os.path.join(path, INDEX_FILE))
+    if duplicates:
+        warnings.warn(f"{duplicates} keys occur in more than one shard")
+
+    return seed, filenames
+
+
+def read_metadata(filename):
+    """
+    :param filename: Filename of a shard.
+    :return: The metadata of the shard as a dict.
+    """
+    with open(filename + META_SUFFIX, 'r') as infile:
+        return json.load(infile)
+
+
+def regenerate_shard(filename, lug_index=None, exclude=None):
+    """
+    Regenerates the keys of a shard from its metadata, e.g. after the shard file was deleted.
+    :param filename: Filename of the shard. Only its metadata file has to exist.
+    :param lug_index: The LugIndex, if the shard was generated with one.
+    :param exclude: The exclude KeyIndex, if the shard was generated with one.
+    :return: List of [index, pin_list, lugs, letter_check] records.
+    """
+    metadata = read_metadata(filename)
+    if metadata["lug_index"] and lug_index is None:
+        raise Exception(f"{filename} was generated with a lug index")
+    if metadata.get("exclude") and exclude is None:
+        raise Exception(f"{filename} was generated with an exclude index")
+    return list(generate_keys(metadata["seed"], metadata["shard"], metadata["count"],
+                              metadata["min_overlaps"], metadata["max_overlaps"], lug_index, exclude))
@@ -0,0 +1,139 @@
+import json
+
+import numpy as np
+
+"""
+Binary shard format for keystream datasets.
+
+A shard holds the records of one key file as fixed-width arrays that can be
+opened with np.memmap without parsing:
+
+    keystream     (N, L) uint8  displacement values (0-25), one row per key
+    pins          (N, 17) uint8 the 131 pin targets packed with np.packbits,
+                                wheel by wheel in key wheel letter order
+    lugs          (N, 21) uint8 lug count vectors, see m209.keystream.LUG_TYPES
+    int_msg_ind   (N,) bytes    Internal Message Indicators
+    sn            (N,) bytes    serial numbers of the keys
+
+The file starts with the 8 byte MAGIC, a little-endian uint32 with the length of
+the JSON header and the header itself. The header records the number of
+records, the keystream length, the offset, dtype and shape of every section and
+any user metadata. Every section starts on an ALIGNMENT byte boundary.
+"""
+
+MAGIC = b"M209SHRD"
+VERSION = 1
+ALIGNMENT = 64
+WHEEL_PINS_COUNT = 131
+SECTIONS = ["keystream", "pins", "lugs", "int_msg_ind", "sn"]
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def pack_pins(pins):
+    """
+    Packs pin targets into bytes.
+    :param pins: (N, 131) array of 0/1 pin targets.
+    :return: (N, 17) uint8 array.
+    """
+    return np.packbits(np.asarray(pins, dtype=np.uint8), axis=1)
+
+
+def unpack_pins(packed):
+    """
+    Unpacks pin targets packed by pack_pins().
+    :param packed: (N, 17) uint8 array.
+    :return: (N, 131) uint8 array of 0/1 pin targets.
+    """
+    return np.unpackbits(packed, axis=1, count=WHEEL_PINS_COUNT)
+
+
+def write_shard(filename, keystream, pins, lugs, int_msg_ind, sn, metadata=None):
+    """
+    Writes a shard file.
+    :param filename: Name of the shard file.
+    :param keystream: (N, L) uint8 array of displacement values.
+    :param pins: (N, 131) array of 0/1 pin targets.
+    :param lugs: (N, 21) array of lug count vectors.
+    :param int_msg_ind: List of N Internal Message Indicators.
+    :param sn: List of N serial numbers.
+    :param metadata: Optional JSON serialisable dict stored in the header.
+    """
+    arrays = {
+        "keystream": np.ascontiguousarray(keystream, dtype=np.uint8),
+        "pins": pack_pins(pins),
+        "lugs": np.ascontiguousarray(lugs, dtype=np.uint8),
+        "int_msg_ind": np.array([str(i).encode('ascii') for i in int_msg_ind], dtype=bytes),
+        "sn": np.array([str(s).encode('ascii') for s in sn], dtype=bytes),
+    }
+    records = len(arrays["keystream"])
+    for name, array in arrays.items():
+        if len(array) != records:
+            raise Exception(f"shard section {name} has {len(array)} records, expected {records}")
+
+    # The header size depends on the offsets it contains, so lay out the sections
+    # until the header length stops changing.
+    header_size = 0
+    while True:
+        offset = _align(len(MAGIC) + 4 + header_size)
+        sections = {}
+        for name in SECTIONS:
+            array = arrays[name]
+            sections[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            "version": VERSION,
+            "records": records,
+            "keystream_length": arrays["keystream"].shape[1],
+            "sections": sections,
+            "metadata": metadata or {},
+        }).encode('utf-8')
+        if len(header) == header_size:
+            break
+        header_size = len(header)
+
+    with open(filename, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(np.uint32(len(header)).astype('<u4').tobytes())
+        outfile.write(header)
+        for name in SECTIONS:
+            outfile.seek(sections[name]["offset"])
+            outfile.write(arrays[name].tobytes())
+        outfile.truncate(offset)
+
+
+def read_header(filename):
+    """
+    Reads the JSON header of a shard file.
+    :param filename: Name of the shard file.
+    :return: The header as a dict.
+    """
+    with open(filename, 'rb') as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise Exception(f"{filename} is not a shard file")
+        size = int(np.frombuffer(infile.read(4), dtype='<u4')[0])
+        header = json.loads(infile.read(size).decode('utf-8'))
+    if header["version"] != VERSION:
+        raise Exception(f"{filename}: unsupported shard version {header['version']}")
+    return header
+
+
+def open_shard(filename, mode='r'):
+    """
+    Opens a shard file as memory maps.
+    :param filename: Name of the shard file.
+    :param mode: Memory map mode, see np.memmap.
+    :return: The header and a dict of np.memmap arrays, one for each section. The pins
+             section holds the packed pin targets, see unpack_pins().
+    """
+    header = read_header(filename)
+    arrays = {}
+    for name, section in header["sections"].items():
+        if section["shape"][0] == 0:
+            arrays[name] = np.zeros(section["shape"], dtype=section["dtype"])
+            continue
+        arrays[name] = np.memmap(filename, dtype=section["dtype"], mode=mode,
+                                 offset=section["offset"], shape=tuple(section["shape"]))
+    return header, arrays
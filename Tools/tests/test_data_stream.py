@@ -0,0 +1,75 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from _3_encrypt import CIPHER_TABLE, Encrypt
+from data_stream import INDICATOR_LETTERS, generate_batch, indicator_prefix
+from training_data import X_OFFSET, X_SCALE
+
+from m209.data import KEY_WHEEL_DATA
+from m209.keylist.generate import generate_key_list
+
+"""
+test_data_stream.py - Unit tests for the on-the-fly training data.
+"""
+
+# Displacement values each indicator letter can give, in order:
+PREFIX_VALUES = [set(range(26))] * 2 + \
+    [{-CIPHER_TABLE.index(letter) % 26 for letter in letters} for letters, _ in KEY_WHEEL_DATA] + \
+    [set(range(26))] * 2
+
+
+def _check_prefix(test, prefix):
+    """
+    Checks that every row of prefix is a possible run of indicator letters.
+    """
+    test.assertEqual(prefix.shape[1], INDICATOR_LETTERS)
+    test.assertEqual(prefix[:, 0].tolist(), prefix[:, 1].tolist())
+    for column, values in zip(prefix.T, PREFIX_VALUES):
+        test.assertTrue(set(column.tolist()) <= values)
+
+
+class DataStreamTestCase(unittest.TestCase):
+
+    def test_matches_json_ciphertexts(self):
+        random.seed(11)
+        keys = [generate_key_list('AA') for _ in range(20)]
+        with tempfile.TemporaryDirectory() as path:
+            m209 = Encrypt(destin_path=path + '/', count_a=40, append_keystream=True)
+            m209.keys = [[n, key.pin_list, key.lugs, key.letter_check] for n, key in enumerate(keys)]
+            m209.set_int_msg_ind("AAAAAA")
+            m209.encrypt("00_keys.json")
+            with open(os.path.join(path, "00_cipher.json")) as infile:
+                records = json.load(infile)
+
+            m209.direct_keystream = True
+            direct = m209._direct_keystreams()[3]
+
+        letters = np.array([[ord(c) - X_OFFSET for c in record[3]] for record in records])
+        _check_prefix(self, letters[:, :INDICATOR_LETTERS])
+        self.assertEqual(letters[:, INDICATOR_LETTERS:].tolist(),
+                         direct[:, :40 - INDICATOR_LETTERS].tolist())
+
+    def test_indicator_prefix(self):
+        random.seed(12)
+        _check_prefix(self, indicator_prefix(200))
+        self.assertEqual(indicator_prefix(5, 0).shape, (5, 0))
+        self.assertRaises(ValueError, indicator_prefix, 5, INDICATOR_LETTERS + 1)
+
+    def test_generate_batch(self):
+        random.seed(13)
+        x, y = generate_batch(8, 30, y_columns=[0, 5])
+        self.assertEqual((x.shape, y.shape), ((8, 30), (8, 2)))
+        self.assertEqual((x.dtype, y.dtype), (np.float32, np.float32))
+        _check_prefix(self, np.rint(x[:, :INDICATOR_LETTERS] * X_SCALE).astype(int))
+
+        x, _ = generate_batch(4, 5)
+        self.assertEqual(x.shape, (4, 5))
+        x, _ = generate_batch(4, 20, indicator_letters=0)
+        self.assertEqual(x.shape, (4, 20))
+
+        self.assertRaises(ValueError, generate_batch, 4, 20, int_msg_ind="ZZZZZZ")
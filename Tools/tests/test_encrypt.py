@@ -0,0 +1,30 @@
+import random
+import unittest
+
+from _3_encrypt import Encrypt
+
+from m209.keylist.generate import generate_key_list
+
+"""
+test_encrypt.py - Unit tests for the direct keystream mode of Encrypt.
+"""
+
+
+class DirectKeystreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        key_list = generate_key_list('AA', rng=random.Random(8))
+        self.m209 = Encrypt(count_a=20, direct_keystream=True)
+        self.m209.keys = [[0, key_list.pin_list, key_list.lugs, key_list.letter_check]]
+
+    def test_preset_indicator(self):
+        self.m209.set_int_msg_ind("AAAAAA")
+        _, _, int_msg_inds, keystreams = self.m209._direct_keystreams()
+        self.assertEqual(int_msg_inds, ["AAAAAA"])
+        self.assertEqual(keystreams.shape, (1, 20))
+
+    def test_invalid_preset_indicator(self):
+        # Z is only on the first two key wheels, so the indicator runs out of letters
+        self.m209.set_int_msg_ind("ZZZZZZ")
+        with self.assertRaisesRegex(ValueError, "ZZZZZZ"):
+            self.m209._direct_keystreams()
@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import numpy as np
+
+from key_search import keystream_residues, search, solve
+
+from m209.keylist.generate import generate_key_list
+from m209.keystream import keystream, lug_counts, pin_bits
+
+"""
+test_key_search.py - Unit tests for the full key search.
+"""
+
+LENGTH = 200
+WRONG_PINS = 6
+
+
+def _noisy_probabilities(bits, rng):
+    """
+    :return: Probabilities near the true pins, with WRONG_PINS of them on the wrong side of 0.5.
+    """
+    probabilities = np.where(bits, 0.8, 0.2)
+    wrong = rng.choice(len(bits), WRONG_PINS, replace=False)
+    probabilities[wrong] = np.where(bits[wrong], 0.4, 0.6)
+    return probabilities
+
+
+class KeySearchTestCase(unittest.TestCase):
+
+    def test_keystream_residues(self):
+        self.assertEqual(keystream_residues("AZB").tolist(), [0, 25, 1])
+        self.assertEqual(keystream_residues([0, 26, 27, 13]).tolist(), [0, 0, 1, 13])
+
+    def test_solve_noisy_pins(self):
+        for n in range(4):
+            key_list = generate_key_list('AA', rng=random.Random(n))
+            known = keystream(key_list.lugs, key_list.pin_list, 'AAAAAA', LENGTH)
+            probabilities = _noisy_probabilities(pin_bits(key_list.pin_list), np.random.default_rng(n))
+
+            result = solve(known, probabilities, restarts=4, iterations=50_000, seed=n, processes=1)
+            self.assertTrue(result.solved)
+            self.assertEqual(result.matches, LENGTH)
+            self.assertEqual(keystream(result.lugs, result.pin_list, 'AAAAAA', LENGTH).tolist(),
+                             known.tolist())
+
+    def test_search_start_lugs(self):
+        key_list = generate_key_list('AA', rng=random.Random(209))
+        bits = pin_bits(key_list.pin_list)
+        letters = "".join(chr(65 + count % 26) for count in
+                          keystream(key_list.lugs, key_list.pin_list, 'AAAAAA', LENGTH))
+
+        result = search(letters, bits, iterations=10, seed=0, start_lugs=key_list.lugs)
+        self.assertTrue(result.solved)
+        self.assertEqual(result.iterations, 0)
+        self.assertEqual(result.counts.tolist(), lug_counts(key_list.lugs).tolist())
+        self.assertEqual(result.bits.tolist(), bits.tolist())
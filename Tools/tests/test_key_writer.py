@@ -0,0 +1,102 @@
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+
+from key_writer import KeyWriter, iter_tar_keys, read_keys, tar_members
+
+"""
+test_key_writer.py - Unit tests for the streaming key file writer and reader.
+"""
+
+RECORDS = [{"pin_list": ["ABC", "", "D", "E", "F", "G"], "lugs": "1-0*27"}, [1, "x"], "key"]
+
+
+class KeyWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        for filename in ("keys.json", "keys.jsonl"):
+            filename = os.path.join(self.path, filename)
+            with KeyWriter(filename, flush_every=2) as writer:
+                writer.write_all(RECORDS)
+            self.assertEqual(writer.count, len(RECORDS))
+            self.assertEqual(read_keys(filename), RECORDS)
+
+        with open(os.path.join(self.path, "keys.json")) as infile:
+            self.assertEqual(json.load(infile), RECORDS)
+
+    def test_exception_keeps_jsonl(self):
+        filename = os.path.join(self.path, "keys.jsonl")
+        with self.assertRaises(KeyboardInterrupt):
+            with KeyWriter(filename, flush_every=100) as writer:
+                writer.write_all(RECORDS)
+                raise KeyboardInterrupt
+        self.assertTrue(writer.outfile.closed)
+        self.assertEqual(read_keys(filename), RECORDS)
+
+    def test_exception_removes_json_list(self):
+        filename = os.path.join(self.path, "keys.json")
+        with self.assertRaises(RuntimeError):
+            with KeyWriter(filename, flush_every=1) as writer:
+                writer.write_all(RECORDS)
+                raise RuntimeError("key generation failed")
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(writer.outfile.closed)
+
+    def test_resume(self):
+        filename = os.path.join(self.path, "keys.jsonl")
+        with KeyWriter(filename) as writer:
+            writer.write_all(RECORDS[:2])
+        with open(filename, 'a') as outfile:
+            outfile.write('{"pin_list": ["A"')
+
+        with KeyWriter(filename, resume=True) as writer:
+            self.assertEqual(writer.count, 2)
+            writer.write_all(RECORDS[2:])
+        self.assertEqual(writer.count, len(RECORDS))
+        self.assertEqual(read_keys(filename), RECORDS)
+
+        # Without resume, or for a missing file, the writer starts from scratch
+        with KeyWriter(filename) as writer:
+            writer.write(RECORDS[0])
+        self.assertEqual(read_keys(filename), RECORDS[:1])
+        with KeyWriter(os.path.join(self.path, "new.jsonl"), resume=True) as writer:
+            self.assertEqual(writer.count, 0)
+
+    def test_truncated_jsonl(self):
+        filename = os.path.join(self.path, "keys.jsonl")
+        with KeyWriter(filename) as writer:
+            writer.write_all(RECORDS)
+        with open(filename, 'a') as outfile:
+            outfile.write('{"pin_list": ["A"')
+        self.assertEqual(read_keys(filename), RECORDS)
+
+    def test_tar_archive(self):
+        names = ["b/keys.json", "a/keys.jsonl", "c/keys.json"]
+        for n, name in enumerate(names):
+            os.makedirs(os.path.join(self.path, os.path.dirname(name)), exist_ok=True)
+            with KeyWriter(os.path.join(self.path, name)) as writer:
+                writer.write_all(RECORDS[n:])
+        with open(os.path.join(self.path, "notes.txt"), 'w') as outfile:
+            outfile.write("not a key file")
+
+        archive = os.path.join(self.path, "keys.tar.gz")
+        with tarfile.open(archive, 'w:gz') as tar:
+            for name in names + ["notes.txt"]:
+                tar.add(os.path.join(self.path, name), arcname=name)
+
+        expected = [(name, RECORDS[n:]) for n, name in enumerate(names)]
+        self.assertEqual(list(iter_tar_keys(archive)), expected)
+
+        members = tar_members(archive)
+        self.assertEqual([member.name for member in members], sorted(names))
+        for member in members:
+            self.assertEqual(read_keys(member), dict(expected)[member.name])
@@ -0,0 +1,76 @@
+import os
+import random
+import tempfile
+import unittest
+
+from _1_keygen_json import KeyGen
+from key_writer import read_keys
+
+from m209.keylist.key_index import KeyIndex, key_hash, pin_hash
+
+"""
+test_keygen_json.py - Unit tests for KeyGen.
+"""
+
+
+class KeyGenTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.key_gen = KeyGen(count=20, path=self.temp_dir.name + os.sep)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_separate_indexes(self):
+        random.seed(5)
+        self.key_gen.key_index = KeyIndex()
+        self.key_gen.pin_index = KeyIndex()
+
+        self.key_gen.keygen_json("keys.jsonl")
+        self.key_gen.keygen_json_pins("pins.jsonl")
+        keys = read_keys(self.temp_dir.name + os.sep + "keys.jsonl")
+        pins = read_keys(self.temp_dir.name + os.sep + "pins.jsonl")
+
+        self.assertEqual((len(keys), len(pins)), (20, 20))
+        self.assertEqual((len(self.key_gen.key_index), len(self.key_gen.pin_index)), (20, 20))
+        for key in keys:
+            self.assertIn(key_hash(key["lugs"], key["pin_list"]), self.key_gen.key_index)
+        for pin_list in pins:
+            self.assertIn(pin_hash(pin_list), self.key_gen.pin_index)
+            self.assertNotIn(pin_hash(pin_list), self.key_gen.key_index)
+
+    def test_pin_index_rejects_known_pins(self):
+        random.seed(6)
+        self.key_gen.keygen_json_pins("pins.jsonl")
+        known = read_keys(self.temp_dir.name + os.sep + "pins.jsonl")
+
+        self.key_gen.pin_index = KeyIndex([pin_hash(pin_list) for pin_list in known])
+        self.key_gen.keygen_json_pins("more_pins.jsonl")
+        more = read_keys(self.temp_dir.name + os.sep + "more_pins.jsonl")
+        self.assertEqual(len(more), 20)
+        self.assertFalse({pin_hash(pin_list) for pin_list in known} & {pin_hash(pin_list) for pin_list in more})
+
+    def test_resume(self):
+        random.seed(7)
+        filename = self.temp_dir.name + os.sep + "keys.jsonl"
+        self.key_gen.count = 7
+        self.key_gen.keygen_json("keys.jsonl")
+        with open(filename, 'a') as outfile:
+            outfile.write('{"pin_list": ["ABC"')
+        first = read_keys(filename)
+
+        self.key_gen.count = 20
+        self.key_gen.resume = True
+        self.key_gen.key_index = KeyIndex()
+        self.key_gen.keygen_json("keys.jsonl")
+        keys = read_keys(filename)
+        self.assertEqual(len(keys), 20)
+        self.assertEqual(keys[:7], first)
+        self.assertEqual(len(self.key_gen.key_index), 20)
+
+        # A complete file is left as it is
+        self.key_gen.keygen_json_pins("pins.jsonl")
+        pins = read_keys(self.temp_dir.name + os.sep + "pins.jsonl")
+        self.key_gen.keygen_json_pins("pins.jsonl")
+        self.assertEqual(read_keys(self.temp_dir.name + os.sep + "pins.jsonl"), pins)
@@ -0,0 +1,164 @@
+import functools
+import os
+import tarfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from pipeline import Pipeline, Stage, archive_directory, data_pipeline, run_fingerprint
+
+"""
+test_pipeline.py - Unit tests for the resumable pipeline runner.
+"""
+
+SHARDS = range(3)
+
+
+def _scale(path, factor, shard):
+    with open(os.path.join(path, f"in_{shard}.txt")) as infile:
+        value = int(infile.read())
+    with open(os.path.join(path, f"scaled_{shard}.txt"), 'w') as outfile:
+        outfile.write(str(value * factor))
+    with open(os.path.join(path, "calls.txt"), 'a') as outfile:
+        outfile.write(f"scale {shard}\n")
+
+
+def _total(path, shard):
+    total = 0
+    for n in SHARDS:
+        with open(os.path.join(path, f"scaled_{n}.txt")) as infile:
+            total += int(infile.read())
+    with open(os.path.join(path, "total.txt"), 'w') as outfile:
+        outfile.write(str(total))
+    with open(os.path.join(path, "calls.txt"), 'a') as outfile:
+        outfile.write(f"total {shard}\n")
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+        for shard in SHARDS:
+            self.write_input(shard, shard + 1)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def write_input(self, shard, value):
+        with open(self.file(f"in_{shard}.txt"), 'w') as outfile:
+            outfile.write(str(value))
+
+    def run_pipeline(self, factor):
+        """
+        Runs a fresh pipeline on the state file and returns the calls of the run functions.
+        """
+        if os.path.exists(self.file("calls.txt")):
+            os.remove(self.file("calls.txt"))
+
+        pipeline = Pipeline(self.file("state.json"), processes=1)
+        pipeline.add(Stage("scale", functools.partial(_scale, self.path, factor), SHARDS,
+                           inputs=lambda shard: [self.file(f"in_{shard}.txt")],
+                           outputs=lambda shard: [self.file(f"scaled_{shard}.txt")]))
+        pipeline.add(Stage("total", functools.partial(_total, self.path), [0],
+                           inputs=lambda shard: [self.file(f"scaled_{n}.txt") for n in SHARDS],
+                           outputs=lambda shard: [self.file("total.txt")]))
+        pipeline.run(log=lambda message: None)
+
+        if not os.path.exists(self.file("calls.txt")):
+            return []
+        with open(self.file("calls.txt")) as infile:
+            return infile.read().split('\n')[:-1]
+
+    def total(self):
+        with open(self.file("total.txt")) as infile:
+            return int(infile.read())
+
+    def test_skip_and_resume(self):
+        all_calls = ["scale 0", "scale 1", "scale 2", "total 0"]
+        self.assertEqual(self.run_pipeline(2), all_calls)
+        self.assertEqual(self.total(), 12)
+
+        # Nothing changed
+        self.assertEqual(self.run_pipeline(2), [])
+
+        # A changed parameter redoes the stage, and the changed outputs redo the next one
+        self.assertEqual(self.run_pipeline(3), all_calls)
+        self.assertEqual(self.total(), 18)
+
+        # A changed input only redoes its shard and what depends on it
+        self.write_input(1, 10)
+        self.assertEqual(self.run_pipeline(3), ["scale 1", "total 0"])
+        self.assertEqual(self.total(), 42)
+
+        # A deleted output is made again; its content is the same, so the next stage is skipped
+        os.remove(self.file("scaled_2.txt"))
+        self.assertEqual(self.run_pipeline(3), ["scale 2"])
+
+        # An output changed behind the pipeline's back is made again
+        with open(self.file("total.txt"), 'w') as outfile:
+            outfile.write("0")
+        self.assertEqual(self.run_pipeline(3), ["total 0"])
+        self.assertEqual(self.total(), 42)
+
+    def test_run_fingerprint(self):
+        self.assertEqual(run_fingerprint(functools.partial(_scale, "a", 2)),
+                         run_fingerprint(functools.partial(_scale, "a", 2)))
+        self.assertNotEqual(run_fingerprint(functools.partial(_scale, "a", 2)),
+                            run_fingerprint(functools.partial(_scale, "a", 3)))
+        self.assertNotEqual(run_fingerprint(functools.partial(_scale, "a", 2)),
+                            run_fingerprint(functools.partial(_total, "a", 2)))
+        self.assertNotEqual(run_fingerprint(functools.partial(_total, range(3))),
+                            run_fingerprint(functools.partial(_total, range(4))))
+
+        # A change that a shortened repr would not show
+        weights = np.zeros(5000)
+        changed = weights.copy()
+        changed[2500] = 1
+        self.assertNotEqual(run_fingerprint(functools.partial(_total, weights)),
+                            run_fingerprint(functools.partial(_total, changed)))
+
+        # Parameters without a stable serialisation are refused
+        self.assertRaises(TypeError, run_fingerprint, functools.partial(_total, object()))
+        self.assertRaises(TypeError, Stage, "total", functools.partial(_total, {1, 2}), [0],
+                          inputs=lambda shard: [], outputs=lambda shard: [])
+
+    def test_data_pipeline_fingerprints(self):
+        def params(**kwargs):
+            arguments = dict(num_shards=3, keys_per_shard=10, seed=209)
+            arguments.update(kwargs)
+            pipeline = data_pipeline(self.path, **arguments)
+            return {stage.name: stage.params for stage in pipeline.stages}
+
+        base = params()
+        self.assertEqual(params(), base)
+        changed = params(seed=210)
+        self.assertEqual([name for name in base if base[name] != changed[name]], ["keygen"])
+        changed = params(seq_length=400)
+        self.assertEqual([name for name in base if base[name] != changed[name]],
+                         ["encrypt", "npy", "train", "test"])
+        changed = params(epochs=5)
+        self.assertEqual([name for name in base if base[name] != changed[name]], ["train"])
+
+    def test_archive_directory(self):
+        directory = self.file("pins0")
+        os.makedirs(os.path.join(directory, "sub"))
+        for name in ("00_pins.json", os.path.join("sub", "01_pins.json")):
+            with open(os.path.join(directory, name), 'w') as outfile:
+                outfile.write("[]")
+
+        archive = archive_directory(directory + os.sep)
+        self.assertEqual(archive, directory + ".tar.gz")
+        self.assertFalse(os.path.exists(directory))
+        self.assertFalse(os.path.exists(archive + ".tmp"))
+        with tarfile.open(archive) as tar:
+            self.assertEqual(sorted(info.name for info in tar if info.isfile()),
+                             ["pins0/00_pins.json", "pins0/sub/01_pins.json"])
+
+        # Repeating the call after it completed does nothing
+        self.assertEqual(archive_directory(directory), archive)
+        self.assertRaises(Exception, archive_directory, self.file("missing"))
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append("../m209 Brian Neal")
+
+from m209.keystream import pin_bits
+
+from shard import open_shard, unpack_pins, WHEEL_PINS_COUNT
+
+"""
+Memory-mapped loaders for the training and test data of notebooks #4 and #8.
+
+The .npy files written by notebooks #3/#7 hold the keystream as letters
+('A'-'Z') and the 131 pin targets as 0/1 bytes. The loaders open every file with
+mmap_mode='r' and only read the requested rows and the first input_size columns.
+The keystream is normalised with (x-65)/25 straight into one preallocated
+float32 array, so the peak memory use is the size of the result.
+"""
+
+# Offset and scale used to normalise keystream letters to the range 0-1:
+X_OFFSET = 65
+X_SCALE = 25
+
+
+def training_filelist(path):
+    """
+    Lists the pairs of x and y .npy files in a directory, matched by the file number
+    in front of the first '_', as in notebook #4.
+    :param path: Directory of the .npy files.
+    :return: Sorted list of (x_file, y_file) tuples.
+    """
+    filelist = os.listdir(path)
+    filelist = [(x, y) for x in filelist if '_x_' in x
+                for y in filelist if x.split('_')[0] == y.split('_')[0] and "_y_" in y]
+    filelist.sort()
+    return filelist
+
+
+def cipher_to_npy(cipher_file, x_file, y_file, length):
+    """
+    Converts a ciphertext file of Encrypt (with keystream and pins appended) into the x/y
+    .npy files of notebook #3.
+    :param cipher_file: Name of the ciphertext JSON file.
+    :param x_file: Name of the x .npy file, the first length keystream letters of every record.
+    :param y_file: Name of the y .npy file, the 131 pin targets of every record.
+    :param length: Number of keystream letters per record.
+    """
+    with open(cipher_file, 'r') as infile:
+        records = json.load(infile)
+
+    keystreams = [record[3][:length] for record in records]
+    if any(len(keystream) < length for keystream in keystreams):
+        raise UserWarning(f"{cipher_file}: keystream shorter than {length} letters")
+
+    x = np.frombuffer("".join(keystreams).encode('ascii'), dtype=np.uint8).reshape(len(records), length)
+    y = np.array([pin_bits(record[4]) for record in records], dtype=np.uint8).reshape(len(records), -1)
+
+    np.save(x_file, x)
+    np.save(y_file, y)
+
+
+def _normalise(src, dst, offset):
+    """
+    Writes (src-offset)/X_SCALE into the float32 array dst.
+    """
+    np.subtract(src, offset, out=dst, dtype=np.float32)
+    np.divide(dst, X_SCALE, out=dst)
+
+
+def load_partial_data(path, files, input_size, records_per_file, y_columns=None):
+    """
+    Loads a specific number of records from each of the given x/y .npy file pairs.
+    :param path: Directory of the .npy files.
+    :param files: List of (x_file, y_file) tuples, see training_filelist().
+    :param input_size: Number of keystream letters per record.
+    :param records_per_file: Maximum number of records to load from each file.
+    :param y_columns: Optional pin index or list of pin indices to load from y. All 131
+                      pins are loaded if None.
+    :return: Tuple of float32 np.arrays x of shape (N, input_size) and y.
+    """
+    x_maps = []
+    y_maps = []
+    for x_file, y_file in files:
+        x_map = np.load(os.path.join(path, x_file), mmap_mode='r')
+        y_map = np.load(os.path.join(path, y_file), mmap_mode='r')
+
+        # Ensure the input size matches expected dimensions
+        if input_size > x_map.shape[1]:
+            raise UserWarning("Input size too large for loaded data.")
+
+        x_maps.append(x_map)
+        y_maps.append(y_map)
+
+    return _load(x_maps, y_maps, input_size, records_per_file, y_columns, X_OFFSET)
+
+
+def load_shard_data(filenames, input_size, records_per_file, y_columns=None):
+    """
+    Same as load_partial_data(), but for binary shards written by Encrypt (see shard.py).
+    The shards hold displacement values (0-25) instead of letters and packed pin targets.
+    :param filenames: List of shard filenames.
+    :return: Tuple of float32 np.arrays x of shape (N, input_size) and y.
+    """
+    x_maps = []
+    y_maps = []
+    for filename in filenames:
+        header, arrays = open_shard(filename)
+        if input_size > header["keystream_length"]:
+            raise UserWarning("Input size too large for loaded data.")
+
+        x_maps.append(arrays["keystream"])
+        y_maps.append(_PackedPins(arrays["pins"]))
+
+    return _load(x_maps, y_maps, input_size, records_per_file, y_columns, 0)
+
+
+class _PackedPins:
+    """
+    Wraps a packed pin section of a shard so that it can be sliced by rows like an
+    unpacked (N, 131) y array.
+    """
+    def __init__(self, packed):
+        self.packed = packed
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, rows):
+        return unpack_pins(self.packed[rows])
+
+
+def _load(x_maps, y_maps, input_size, records_per_file, y_columns, offset):
+    """
+    Copies the first records_per_file rows of every x and y source into preallocated
+    float32 arrays, normalising x on the way.
+    """
+    rows = [min(records_per_file, len(x_map)) for x_map in x_maps]
+    total = sum(rows)
+
+    if y_columns is None:
+        y_columns = slice(None)
+    y_width = np.empty(WHEEL_PINS_COUNT)[y_columns].shape
+
+    x = np.empty((total, input_size), dtype=np.float32)
+    y = np.empty((total,) + y_width, dtype=np.float32)
+
+    start = 0
+    for x_map, y_map, n in zip(x_maps, y_maps, rows):
+        _normalise(x_map[:n, :input_size], x[start:start + n], offset)
+        y[start:start + n] = y_map[:n][:, y_columns]
+        start += n
+
+    return x, y
@@ -0,0 +1,112 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains an optional LRU cache of key schedules.
+
+Enciphering many messages under the same key with different indicators (for
+example the fixed AAAAAA internal indicator used when building datasets)
+repeats the same setup work for every message: parsing the lugs, building the
+drum count table and working out the guide arm bits of each key wheel. The
+KeyCache class keeps the resulting m209.keystream.KeySchedule objects, keyed by
+the canonical form of the lug settings and pins (see m209.keylist.key_index),
+and evicts the least recently used ones when a memory limit is exceeded.
+
+"""
+import collections
+
+from .keylist.key_index import canonical_lugs, canonical_pins
+from .keystream import KeySchedule
+
+# Default memory limit for a KeyCache, in bytes:
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Estimated memory used by a cache entry in addition to its arrays (the
+# KeySchedule object, the NumPy array headers and the cache key):
+ENTRY_OVERHEAD = 1024
+
+
+def cache_key(lugs, pin_list):
+    """Returns a hashable canonical form of the given lugs and pin_list.
+
+    The lugs are reduced to their lug count vector and the pins to their pin
+    bit vector, so keys that set up the same drum and key wheels get the same
+    cache key however they are written: "1-2*2" and "1-2 1-2", "0-1" and
+    "1-0", and a key list string and the equivalent lug list.
+
+    """
+    return canonical_lugs(lugs) + canonical_pins(pin_list)
+
+
+class KeyCache:
+    """An LRU cache of KeySchedule objects with a memory limit.
+
+    The hits and misses attributes count cache lookups.
+
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Create an empty cache that holds at most max_bytes of schedules."""
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, lugs, pin_list):
+        """Returns the KeySchedule for the given lugs and pin_list, building
+        and caching it if necessary.
+
+        """
+        key = cache_key(lugs, pin_list)
+        try:
+            schedule, size = self._entries[key]
+        except KeyError:
+            pass
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return schedule
+
+        self.misses += 1
+        schedule = KeySchedule(lugs, pin_list)
+        size = schedule.nbytes + ENTRY_OVERHEAD
+        self._entries[key] = (schedule, size)
+        self.nbytes += size
+        self._evict()
+        return schedule
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        """Changes the memory limit, evicting entries if required."""
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        """Internal function to remove least recently used entries until the
+        cache fits in max_bytes. The most recently used entry is always kept.
+
+        """
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+
+
+# The cache used by cached_keystream() when no cache is given:
+default_cache = KeyCache()
+
+
+def cached_keystream(lugs, pin_list, key_wheels='AAAAAA', length=26, cache=None):
+    """Returns the same result as m209.keystream.keystream(), looking up the
+    key schedule in cache, or in default_cache if cache is None.
+
+    """
+    if cache is None:
+        cache = default_cache
+    return cache.get(lugs, pin_list).keystream(key_wheels, length)
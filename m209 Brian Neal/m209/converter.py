@@ -12,7 +12,7 @@ import string
 from . import M209Error
 from .data import KEY_WHEEL_DATA
 from .key_wheel import KeyWheel, KeyWheelError
-from .drum import Drum
+from .drum import Drum, pin_mask
 from .utils import group_text
 
 M209_ALPHABET_LIST = string.ascii_uppercase
@@ -200,6 +200,66 @@ class M209:
             s = ''.join(plaintext)
         return s
 
+    def encrypt_bytes(self, plaintext, group=True, spaces=True):
+        """Bulk mode version of encrypt() for bytes or bytearray plaintext.
+        Returns the ciphertext as bytes, identical to the string returned by
+        encrypt() for the same input.
+
+        The keystream for the whole plaintext is computed first and the
+        substitution is applied to all letters at once. This requires NumPy.
+
+        """
+        from .keystream import encrypt_bytes
+        return encrypt_bytes(self, plaintext, group=group, spaces=spaces)
+
+    def decrypt_bytes(self, ciphertext, spaces=True, z_sub=True):
+        """Bulk mode version of decrypt() for bytes or bytearray ciphertext.
+        Returns the plaintext as bytes, identical to the string returned by
+        decrypt() for the same input.
+
+        This requires NumPy; see encrypt_bytes().
+
+        """
+        from .keystream import decrypt_bytes
+        return decrypt_bytes(self, ciphertext, spaces=spaces, z_sub=z_sub)
+
+    def seek(self, n):
+        """Advances the key wheels n letters, exactly as if n letters had been
+        enciphered, without performing any cipher operations. The letter
+        counter is incremented by n.
+
+        Each key wheel simply rotates n steps, so this takes the same time for
+        any value of n.
+
+        """
+        if n < 0:
+            raise M209Error("seek(): invalid letter count {}".format(n))
+
+        for kw in self.key_wheels:
+            kw.rotate(n)
+
+        self.letter_counter += n
+
+    def keystream_at(self, start, length):
+        """Returns the drum counts for the window of length letters beginning
+        start letters after the current key wheel positions, as a list of
+        integers.
+
+        The key wheels and letter counter are not changed. The counts are those
+        that would be produced by calling seek(start) followed by enciphering
+        length letters.
+
+        """
+        if start < 0 or length < 0:
+            raise M209Error("keystream_at(): invalid window {}, {}".format(
+                            start, length))
+
+        counts = []
+        for i in range(start, start + length):
+            mask = pin_mask(kw.is_effective_at(i) for kw in self.key_wheels)
+            counts.append(self.drum.rotate_mask(mask))
+        return counts
+
     def _cipher(self, c):
         """Simulate a cipher operation on the device:
         The input letter is read and checked for validity.
@@ -215,8 +275,8 @@ class M209:
         if c not in M209_ALPHABET_SET:
             raise M209Error("Illegal char: {}".format(c))
 
-        pins = [kw.is_effective() for kw in self.key_wheels]
-        count = self.drum.rotate(pins)
+        mask = pin_mask(kw.is_effective() for kw in self.key_wheels)
+        count = self.drum.rotate_mask(mask)
 
         for kw in self.key_wheels:
             kw.rotate()
@@ -14,6 +14,30 @@ class DrumError(M209Error):
     pass
 
 
+def pin_mask(pins):
+    """Returns the 6-bit integer mask for the 6-element sequence pins, where
+    bit n is set if pins[n] is True. Key wheel 0 corresponds to the least
+    significant bit.
+
+    """
+    mask = 0
+    for n, pin in enumerate(pins):
+        if pin:
+            mask |= 1 << n
+    return mask
+
+
+def lug_mask(lug_pair):
+    """Returns the 6-bit integer mask of the key wheel positions covered by
+    the 1 or 2-tuple lug_pair.
+
+    """
+    mask = 0
+    for index in lug_pair:
+        mask |= 1 << index
+    return mask
+
+
 class Drum:
     """The Drum class represents the drum cage inside the M-209.
 
@@ -43,8 +67,14 @@ class Drum:
     The order of the bars list is not relevant as we only need to simulate
     complete revolutions of the drum cage.
 
+    Because a complete revolution only depends on which of the 6 guide arms are
+    in position, the drum count for all 64 possible guide arm states is computed
+    once when the lugs are set and stored in the count_table list. The list is
+    indexed by the 6-bit mask returned by pin_mask().
+
     """
     NUM_BARS = 27
+    NUM_MASKS = 64
 
     def __init__(self, lug_list=None):
         """Creates a Drum instance with the given lug list.
@@ -62,6 +92,7 @@ class Drum:
             self.bars = lug_list
             self._validate_bars()
 
+        self.count_table = self._build_count_table()
         self.key_list = self.to_key_list()
 
     @classmethod
@@ -147,14 +178,25 @@ class Drum:
         the 6 key wheels.
 
         """
-        count = 0
-        for lug_pair in self.bars:
-            for index in lug_pair:
-                if pins[index]:
-                    count += 1
-                    break
+        return self.count_table[pin_mask(pins)]
+
+    def rotate_mask(self, mask):
+        """Rotate the drum cage a complete revolution and return the number of
+        times a bar was shifted to the left. The mask parameter must be a 6-bit
+        integer as returned by pin_mask(), where bit n is set if key wheel n is
+        currently effective.
 
-        return count
+        """
+        return self.count_table[mask]
+
+    def _build_count_table(self):
+        """Internal function to compute the drum count for every possible guide
+        arm state. Returns a list of NUM_MASKS integers.
+
+        """
+        bar_masks = collections.Counter(lug_mask(lug_pair) for lug_pair in self.bars)
+        return [sum(n for bar, n in bar_masks.items() if bar & mask)
+                for mask in range(self.NUM_MASKS)]
 
     def _validate_bars(self):
         """Internal function to validate the bars list. Raises DrumError if the
@@ -9,6 +9,7 @@ simulation.
 import random
 
 from . import M209Error
+from .data import KEY_WHEEL_DATA
 
 
 class KeyWheelError(M209Error):
@@ -16,8 +17,41 @@ class KeyWheelError(M209Error):
     pass
 
 
+# Letter data is shared by all key wheels with the same letters. The WHEEL_TABLES
+# dict maps a string of key wheel letters to a 2-tuple: a tuple of the letters
+# and a dict mapping each letter to its offset on the wheel. It is pre-populated
+# from KEY_WHEEL_DATA and extended on demand for other letter sequences.
+
+WHEEL_TABLES = {}
+
+
+def wheel_table(letters):
+    """Returns the shared (letters, letter_offsets) 2-tuple for the given
+    iterable of key wheel letters.
+
+    """
+    key = ''.join(letters)
+    try:
+        return WHEEL_TABLES[key]
+    except KeyError:
+        table = (tuple(key), {letter : n for n, letter in enumerate(key)})
+        WHEEL_TABLES[key] = table
+        return table
+
+for letters, _ in KEY_WHEEL_DATA:
+    wheel_table(letters)
+
+
 class KeyWheel:
-    """Simulates a key wheel in a M209 converter"""
+    """Simulates a key wheel in a M209 converter
+
+    The pin settings are stored as an integer bitmask in the bits attribute,
+    where bit n is set if the pin for the n-th letter on the wheel is in the
+    effective position. The effective_pins string is computed from it.
+
+    """
+    __slots__ = ['letters', 'num_pins', 'letter_offsets', 'guide_offset',
+                 'bits', 'pos']
 
     def __init__(self, letters, guide_letter, effective_pins=None):
         """Initialize a KeyWheel instance:
@@ -31,11 +65,9 @@ class KeyWheel:
         effective_pins - see the description of set_pins(), below.
 
         """
-        self.letters = list(letters)
+        self.letters, self.letter_offsets = wheel_table(letters)
         self.num_pins = len(self.letters)
 
-        self.letter_offsets = {letter : n for n, letter in enumerate(self.letters)}
-
         if self.num_pins < 1:
             raise KeyWheelError("Too few key wheel letters")
 
@@ -56,16 +88,32 @@ class KeyWheel:
     def __str__(self):
         parts = []
         for n, c in enumerate(self.letters):
-            if self.pins[n]:
+            if self.bits >> n & 1:
                 parts.append(c + '-')
             else:
                 parts.append('-' + c)
         return ' '.join(parts)
 
+    @property
+    def pins(self):
+        """A list of Bools, one for each letter on the wheel, where True means
+        the pin is in the effective position.
+
+        """
+        return [bool(self.bits >> n & 1) for n in range(self.num_pins)]
+
+    @property
+    def effective_pins(self):
+        """A string of the letters whose pins are in the effective position,
+        in wheel order.
+
+        """
+        return ''.join(c for n, c in enumerate(self.letters)
+                       if self.bits >> n & 1)
+
     def reset_pins(self):
         """Reset all pins to the ineffective state."""
-        self.pins = [False] * self.num_pins
-        self.effective_pins = ''
+        self.bits = 0
 
     def set_pins(self, effective_pins):
         """Sets which pins are effective.
@@ -80,14 +128,14 @@ class KeyWheel:
         if not effective_pins:
             return
 
+        bits = 0
         for letter in effective_pins:
             try:
-                n = self.letter_offsets[letter]
+                bits |= 1 << self.letter_offsets[letter]
             except KeyError:
                 raise KeyWheelError("Invalid pin: {}".format(letter))
-            self.pins[n] = True
 
-        self.effective_pins = effective_pins
+        self.bits = bits
 
     def rotate(self, steps=1):
         """Rotate the key wheel the given number of steps."""
@@ -115,7 +163,16 @@ class KeyWheel:
 
         """
         n = (self.pos + self.guide_offset) % self.num_pins
-        return self.pins[n]
+        return self.bits >> n & 1 == 1
+
+    def is_effective_at(self, steps):
+        """Returns True if the pin that will be in position to effect the guide
+        arm after the key wheel is rotated the given number of steps is in the
+        effective position, and False otherwise. The key wheel is not rotated.
+
+        """
+        n = (self.pos + self.guide_offset + steps) % self.num_pins
+        return self.bits >> n & 1 == 1
 
     def set_pos(self, c):
         """Sets the position of the key wheel to the letter c."""
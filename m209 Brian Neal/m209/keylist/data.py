@@ -28,6 +28,10 @@
 # algorithm could not come up with a solution then a soldier would have
 # difficulty finding a solution as well, assuming they generated the key lists
 # by hand. If they used a computer or algorithm, I'd sure like to see it!
+#
+# The exhaustive enumeration in the m209.keylist.lug_index module settles this:
+# none of these 5 selections has any lug settings that meet the rules used by
+# generate_lugs(). All other selections have at least one.
 
 GROUP_A = [
     [1, 2, 3, 4, 8, 10],
@@ -13,7 +13,7 @@ from .key_list import KeyList
 from ..converter import M209
 from .. import M209Error
 from ..data import KEY_WHEEL_DATA
-from .data import GROUP_A, GROUP_B, ALL_DRUM_ROTATE_INPUTS
+from .data import GROUP_A, GROUP_B
 from ..drum import Drum
 
 
@@ -54,9 +54,18 @@ def build_consec_map(letters):
 
 CONSEC_MAPS = [build_consec_map(letters) for letters, _ in KEY_WHEEL_DATA]
 
+# WHEEL_BITS is a list of dicts, one for each key wheel, mapping each letter to
+# its bit in a pin mask of the key wheel.
+WHEEL_BITS = [{c: 1 << n for n, c in enumerate(letters)}
+              for letters, _ in KEY_WHEEL_DATA]
+
+# Maximum number of consecutive effective or ineffective pins on a key wheel:
+MAX_CONSECUTIVE = 6
+
 
 def generate_key_list(indicator, lug_selection=None,
-        max_lug_attempts=MAX_LUG_ATTEMPTS, max_pin_attempts=MAX_PIN_ATTEMPTS):
+        max_lug_attempts=MAX_LUG_ATTEMPTS, max_pin_attempts=MAX_PIN_ATTEMPTS,
+        rng=None):
     """Create a key list at random with the given indicator.
 
     The procedure used is based upon manuals for the M-209 as found online:
@@ -87,18 +96,22 @@ def generate_key_list(indicator, lug_selection=None,
     see if a solution could actually be found. In any event, for our purposes,
     we just remove the problematic entries from the table.
 
+    If not None, rng must be a random.Random instance that is used instead of
+    the global random number generator of the random module. This makes the
+    key lists reproducible from the seed of rng.
+
     """
     logger.info("Creating key list %s", indicator)
 
-    lugs = generate_lugs(lug_selection, max_lug_attempts)
-    pin_list = generate_pin_list(max_pin_attempts)
+    lugs = generate_lugs(lug_selection, max_lug_attempts, rng)
+    pin_list = generate_pin_list(max_pin_attempts, rng)
     letter_check = generate_letter_check(lugs=lugs, pin_list=pin_list)
 
     return KeyList(indicator=indicator, lugs=lugs, pin_list=pin_list,
             letter_check=letter_check)
 
 
-def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS):
+def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS, rng=None):
     """Return random lug settings based on Army procedure.
 
     If not None, lug_selection must be a list of 6 integers that will be used
@@ -109,7 +122,13 @@ def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS):
     can perform to find a solution before giving up. If forced to give up,
     a KeyListGenError is raised.
 
+    If not None, rng is used instead of the random module, see
+    generate_key_list().
+
     """
+    if rng is None:
+        rng = random
+
     selection_provided = lug_selection is not None
     if selection_provided:
         selection = lug_selection
@@ -122,14 +141,15 @@ def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS):
         # For our purposes, we'll just pick from group B ~10% of the time. We
         # also (currently) have no history of prior key list generations, so we
         # don't worry about reusing sets or how often we've picked from group B.
-        rn = random.randint(0, 100)
+        rn = rng.randint(0, 100)
         group = GROUP_A if rn > 10 else GROUP_B
         logger.debug("Selecting from group %s", 'A' if group is GROUP_A else 'B')
-        selection = random.choice(group)
+        # Copy the selection so that shuffling it does not change the table:
+        selection = list(rng.choice(group))
         logger.debug("Selection: %s", selection)
 
         # 2b: Rearrange the numbers so they appear in a random order
-        random.shuffle(selection)
+        rng.shuffle(selection)
         logger.debug("Shuffled selection: %s", selection)
 
     # 2c: Distribution of Overlaps
@@ -137,14 +157,13 @@ def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS):
     logger.debug("Overlap: %d", overlap)
 
     for n in range(max_attempts):
-        overlaps = distribute_overlaps(selection, overlap)
+        overlaps = distribute_overlaps(selection, overlap, rng)
         if overlaps and check_overlaps(overlaps):
             # So far this looks good. But now we need to determine if the drum
-            # can generate all numbers in the range 1-27.
-            # Build a drum from our setup:
-            drum = Drum(build_lug_list(selection, overlaps))
-            logger.debug('Drum: %s', drum)
-            if check_lug_placement(drum):
+            # can generate all numbers in the range 1-27. This is checked
+            # straight from the selection and overlaps; the drum is only built
+            # once a solution has been found.
+            if check_placement(selection, overlaps):
                 break
             else:
                 logger.debug("Failed lug placement check")
@@ -152,17 +171,23 @@ def generate_lugs(lug_selection=None, max_attempts=MAX_LUG_ATTEMPTS):
         raise KeyListGenError("generate_lugs: too many attempts: %s" % sorted(selection))
     logger.info("Lugs generated in %s iteration(s)", n + 1)
 
+    drum = Drum(build_lug_list(selection, overlaps))
+    logger.debug('Drum: %s', drum)
     return drum.to_key_list()
 
 
-def distribute_overlaps(selection, overlap):
+def distribute_overlaps(selection, overlap, rng=None):
     """Distributes the overlaps over the selection and returns an overlap list.
 
     If successful, return a list consisting of 3-tuples of the form (position1,
     position2, overlap). If unable to come up with a solution, an empty list is
     returned.
 
+    If not None, rng is used instead of the random module.
+
     """
+    if rng is None:
+        rng = random
 
     # The remaining list keeps track of how many lugs are remaining in each
     # position:
@@ -170,19 +195,10 @@ def distribute_overlaps(selection, overlap):
 
     # Generate all combinations of ways to pick 2 positions in random order
     combs = list(itertools.combinations(range(0, 6), 2))
-    random.shuffle(combs)
+    rng.shuffle(combs)
 
-    # chunk_limit enforces the rules:
-    # (3) Several small overlaps should be used in preference to one large
-    # overlap.
-    # (4) There must not be more than four overlaps between any two numbers.
-    if 1 <= overlap <= 3:
-        divisor = 1
-    elif 4 <= overlap <= 8:
-        divisor = 2
-    else:
-        divisor = 3
-    chunk_limit = max(1, min(4, overlap // divisor))
+    # chunk_limit enforces rules (3) and (4), see overlap_chunk_limit():
+    chunk_limit = overlap_chunk_limit(overlap)
     logger.debug("chunk_limit: %d", chunk_limit)
 
     overlaps = []
@@ -196,7 +212,7 @@ def distribute_overlaps(selection, overlap):
         if max_chunk <= 0:
             continue
 
-        chunk = random.randint(1, max_chunk)
+        chunk = rng.randint(1, max_chunk)
 
         overlap -= chunk
         remaining[x] -= chunk
@@ -212,6 +228,23 @@ def distribute_overlaps(selection, overlap):
     return overlaps if overlap == 0 else []
 
 
+def overlap_chunk_limit(overlap):
+    """Returns the largest number of overlapping lugs allowed between any two
+    positions for the given total overlap. This enforces the rules:
+    (3) Several small overlaps should be used in preference to one large
+    overlap.
+    (4) There must not be more than four overlaps between any two numbers.
+
+    """
+    if 1 <= overlap <= 3:
+        divisor = 1
+    elif 4 <= overlap <= 8:
+        divisor = 2
+    else:
+        divisor = 3
+    return max(1, min(4, overlap // divisor))
+
+
 def check_overlaps(overlaps):
     """Checks the overlap list for the desired qualities.
 
@@ -274,37 +307,78 @@ def check_lug_placement(drum):
     range 1-27, inclusive, and False otherwise.
 
     """
-    values = set()
+    # The drum's count table holds the answer to Drum.rotate() for every
+    # possible input. Mask 0 (no guide arms in position) always yields 0 and is
+    # not one of the ALL_DRUM_ROTATE_INPUTS.
 
-    # Loop over all possible inputs to Drum.rotate(), noting the answer each
-    # time by storing it in our values set. When the size of our set reaches 27
-    # we know we have good settings.
+    values = set(drum.count_table[1:])
+    assert(0 not in values)
+    return len(values) == 27
 
-    for pins in ALL_DRUM_ROTATE_INPUTS:
-        val = drum.rotate(pins)
-        assert(1 <= val <= 27)
-        values.add(val)
 
-        if len(values) == 27:
-            break
-    else:
-        return False
+# For every guide arm mask (bit n set if key wheel n is effective): the index
+# of the lowest set bit and the mask without it. Mask 0 is never used.
+PLACEMENT_STEPS = [((m & -m).bit_length() - 1, m & (m - 1)) for m in range(64)]
 
-    return True
+# Bit set for every count in the range 1-27:
+ALL_COUNTS = (1 << 28) - 2
+
+
+def check_placement(selection, overlaps):
+    """Returns True if the lug settings given by the selection and overlap list
+    are capable of generating all values in the range 1-27, inclusive, and False
+    otherwise. This gives the same answer as
+    check_lug_placement(Drum(build_lug_list(selection, overlaps))) without
+    building the drum.
+
+    The count for a guide arm mask is the sum of the selection numbers of its
+    set bits, minus the overlaps between pairs of its set bits, since an
+    overlapping lug is counted in both numbers but only advances the drum once.
+    The counts of all 63 masks are computed incrementally from the mask with
+    the lowest bit removed, and the reachable counts are collected as bits of an
+    integer.
+
+    """
+    # partners[i] holds (bit of y, n) for every overlap (x, y, n) with x = i
+    # and y > i; only these pairs can be present in a mask whose lowest set
+    # bit is i.
+    partners = [[] for _ in range(6)]
+    for x, y, n in overlaps:
+        if x > y:
+            x, y = y, x
+        partners[x].append((1 << y, n))
+
+    counts = [0] * 64
+    reached = 0
+    for m in range(1, 64):
+        i, rest = PLACEMENT_STEPS[m]
+        count = counts[rest] + selection[i]
+        for bit, n in partners[i]:
+            if rest & bit:
+                count -= n
+        counts[m] = count
+        reached |= 1 << count
 
+    return reached == ALL_COUNTS
 
-def generate_pin_list(max_attempts=MAX_PIN_ATTEMPTS):
+
+def generate_pin_list(max_attempts=MAX_PIN_ATTEMPTS, rng=None):
     """Return a random pin list based on Army procedure.
 
     The max_attempts parameter controls how many iterations the algorithm can
     perform before giving up. If forced to give up, an KeyListGenError is raised.
 
+    If not None, rng is used instead of the random module.
+
     """
+    if rng is None:
+        rng = random
+
     cards = ['R'] * 78
     cards.extend(['L'] * (156 - len(cards)))
 
     for n in range(max_attempts):
-        random.shuffle(cards)
+        rng.shuffle(cards)
         deck = collections.deque(cards)
         pin_list = []
         for letters, _ in KEY_WHEEL_DATA:
@@ -344,23 +418,45 @@ def pin_list_check(pin_list):
         logger.info("Pin list ratio check failed: %s", ratio)
         return False
 
-    # Check for more than 6 consecutive effective pins on a wheel
+    # Check for more than 6 consecutive effective or ineffective pins on
+    # a wheel. The check is done on the pin masks; the ineffective pins are
+    # the inverted mask.
 
     for n, pins in enumerate(pin_list):
-        if check_consecutive(n, pins):
+        mask = wheel_pin_mask(n, pins)
+        num_pins = len(KEY_WHEEL_DATA[n][0])
+        if check_consecutive_mask(mask, num_pins):
             logger.debug("Pin list consecutive effective check failed")
             return False
-
-    # Check for more than 6 consecutive ineffective pins on a wheel
-
-    for n, pins in enumerate(pin_list):
-        if check_consecutive(n, invert_pins(n, pins)):
+        if check_consecutive_mask(mask ^ ((1 << num_pins) - 1), num_pins):
             logger.debug("Pin list consecutive ineffective check failed")
             return False
 
     return True
 
 
+def wheel_pin_mask(n, pins):
+    """Returns the pin mask for key wheel n, where bit i is set if the i-th
+    letter of the key wheel is in the string of effective pins.
+
+    """
+    bits = WHEEL_BITS[n]
+    return sum(bits[c] for c in set(pins))
+
+
+def check_consecutive_mask(mask, num_pins):
+    """Returns True if the pin mask of a key wheel with num_pins pins has more
+    than MAX_CONSECUTIVE consecutive set bits, accounting for wrap-around, and
+    False otherwise.
+
+    """
+    run = mask
+    for k in range(1, MAX_CONSECUTIVE + 1):
+        # Bit i of the rotated mask is bit i + k of the mask:
+        run &= (mask >> k) | (mask << (num_pins - k))
+    return run != 0
+
+
 def check_consecutive(n, pins):
     """Check for consecutive pins on key wheel n. The pins parameter must be
     a string of the pins that are effective. Returns True if there are more than
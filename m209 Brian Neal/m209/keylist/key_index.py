@@ -0,0 +1,167 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains canonical key hashes and an index for finding
+duplicate keys.
+
+Swapping the lugs of two bars does not change the keystream, so many lug
+settings are functionally the same. The canonical form of the lug settings is
+the multiset of bars, i.e. the lug count vector of m209.keystream.lug_counts(),
+and the canonical form of the pins is the pin bit vector of
+m209.keystream.pin_bits(). Two keys are equivalent if and only if their
+canonical forms are equal, regardless of how their key list strings are
+written.
+
+The canonical forms are hashed to 64 bit integers. A KeyIndex keeps a sorted
+array of such hashes, so it is small, can be saved to disk and shared between
+the processes that generate keys, and a key is looked up in O(log n):
+
+    index = KeyIndex()
+    index.add(key_hash(lugs, pin_list))
+    ...
+    if key_hash(lugs, pin_list) in index:
+        ...
+
+With 64 bit hashes the chance that two different keys collide is about n^2 /
+2^65 for n keys, i.e. negligible for the size of a training set.
+
+"""
+
+import hashlib
+
+import numpy as np
+
+from ..keystream import lug_counts, pin_bits, TOTAL_PINS
+
+
+def hash64(data):
+    """Returns a 64 bit hash of the bytes data as an int.
+
+    Unlike hash(), the result is the same in every process.
+
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def canonical_lugs(lugs):
+    """Returns the canonical form of the lugs parameter (see
+    m209.keystream.make_drum()) as bytes.
+
+    """
+    return lug_counts(lugs).tobytes()
+
+
+def canonical_pins(pin_list):
+    """Returns the canonical form of pin_list, as accepted by
+    M209.set_all_pins(), as bytes.
+
+    """
+    return np.packbits(pin_bits(pin_list)).tobytes()
+
+
+def lug_hash(lugs):
+    """Returns the 64 bit hash of the canonical lug settings."""
+
+    return hash64(canonical_lugs(lugs))
+
+
+def pin_hash(pin_list):
+    """Returns the 64 bit hash of the canonical pin settings."""
+
+    return hash64(canonical_pins(pin_list))
+
+
+def key_hash(lugs, pin_list):
+    """Returns the 64 bit hash of the canonical form of a key, the lug
+    settings together with the pins.
+
+    """
+    return hash64(canonical_lugs(lugs) + canonical_pins(pin_list))
+
+
+def pin_matrix_hashes(bits):
+    """Returns the pin hashes of every row of an (N, TOTAL_PINS) pin bit matrix
+    (see m209.keylist.pin_batch) as a uint64 array. Row n gives the same hash as
+    pin_hash() of the n-th pin list.
+
+    """
+    bits = np.asarray(bits, dtype=np.uint8).reshape(-1, TOTAL_PINS)
+    packed = np.packbits(bits, axis=1)
+    return np.array([hash64(row.tobytes()) for row in packed], dtype=np.uint64)
+
+
+class KeyIndex:
+    """A set of 64 bit key hashes.
+
+    The hashes are kept in a sorted uint64 array; hashes added since the last
+    merge are kept in a set until the next lookup of many hashes at once or
+    save().
+
+    """
+    def __init__(self, hashes=()):
+
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        self.pending = set()
+
+    @classmethod
+    def load(cls, fname):
+        """Loads an index saved by save()."""
+
+        return cls(np.load(fname))
+
+    def save(self, fname):
+        """Saves the index as a sorted uint64 array to an .npy file."""
+
+        self.merge()
+        np.save(fname, self.hashes)
+
+    def merge(self):
+        """Merges the pending hashes into the sorted array."""
+
+        if self.pending:
+            pending = np.fromiter(self.pending, dtype=np.uint64, count=len(self.pending))
+            self.hashes = np.union1d(self.hashes, pending)
+            self.pending = set()
+
+    def __len__(self):
+        return len(self.hashes) + len(self.pending)
+
+    def __contains__(self, h):
+        if int(h) in self.pending:
+            return True
+        h = np.uint64(h)
+        i = np.searchsorted(self.hashes, h)
+        return bool(i < len(self.hashes) and self.hashes[i] == h)
+
+    def contains(self, hashes):
+        """Returns a boolean array that is True for every hash of the array
+        hashes that is in the index.
+
+        """
+        self.merge()
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        i = np.searchsorted(self.hashes, hashes)
+        found = np.zeros(hashes.shape, dtype=bool)
+        inside = i < len(self.hashes)
+        found[inside] = self.hashes[i[inside]] == hashes[inside]
+        return found
+
+    def add(self, h):
+        """Adds the hash h. Returns True if it was not in the index yet."""
+
+        if h in self:
+            return False
+        self.pending.add(int(h))
+        return True
+
+    def update(self, hashes):
+        """Adds all hashes of an iterable or array. Returns the number of
+        hashes that were already in the index, including repeats in hashes.
+
+        """
+        hashes = np.fromiter(hashes, dtype=np.uint64)
+        self.merge()
+        old = len(self.hashes)
+        self.hashes = np.union1d(self.hashes, hashes)
+        return len(hashes) - (len(self.hashes) - old)
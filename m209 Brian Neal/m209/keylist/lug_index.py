@@ -0,0 +1,211 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains an exhaustive index of the valid lug settings for the
+selections in group A and group B.
+
+generate_lugs() searches for lug settings by randomly distributing the overlaps
+and rejecting distributions that fail the checks. The LugIndex instead
+enumerates, once, every distribution of the overlaps of a selection that obeys
+the rules of distribute_overlaps(), check_overlaps() and check_placement(). The
+distributions of all selections are stored in one array with an offsets table,
+so drawing lug settings is an indexed lookup:
+
+    index = LugIndex.build()
+    index.save('lug_index.npz')
+    ...
+    index = LugIndex.load('lug_index.npz')
+    lugs = index.draw([3, 1, 2, 10, 4, 8])
+
+The distributions are enumerated for the numbers of a selection in ascending
+order. Rule (2) of check_overlaps() depends on which positions the numbers are
+given to, so it is checked when a distribution is mapped onto the order of the
+selection that is drawn for. All other rules do not depend on the order.
+
+The enumeration also answers which selections have no valid lug settings at all;
+see the selections commented out in the m209.keylist.data module.
+
+"""
+
+import itertools
+import random
+
+import numpy as np
+
+from .data import GROUP_A, GROUP_B
+from .generate import (KeyListGenError, MAX_LUG_ATTEMPTS, overlap_chunk_limit,
+                       check_overlaps, check_placement, build_lug_list)
+from ..drum import Drum
+
+
+# All pairs of positions that lugs can overlap on, in the order of the columns
+# of the overlap array:
+PAIRS = list(itertools.combinations(range(6), 2))
+
+
+def enumerate_overlaps(selection):
+    """Returns a list of all valid overlap distributions for the selection, in
+    the order of the numbers in the selection. Each distribution is a tuple of
+    the number of overlapping lugs for every pair in PAIRS.
+
+    A distribution is valid if no pair overlaps by more than the
+    overlap_chunk_limit(), no position has more overlapping lugs than its
+    number, the overlaps sum up to the overlap of the selection, most of the
+    six numbers are involved (rule (1) of check_overlaps()) and the lugs can
+    generate all values in the range 1-27.
+
+    """
+    overlap = sum(selection) - 27
+    limit = overlap_chunk_limit(overlap)
+    remaining = list(selection)
+    chunks = [0] * len(PAIRS)
+    result = []
+
+    def add_pair(k, overlap):
+        if overlap == 0:
+            overlaps = [(x, y, n) for (x, y), n in zip(PAIRS, chunks) if n]
+            if len(overlaps) >= 3:
+                numbers = {p for x, y, n in overlaps for p in (x, y)}
+                if len(numbers) <= 3:
+                    return
+            if check_placement(selection, overlaps):
+                result.append(tuple(chunks))
+            return
+        if k == len(PAIRS):
+            return
+
+        x, y = PAIRS[k]
+        for n in range(min(limit, remaining[x], remaining[y], overlap) + 1):
+            chunks[k] = n
+            remaining[x] -= n
+            remaining[y] -= n
+            add_pair(k + 1, overlap - n)
+            remaining[x] += n
+            remaining[y] += n
+        chunks[k] = 0
+
+    add_pair(0, overlap)
+    return result
+
+
+class LugIndex:
+    """Exhaustive index of valid lug settings.
+
+    selections is an (S, 6) array of the selections with their numbers in
+    ascending order, overlaps an (N, 15) array of overlap distributions (see
+    enumerate_overlaps()) and offsets an (S + 1) array; the distributions of
+    selection i are overlaps[offsets[i]:offsets[i + 1]].
+
+    """
+    def __init__(self, selections, offsets, overlaps):
+
+        self.selections = np.asarray(selections, dtype=np.uint8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.overlaps = np.asarray(overlaps, dtype=np.uint8).reshape(-1, len(PAIRS))
+        self.rows = {tuple(int(n) for n in selection): i
+                     for i, selection in enumerate(self.selections)}
+
+    @classmethod
+    def build(cls, selections=None):
+        """Enumerates the valid lug settings of the selections, by default all
+        selections of group A and group B.
+
+        """
+        if selections is None:
+            selections = GROUP_A + GROUP_B
+        selections = sorted({tuple(sorted(selection)) for selection in selections})
+
+        offsets = [0]
+        overlaps = []
+        for selection in selections:
+            overlaps.extend(enumerate_overlaps(selection))
+            offsets.append(len(overlaps))
+
+        return cls(selections, offsets, overlaps)
+
+    @classmethod
+    def load(cls, fname):
+        """Loads an index saved by save()."""
+
+        with np.load(fname) as data:
+            return cls(data['selections'], data['offsets'], data['overlaps'])
+
+    def save(self, fname):
+        """Saves the index arrays to an .npz file."""
+
+        np.savez(fname, selections=self.selections, offsets=self.offsets,
+                 overlaps=self.overlaps)
+
+    def __len__(self):
+        return len(self.overlaps)
+
+    def _row(self, selection):
+        try:
+            return self.rows[tuple(sorted(selection))]
+        except KeyError:
+            raise KeyListGenError("selection not in lug index: %s" % sorted(selection))
+
+    def count(self, selection):
+        """Returns the number of valid overlap distributions for the selection,
+        regardless of the order of its numbers.
+
+        """
+        row = self._row(selection)
+        return int(self.offsets[row + 1] - self.offsets[row])
+
+    def unsolvable(self):
+        """Returns a list of the selections without any valid lug settings."""
+
+        counts = np.diff(self.offsets)
+        return [list(map(int, selection)) for selection in self.selections[counts == 0]]
+
+    def draw_overlaps(self, selection, max_attempts=MAX_LUG_ATTEMPTS, rng=None):
+        """Returns a random overlap list of 3-tuples (position1, position2,
+        overlap) for the selection, as distribute_overlaps() does.
+
+        Numbers that appear more than once in the selection are assigned to
+        their positions in random order. A KeyListGenError is raised if the
+        selection has no valid lug settings, or if no distribution meeting rule
+        (2) of check_overlaps() is drawn in max_attempts attempts.
+
+        If not None, rng is a random.Random instance used instead of the random
+        module.
+
+        """
+        if rng is None:
+            rng = random
+
+        row = self._row(selection)
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        if start == stop:
+            raise KeyListGenError("no valid lug settings: %s" % sorted(selection))
+
+        # position[i] is the position of the i-th smallest number:
+        position = sorted(rng.sample(range(6), 6), key=lambda n: selection[n])
+
+        for n in range(max_attempts):
+            chunks = self.overlaps[rng.randrange(start, stop)]
+            overlaps = sorted(tuple(sorted((position[x], position[y]))) + (int(c), )
+                              for (x, y), c in zip(PAIRS, chunks) if c)
+            if check_overlaps(overlaps):
+                return overlaps
+        raise KeyListGenError("draw_overlaps: too many attempts: %s" % sorted(selection))
+
+    def draw(self, selection=None, max_attempts=MAX_LUG_ATTEMPTS, rng=None):
+        """Returns random lug settings in key list format, like generate_lugs().
+
+        If None, a selection is chosen from group A or group B and shuffled as
+        generate_lugs() does. rng is as for draw_overlaps().
+
+        """
+        if rng is None:
+            rng = random
+
+        if selection is None:
+            group = GROUP_A if rng.randint(0, 100) > 10 else GROUP_B
+            selection = list(rng.choice(group))
+            rng.shuffle(selection)
+
+        overlaps = self.draw_overlaps(selection, max_attempts, rng)
+        return Drum(build_lug_list(selection, overlaps)).to_key_list()
@@ -0,0 +1,119 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains a NumPy based generator for many pin lists at once.
+
+generate_pin_list() deals one pin list from a shuffled deck of cards and
+retries until pin_list_check() passes. Here K candidate decks are shuffled at
+once and the candidates are kept as a (K, TOTAL_PINS) pin bit matrix, wheel by
+wheel in key wheel letter order (the layout of m209.keystream.pin_bits()). The
+checks of pin_list_check() are applied to all rows at once:
+
+    * the number of effective pins must be between 40-60% of all pins
+    * there cannot be more than 6 consecutive effective or ineffective pins on
+      any wheel, accounting for wrap-around; this is checked with rolling window
+      sums over each wheel
+
+"""
+
+import math
+
+import numpy as np
+
+from .generate import KeyListGenError, MAX_PIN_ATTEMPTS, MAX_CONSECUTIVE
+from ..data import KEY_WHEEL_DATA
+from ..keystream import TOTAL_PINS, WHEEL_SIZES, WHEEL_OFFSETS
+
+# The deck used by generate_pin_list(): half of the cards are effective.
+DECK_SIZE = 156
+EFFECTIVE_CARDS = DECK_SIZE // 2
+
+# Allowed range of the number of effective pins (40-60%), inclusive:
+MIN_EFFECTIVE = math.ceil(0.4 * TOTAL_PINS)
+MAX_EFFECTIVE = math.floor(0.6 * TOTAL_PINS)
+
+# Length of a window that must not be all effective or all ineffective:
+WINDOW = MAX_CONSECUTIVE + 1
+
+
+def random_pin_matrix(k, rng=None):
+    """Returns a (k, TOTAL_PINS) uint8 matrix of unchecked candidate pin
+    lists, each dealt from a shuffled deck like generate_pin_list() does.
+
+    rng is an optional numpy.random.Generator.
+
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    decks = np.zeros((k, DECK_SIZE), dtype=np.uint8)
+    decks[:, :EFFECTIVE_CARDS] = 1
+    return rng.permuted(decks, axis=1)[:, :TOTAL_PINS]
+
+
+def pin_matrix_check(bits):
+    """Returns a boolean array that is True for every row of the pin bit matrix
+    that meets the criteria of pin_list_check().
+
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    num_eff = bits.sum(axis=1)
+    valid = (num_eff >= MIN_EFFECTIVE) & (num_eff <= MAX_EFFECTIVE)
+
+    for offset, size in zip(WHEEL_OFFSETS, WHEEL_SIZES):
+        wheel = bits[:, offset:offset + size]
+        # Extend the wheel so that every window of WINDOW pins, including the
+        # ones that wrap around, is a contiguous slice:
+        ring = np.concatenate([wheel, wheel[:, :WINDOW - 1]], axis=1)
+        sums = np.zeros((len(bits), ring.shape[1] + 1), dtype=np.int16)
+        np.cumsum(ring, axis=1, out=sums[:, 1:])
+        windows = sums[:, WINDOW:] - sums[:, :-WINDOW]
+        valid &= ((windows != 0) & (windows != WINDOW)).all(axis=1)
+
+    return valid
+
+
+def generate_pin_matrix(k, rng=None, max_attempts=MAX_PIN_ATTEMPTS):
+    """Returns a (k, TOTAL_PINS) uint8 matrix of k random pin lists that meet
+    the criteria of pin_list_check().
+
+    Candidates are dealt in batches until k of them pass the checks. The
+    max_attempts parameter limits the number of batches; if exceeded, a
+    KeyListGenError is raised.
+
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    result = [np.empty((0, TOTAL_PINS), dtype=np.uint8)]
+    found = 0
+    dealt = 0
+    batch = k
+    for n in range(max_attempts):
+        if found >= k:
+            break
+        candidates = random_pin_matrix(batch, rng)
+        survivors = candidates[pin_matrix_check(candidates)]
+        result.append(survivors)
+        found += len(survivors)
+        dealt += batch
+        # Size the next batch by the acceptance rate seen so far:
+        rate = max(found, 1) / dealt
+        batch = max(64, math.ceil((k - found) / rate * 1.1))
+    else:
+        if found < k:
+            raise KeyListGenError("generate_pin_matrix: too many attempts")
+
+    return np.concatenate(result)[:k]
+
+
+def pin_lists(bits):
+    """Converts a pin bit matrix into a list of pin lists, each a list of
+    6 strings of effective pins as returned by generate_pin_list().
+
+    """
+    letters = [np.array(list(letters)) for letters, _ in KEY_WHEEL_DATA]
+    bits = np.asarray(bits, dtype=bool)
+    return [[''.join(letters[n][row[offset:offset + size]])
+             for n, (offset, size) in enumerate(zip(WHEEL_OFFSETS, WHEEL_SIZES))]
+            for row in bits]
@@ -9,7 +9,8 @@ import random
 import unittest
 
 from ..generate import (generate_key_list, pin_list_check, check_overlaps,
-                        KeyListGenError)
+                        KeyListGenError, check_placement, check_lug_placement,
+                        distribute_overlaps, build_lug_list)
 from m209.converter import M209
 from m209.data import KEY_WHEEL_DATA
 from m209.drum import Drum
@@ -249,3 +250,22 @@ class CheckOverlapsTestCase(unittest.TestCase):
         self.assertFalse(check_overlaps([(0, 2, 1), (1, 3, 1), (2, 4, 1)]))
         self.assertFalse(check_overlaps([(0, 2, 1), (1, 3, 1), (2, 4, 1), (2, 5, 1)]))
 
+
+class CheckPlacementTestCase(unittest.TestCase):
+
+    def test_drum_check(self):
+
+        for selection in GROUP_A + GROUP_B:
+            selection = list(selection)
+            random.shuffle(selection)
+            overlaps = distribute_overlaps(selection, sum(selection) - 27)
+            if not overlaps:
+                continue
+            drum = Drum(build_lug_list(selection, overlaps))
+            self.assertEqual(check_placement(selection, overlaps),
+                             check_lug_placement(drum))
+
+    def test_placement(self):
+
+        self.assertTrue(check_placement([1, 2, 4, 8, 12, 1], [(4, 5, 1)]))
+        self.assertFalse(check_placement([1, 1, 1, 1, 12, 12], [(4, 5, 1)]))
@@ -0,0 +1,101 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""Tests for the canonical key hashes and the key index."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..key_index import (KeyIndex, key_hash, lug_hash, pin_hash,
+                         pin_matrix_hashes)
+from ..pin_batch import generate_pin_matrix, pin_lists
+
+
+PIN_LIST = [
+    'FGIKOPRSUVWYZ',
+    'DFGKLMOTUY',
+    'ADEFGIORTUVX',
+    'ACFGHILMRSU',
+    'BCDEFJKLPS',
+    'EFGHJLMNP'
+]
+
+LUGS = '1-0 2-0*4 0-3*3 0-4*10 0-5*5 2-5 2-6*3'
+
+
+class KeyHashTestCase(unittest.TestCase):
+
+    def test_equivalent_lugs(self):
+
+        h = lug_hash(LUGS)
+        self.assertEqual(h, lug_hash('2-6*3 2-5 0-5*5 0-4*10 0-3*3 2-0*4 1-0'))
+        self.assertEqual(h, lug_hash('1-0 2-0*3 2-0 3-0*3 0-4*10 0-5*5 2-5 2-6*3'))
+        self.assertEqual(h, lug_hash('0-1 0-2*4 3-0*3 4-0*10 5-0*5 5-2 6-2*3'))
+        self.assertNotEqual(h, lug_hash('1-0 2-0*4 0-3*3 0-4*10 0-5*5 2-5*2 2-6*2'))
+
+    def test_pins(self):
+
+        h = pin_hash(PIN_LIST)
+        self.assertEqual(h, pin_hash([''.join(reversed(pins)) for pins in PIN_LIST]))
+        self.assertNotEqual(h, pin_hash(PIN_LIST[:5] + ['EFGHJLMN']))
+
+        bits = generate_pin_matrix(20, np.random.default_rng(3))
+        expected = [pin_hash(pin_list) for pin_list in pin_lists(bits)]
+        self.assertEqual(pin_matrix_hashes(bits).tolist(), expected)
+
+    def test_key_hash(self):
+
+        self.assertEqual(key_hash(LUGS, PIN_LIST),
+                         key_hash('2-6*3 2-5 0-5*5 0-4*10 0-3*3 2-0*4 1-0', PIN_LIST))
+        self.assertNotEqual(key_hash(LUGS, PIN_LIST), lug_hash(LUGS))
+        self.assertNotEqual(key_hash(LUGS, PIN_LIST), pin_hash(PIN_LIST))
+
+
+class KeyIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.hashes = np.random.default_rng(5).integers(0, 2**64, 1000, dtype=np.uint64)
+        self.index = KeyIndex(self.hashes[:500])
+
+    def test_contains(self):
+
+        self.assertEqual(len(self.index), 500)
+        self.assertTrue(self.hashes[0] in self.index)
+        self.assertTrue(int(self.hashes[499]) in self.index)
+        self.assertFalse(self.hashes[500] in self.index)
+
+        found = self.index.contains(self.hashes)
+        self.assertTrue(found[:500].all())
+        self.assertFalse(found[500:].any())
+
+    def test_add(self):
+
+        self.assertFalse(self.index.add(self.hashes[10]))
+        self.assertTrue(self.index.add(self.hashes[600]))
+        self.assertFalse(self.index.add(self.hashes[600]))
+        self.assertTrue(self.hashes[600] in self.index)
+        self.assertEqual(len(self.index), 501)
+        self.assertTrue(self.index.contains(self.hashes[600:601])[0])
+
+        self.assertEqual(self.index.update(self.hashes[400:800]), 101)
+        self.assertEqual(len(self.index), 800)
+        self.assertEqual(self.index.update(self.hashes[[900, 900]]), 1)
+
+    def test_save_load(self):
+
+        self.index.add(self.hashes[700])
+        fd, fname = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            self.index.save(fname)
+            index = KeyIndex.load(fname)
+        finally:
+            os.remove(fname)
+
+        self.assertEqual(len(index), 501)
+        self.assertTrue((index.hashes[1:] > index.hashes[:-1]).all())
+        self.assertTrue(self.hashes[700] in index)
@@ -0,0 +1,85 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""Tests for the lug settings index."""
+
+import os
+import random
+import tempfile
+import unittest
+
+from ..generate import (KeyListGenError, check_overlaps, check_placement,
+                        check_lug_placement, build_lug_list)
+from ..lug_index import LugIndex, enumerate_overlaps, PAIRS
+from m209.drum import Drum
+
+
+SELECTIONS = [
+    [1, 2, 3, 4, 8, 10],
+    [1, 2, 3, 5, 7, 10],
+    [1, 2, 4, 6, 12, 13],
+]
+
+
+class LugIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = LugIndex.build(SELECTIONS)
+
+    def test_enumerate_overlaps(self):
+
+        distributions = enumerate_overlaps([1, 2, 3, 4, 8, 10])
+        self.assertEqual(len(distributions), len(set(distributions)))
+        for chunks in distributions:
+            overlaps = [(x, y, n) for (x, y), n in zip(PAIRS, chunks) if n]
+            self.assertEqual(sum(chunks), 1)
+            self.assertTrue(check_placement([1, 2, 3, 4, 8, 10], overlaps))
+
+    def test_count(self):
+
+        for selection in SELECTIONS:
+            self.assertEqual(self.index.count(selection),
+                             len(enumerate_overlaps(selection)))
+        self.assertEqual(self.index.count([10, 8, 4, 3, 2, 1]),
+                         self.index.count([1, 2, 3, 4, 8, 10]))
+        self.assertRaises(KeyListGenError, self.index.count, [1, 2, 3, 4, 5, 13])
+
+    def test_draw(self):
+
+        for n in range(200):
+            selection = list(random.choice(SELECTIONS))
+            random.shuffle(selection)
+            overlaps = self.index.draw_overlaps(selection)
+            self.assertTrue(check_overlaps(overlaps))
+
+            remaining = list(selection)
+            for x, y, n in overlaps:
+                remaining[x] -= n
+                remaining[y] -= n
+            self.assertTrue(min(remaining) >= 0)
+            self.assertEqual(sum(selection) - sum(n for x, y, n in overlaps), 27)
+
+            drum = Drum(build_lug_list(selection, overlaps))
+            self.assertTrue(check_lug_placement(drum))
+
+    def test_unsolvable(self):
+
+        index = LugIndex.build([[1, 2, 2, 4, 11, 13], [1, 2, 3, 4, 8, 10]])
+        self.assertEqual(index.unsolvable(), [[1, 2, 2, 4, 11, 13]])
+        self.assertRaises(KeyListGenError, index.draw, [13, 11, 4, 2, 2, 1])
+
+    def test_save_load(self):
+
+        fd, fname = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        try:
+            self.index.save(fname)
+            index = LugIndex.load(fname)
+        finally:
+            os.remove(fname)
+
+        self.assertEqual(len(index), len(self.index))
+        self.assertEqual(index.offsets.tolist(), self.index.offsets.tolist())
+        self.assertEqual(index.overlaps.tolist(), self.index.overlaps.tolist())
+        self.assertEqual(index.rows, self.index.rows)
@@ -0,0 +1,64 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""Tests for the batch pin list generator."""
+
+import unittest
+
+import numpy as np
+
+from ..generate import pin_list_check
+from ..pin_batch import (random_pin_matrix, pin_matrix_check,
+                         generate_pin_matrix, pin_lists)
+from m209.data import KEY_WHEEL_DATA
+from m209.keystream import pin_bits, TOTAL_PINS
+
+
+class PinBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(17)
+
+    def test_pin_matrix_check(self):
+
+        bits = random_pin_matrix(2000, self.rng)
+        self.assertEqual(bits.shape, (2000, TOTAL_PINS))
+        valid = pin_matrix_check(bits)
+        for pin_list, ok in zip(pin_lists(bits), valid):
+            self.assertEqual(pin_list_check(pin_list), ok)
+
+    def test_pin_matrix_check_limits(self):
+
+        all_pins = [letters for letters, _ in KEY_WHEEL_DATA]
+        no_pins = [''] * 6
+        valid_pin_list = [
+            'FGIKOPRSUVWYZ',
+            'DFGKLMOTUY',
+            'ADEFGIORTUVX',
+            'ACFGHILMRSU',
+            'BCDEFJKLPS',
+            'EFGHIJLMNP'
+        ]
+        # 7 consecutive effective pins with wrap-around on the last wheel:
+        wrapped = valid_pin_list[:5] + ['ABCDEGIKMPQ']
+        bits = [pin_bits(p) for p in (all_pins, no_pins, valid_pin_list, wrapped)]
+        self.assertEqual(pin_matrix_check(bits).tolist(), [False, False, True, False])
+        self.assertFalse(pin_list_check(wrapped))
+
+    def test_generate_pin_matrix(self):
+
+        bits = generate_pin_matrix(500, self.rng)
+        self.assertEqual(bits.shape, (500, TOTAL_PINS))
+        self.assertTrue(pin_matrix_check(bits).all())
+        for pin_list, row in zip(pin_lists(bits), bits):
+            self.assertTrue(pin_list_check(pin_list))
+            self.assertEqual(pin_bits(pin_list).tolist(), row.tolist())
+
+        self.assertEqual(generate_pin_matrix(0).shape, (0, TOTAL_PINS))
+
+    def test_seed(self):
+
+        a = generate_pin_matrix(10, np.random.default_rng(1))
+        b = generate_pin_matrix(10, np.random.default_rng(1))
+        self.assertEqual(a.tolist(), b.tolist())
@@ -0,0 +1,323 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains a NumPy based keystream engine for the M-209
+simulation.
+
+The M209 class simulates the converter one letter at a time. When only the
+sequence of drum counts (the displacement values, or keystream) is needed, it is
+much faster to compute the state of every key wheel for all letter positions at
+once and then evaluate the drum against the whole sequence.
+
+The values returned here are the raw drum counts (0-27) as produced by
+Drum.rotate(). The substitution actually applied to a letter depends only on the
+count modulo 26.
+
+The encrypt_bytes() and decrypt_bytes() functions provide a bulk mode for
+M209.encrypt() and M209.decrypt(). They compute the keystream for the whole text
+first and then apply the substitution to every letter with array arithmetic.
+
+Many keys can be processed at once with batch_keystream(). For this purpose
+a key is described by two arrays:
+
+    * a lug count vector of NUM_LUG_TYPES integers, giving the number of bars
+      for each entry of LUG_TYPES (see lug_counts())
+    * a pin bit vector of TOTAL_PINS integers, 1 for an effective pin and
+      0 otherwise, wheel by wheel in key wheel letter order (see pin_bits())
+
+"""
+import itertools
+
+import numpy as np
+
+from . import M209Error
+from .data import KEY_WHEEL_DATA
+from .drum import Drum, lug_mask
+from .key_wheel import KeyWheel, KeyWheelError
+
+SPACE = ord(' ')
+LETTER_A = ord('A')
+LETTER_Z = ord('Z')
+
+# Number of letters (and pins) on each key wheel, from left to right:
+WHEEL_SIZES = [len(letters) for letters, _ in KEY_WHEEL_DATA]
+
+# Total number of pins on all 6 wheels:
+TOTAL_PINS = sum(WHEEL_SIZES)
+
+# Index of the first pin of each key wheel in a pin bit vector:
+WHEEL_OFFSETS = [sum(WHEEL_SIZES[:n]) for n in range(len(WHEEL_SIZES))]
+
+# Offset of the pin under the guide arm when the first letter is displayed:
+GUIDE_OFFSETS = [letters.index(guide) for letters, guide in KEY_WHEEL_DATA]
+
+# All distinct bars that have at least one lug in a non-neutral position: the
+# 6 bars with a single lug followed by the 15 overlap pairs. Each entry is in
+# the 0-based 1 or 2-tuple form used by Drum.bars.
+LUG_TYPES = [(n, ) for n in range(6)] + list(itertools.combinations(range(6), 2))
+NUM_LUG_TYPES = len(LUG_TYPES)
+LUG_TYPE_INDEX = {lug_pair: n for n, lug_pair in enumerate(LUG_TYPES)}
+
+# LUG_TYPE_MASKS[t, m] is 1 if a bar of lug type t is shifted when the guide arm
+# mask is m:
+LUG_TYPE_MASKS = np.array([[1 if lug_mask(lug_pair) & mask else 0
+                            for mask in range(Drum.NUM_MASKS)]
+                           for lug_pair in LUG_TYPES], dtype=np.uint16)
+
+
+def make_drum(lugs):
+    """Returns a Drum instance for the given lugs parameter.
+
+    The lugs parameter may be a Drum instance, a key list string or a lug list
+    as described by M209.set_drum_lugs().
+
+    """
+    if isinstance(lugs, Drum):
+        return lugs
+    if isinstance(lugs, str):
+        return Drum.from_key_list(lugs)
+    return Drum(lugs)
+
+
+def wheel_positions(key_wheels):
+    """Returns a list of the 6 0-based key wheel positions for the six letter
+    string key_wheels, in left to right order.
+
+    May raise KeyWheelError if a letter is not valid for its key wheel.
+
+    """
+    if len(key_wheels) != len(KEY_WHEEL_DATA):
+        raise M209Error("Invalid key wheels setting length")
+
+    positions = []
+    for n, (c, (letters, _)) in enumerate(zip(key_wheels, KEY_WHEEL_DATA)):
+        pos = letters.find(c)
+        if pos < 0:
+            raise KeyWheelError('wheel #{}: Invalid position {}'.format(n, c))
+        positions.append(pos)
+    return positions
+
+
+def lug_counts(lugs):
+    """Returns the lug count vector for the given lugs parameter (see
+    make_drum()) as a uint8 array of NUM_LUG_TYPES elements.
+
+    """
+    counts = np.zeros(NUM_LUG_TYPES, dtype=np.uint8)
+    for lug_pair in make_drum(lugs).bars:
+        counts[LUG_TYPE_INDEX[tuple(sorted(lug_pair))]] += 1
+    return counts
+
+
+def pin_bits(pin_list):
+    """Returns the pin bit vector for pin_list as a uint8 array of TOTAL_PINS
+    elements.
+
+    The pin_list parameter must either be None or a 6-element list as accepted
+    by M209.set_all_pins().
+
+    """
+    if pin_list is None:
+        pin_list = [None] * len(KEY_WHEEL_DATA)
+    elif len(pin_list) != len(KEY_WHEEL_DATA):
+        raise M209Error("pin_bits(): invalid pin_list length")
+
+    bits = np.zeros(TOTAL_PINS, dtype=np.uint8)
+    for n, ((letters, guide_letter), pins) in enumerate(zip(KEY_WHEEL_DATA, pin_list)):
+        kw = KeyWheel(letters, guide_letter, pins)
+        bits[WHEEL_OFFSETS[n]:WHEEL_OFFSETS[n] + WHEEL_SIZES[n]] = kw.pins
+    return bits
+
+
+def count_tables(counts):
+    """Returns the drum count tables for an (N, NUM_LUG_TYPES) array of lug
+    count vectors as an (N, Drum.NUM_MASKS) uint8 array. Row n is identical to
+    the count_table of a Drum built from the n-th lug count vector.
+
+    """
+    counts = np.asarray(counts, dtype=np.uint16)
+    return (counts @ LUG_TYPE_MASKS).astype(np.uint8)
+
+
+def batch_keystream(counts, bits, positions=None, length=26):
+    """Returns the drum counts for N keys at once as an (N, length) uint8
+    array.
+
+    counts - an (N, NUM_LUG_TYPES) array of lug count vectors
+
+    bits - an (N, TOTAL_PINS) array of pin bit vectors
+
+    positions - an (N, 6) array of 0-based starting key wheel positions as
+    returned by wheel_positions(). If None, all key wheels start at 'A'.
+
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    tables = count_tables(counts)
+    num_keys = len(tables)
+
+    if bits.shape != (num_keys, TOTAL_PINS):
+        raise M209Error("batch_keystream(): invalid pin bits shape")
+    if positions is None:
+        positions = np.zeros((num_keys, len(KEY_WHEEL_DATA)), dtype=np.intp)
+    else:
+        positions = np.asarray(positions, dtype=np.intp)
+        if positions.shape != (num_keys, len(KEY_WHEEL_DATA)):
+            raise M209Error("batch_keystream(): invalid positions shape")
+
+    # Each key wheel only has WHEEL_SIZES[n] distinct states, so compute one
+    # period of the pins passing under its guide arm and repeat it over the
+    # message length. This gives the 6-bit guide arm mask for every key and
+    # letter position; the drum counts are then looked up in the count tables:
+    masks = np.zeros((num_keys, length), dtype=np.uint8)
+    for n, size in enumerate(WHEEL_SIZES):
+        wheel_bits = bits[:, WHEEL_OFFSETS[n]:WHEEL_OFFSETS[n] + size]
+        index = (positions[:, n, None] + GUIDE_OFFSETS[n] + np.arange(size)) % size
+        period = np.take_along_axis(wheel_bits, index, axis=1) << n
+        masks |= np.tile(period, -(-length // size))[:, :length]
+
+    return np.take_along_axis(tables, masks.astype(np.intp), axis=1)
+
+
+def keystream(lugs, pin_list, key_wheels='AAAAAA', length=26):
+    """Returns the sequence of drum counts as a uint8 array of the given
+    length.
+
+    lugs - the drum settings; see make_drum()
+
+    pin_list - the key wheel pin settings as accepted by M209.set_all_pins()
+
+    key_wheels - a six letter string giving the starting position of the key
+    wheels, as accepted by M209.set_key_wheels()
+
+    The result is identical to the counts an M209 instance produces when
+    enciphering length letters after calling set_key_wheels(key_wheels).
+
+    """
+    positions = [wheel_positions(key_wheels)]
+    return batch_keystream([lug_counts(lugs)], [pin_bits(pin_list)],
+                           positions, length)[0]
+
+
+class KeySchedule:
+    """Holds everything needed to generate keystreams for one key: one period
+    of guide arm bits for each key wheel and the drum count table.
+
+    wheel_bits[n][i] is 1 if the pin under the guide arm is effective when key
+    wheel n displays its i-th letter. Building a KeySchedule does all of the
+    setup work for a key once, so that keystream() only has to index into these
+    arrays. See m209.cache for a cache of KeySchedule objects.
+
+    """
+    __slots__ = ['wheel_bits', 'count_table']
+
+    def __init__(self, lugs, pin_list):
+        """Build a KeySchedule for the given lugs (see make_drum()) and
+        pin_list (as accepted by M209.set_all_pins()).
+
+        """
+        bits = pin_bits(pin_list)
+        self.wheel_bits = [np.roll(bits[offset:offset + size], -guide)
+                           for offset, size, guide in zip(
+                               WHEEL_OFFSETS, WHEEL_SIZES, GUIDE_OFFSETS)]
+        self.count_table = np.array(make_drum(lugs).count_table, dtype=np.uint8)
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the arrays of this schedule."""
+        return self.count_table.nbytes + sum(a.nbytes for a in self.wheel_bits)
+
+    def keystream(self, key_wheels='AAAAAA', length=26):
+        """Returns the drum counts for length letters starting at the six
+        letter key wheel setting key_wheels, as a uint8 array. The result is the
+        same as the keystream() function returns for this key.
+
+        """
+        steps = np.arange(length)
+        masks = np.zeros(length, dtype=np.uint8)
+        for n, (bits, pos) in enumerate(zip(self.wheel_bits,
+                                            wheel_positions(key_wheels))):
+            masks |= np.take(bits, steps + pos, mode='wrap') << n
+
+        return self.count_table[masks]
+
+
+def machine_keystream(m_209, length):
+    """Returns the drum counts an M209 instance will produce for the next
+    length letters, as a uint8 array. The machine is not changed.
+
+    """
+    masks = np.zeros(length, dtype=np.uint8)
+    for n, kw in enumerate(m_209.key_wheels):
+        bits = (kw.bits >> np.arange(kw.num_pins)) & 1
+        index = (kw.pos + kw.guide_offset + np.arange(length)) % kw.num_pins
+        masks |= (bits[index] << n).astype(np.uint8)
+
+    return np.array(m_209.drum.count_table, dtype=np.uint8)[masks]
+
+
+def group_bytes(letters, n=5):
+    """Groups the uint8 array letters into n-letter groups separated by spaces
+    and returns the result as a uint8 array. This is the bytes equivalent of
+    m209.utils.group_text().
+
+    """
+    size = len(letters)
+    if size == 0:
+        return letters
+    out = np.full(size + (size - 1) // n, SPACE, dtype=np.uint8)
+    index = np.arange(size)
+    out[index + index // n] = letters
+    return out
+
+
+def _cipher_bytes(m_209, letters):
+    """Internal function to perform the cipher operation on the uint8 array
+    of letters with the M209 instance m_209. The letters are validated, the
+    machine is advanced past them and the output letters are returned as
+    a uint8 array.
+
+    """
+    illegal = (letters < LETTER_A) | (letters > LETTER_Z)
+    if illegal.any():
+        raise M209Error("Illegal char: {}".format(chr(letters[illegal.argmax()])))
+
+    counts = machine_keystream(m_209, len(letters))
+    m_209.seek(len(letters))
+
+    offsets = (letters.astype(np.int16) - LETTER_A - counts) % 26
+    return (LETTER_Z - offsets).astype(np.uint8)
+
+
+def encrypt_bytes(m_209, plaintext, group=True, spaces=True):
+    """Performs an encrypt operation on the given bytes or bytearray plaintext
+    with the M209 instance m_209 and returns the ciphertext as bytes.
+
+    The group and spaces parameters and the result are as for M209.encrypt().
+
+    """
+    letters = np.frombuffer(bytes(plaintext), dtype=np.uint8)
+    if spaces:
+        letters = np.where(letters == SPACE, LETTER_Z, letters).astype(np.uint8)
+
+    ciphertext = _cipher_bytes(m_209, letters)
+    if group:
+        ciphertext = group_bytes(ciphertext)
+    return ciphertext.tobytes()
+
+
+def decrypt_bytes(m_209, ciphertext, spaces=True, z_sub=True):
+    """Performs a decrypt operation on the given bytes or bytearray ciphertext
+    with the M209 instance m_209 and returns the plaintext as bytes.
+
+    The spaces and z_sub parameters and the result are as for M209.decrypt().
+
+    """
+    letters = np.frombuffer(bytes(ciphertext), dtype=np.uint8)
+    if spaces:
+        letters = letters[letters != SPACE]
+
+    plaintext = _cipher_bytes(m_209, letters)
+    if z_sub:
+        plaintext[plaintext == LETTER_Z] = SPACE
+    return plaintext.tobytes()
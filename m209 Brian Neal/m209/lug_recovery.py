@@ -0,0 +1,207 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module recovers the lug settings from a known keystream and estimates
+of the pins.
+
+The drum count of a letter is the number of bars with a lug against an active
+guide arm. Bars of the same lug type (see m209.keystream.LUG_TYPES) behave
+alike, so the count is a linear function of the lug count vector x:
+
+    count[i] = sum over t of A[i, t] * x[t]
+
+where A[i, t] is 1 if a bar of lug type t is shifted at letter i. Given pin
+probabilities p (1 for a pin known to be effective, 0 for one known to be
+ineffective), A[i, t] is replaced by its expectation: the probability that the
+pin of key wheel w under its guide arm at letter i is effective for the
+single lug types (w, ), and 1 - (1 - p_a) * (1 - p_b) for the overlap types
+(a, b). The known keystream gives the count modulo 26; since counts are at most
+27 this is the count itself, except for 0 and 1, which might also be 26 and 27.
+Those letters are left out.
+
+recover_lugs() solves the non-negative least squares problem for x with the
+number of bars as an additional, heavily weighted equation, rounds the solution
+to whole bars and then moves single bars as long as this lowers the aggregate
+displacement error (see m209.scoring). The result is a key list lug string that
+can be passed to Drum.from_key_list():
+
+    lugs = recover_lugs(keystream, probabilities)
+    drum = Drum.from_key_list(lugs)
+
+"""
+
+import numpy as np
+
+from . import M209Error
+from .drum import Drum
+from .keystream import (GUIDE_OFFSETS, LUG_TYPES, NUM_LUG_TYPES, TOTAL_PINS,
+                        WHEEL_OFFSETS, WHEEL_SIZES, wheel_positions)
+from .scoring import DISPLACEMENT_ERRORS, KeystreamScore
+
+
+# Weight of the equation for the number of bars relative to a letter:
+BAR_WEIGHT = 100.0
+
+MAX_NNLS_ITERATIONS = 200
+MAX_POLISH_SWEEPS = 100
+
+
+def guide_arm_probabilities(probabilities, length, key_wheels='AAAAAA'):
+    """Returns a (length, 6) array; entry [i, n] is the probability that the
+    pin of key wheel n under its guide arm at letter i is effective.
+
+    probabilities - an array of TOTAL_PINS pin probabilities, or a pin bit
+    vector, in the order of m209.keystream.pin_bits()
+
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if probabilities.shape != (TOTAL_PINS, ):
+        raise M209Error("guide_arm_probabilities(): invalid probabilities shape")
+
+    steps = np.arange(length)
+    result = np.empty((length, len(WHEEL_SIZES)))
+    for n, (pos, offset, size, guide) in enumerate(zip(
+            wheel_positions(key_wheels), WHEEL_OFFSETS, WHEEL_SIZES, GUIDE_OFFSETS)):
+        result[:, n] = probabilities[offset + (steps + pos + guide) % size]
+    return result
+
+
+def design_matrix(probabilities, length, key_wheels='AAAAAA'):
+    """Returns the (length, NUM_LUG_TYPES) matrix of the expected number of
+    shifted bars per bar of every lug type, for every letter. See
+    guide_arm_probabilities() for the parameters.
+
+    """
+    p = guide_arm_probabilities(probabilities, length, key_wheels)
+    columns = []
+    for lug_type in LUG_TYPES:
+        if len(lug_type) == 1:
+            columns.append(p[:, lug_type[0]])
+        else:
+            a, b = lug_type
+            columns.append(1.0 - (1.0 - p[:, a]) * (1.0 - p[:, b]))
+    return np.stack(columns, axis=1)
+
+
+def nnls(a, b, max_iterations=MAX_NNLS_ITERATIONS):
+    """Returns the x >= 0 that minimizes ||a x - b|| by the active set method
+    of Lawson and Hanson.
+
+    """
+    m, n = a.shape
+    x = np.zeros(n)
+    passive = np.zeros(n, dtype=bool)
+    tolerance = 10 * np.finfo(np.float64).eps * np.linalg.norm(a, 1) * max(m, n)
+
+    for _ in range(max_iterations):
+        w = a.T @ (b - a @ x)
+        if passive.all() or (w[~passive] <= tolerance).all():
+            break
+        passive[np.argmax(np.where(passive, -np.inf, w))] = True
+
+        while True:
+            z = np.zeros(n)
+            z[passive] = np.linalg.lstsq(a[:, passive], b, rcond=None)[0]
+            if (z[passive] > 0).all():
+                x = z
+                break
+            # Step back to the boundary and drop the variables that reach 0:
+            shrinking = passive & (z <= 0)
+            alpha = np.min(x[shrinking] / (x[shrinking] - z[shrinking]))
+            x = x + alpha * (z - x)
+            passive &= x > tolerance
+            x[~passive] = 0
+    return x
+
+
+def round_counts(x, num_bars):
+    """Rounds the non-negative vector x to whole bars that sum up to
+    num_bars, by largest remainder.
+
+    """
+    x = np.maximum(np.asarray(x, dtype=np.float64), 0)
+    if x.sum() > 0:
+        x = x * (num_bars / x.sum())
+    counts = np.floor(x).astype(np.intp)
+    remainders = x - counts
+    # If x is all zeros, more bars than lug types may be left; deal them out
+    # in rounds:
+    order = np.argsort(-remainders, kind='stable')
+    np.add.at(counts, np.resize(order, num_bars - counts.sum()), 1)
+    return counts
+
+
+def polish_counts(score, max_sweeps=MAX_POLISH_SWEEPS):
+    """Moves single bars of the KeystreamScore score to other lug types as long
+    as the best move lowers the error. Returns the number of bars moved.
+
+    """
+    moves = 0
+    for _ in range(max_sweeps):
+        best = (score.error, None, None)
+        for source in np.flatnonzero(score.counts):
+            for target in range(NUM_LUG_TYPES):
+                if target != source:
+                    error = score.lug_move_error(source, target)
+                    if error < best[0]:
+                        best = (error, source, target)
+        if best[1] is None:
+            break
+        score.move_lug(best[1], best[2])
+        moves += 1
+    return moves
+
+
+def lug_key_list(counts):
+    """Returns the key list lug string of a lug count vector."""
+
+    bars = [lug_type for lug_type, count in zip(LUG_TYPES, counts)
+            for _ in range(int(count))]
+    return Drum(bars).to_key_list()
+
+
+def recover_counts(keystream, probabilities, key_wheels='AAAAAA',
+                   num_bars=Drum.NUM_BARS, polish=True):
+    """Returns the lug count vector that best explains the known keystream
+    given the pin probabilities, as a NUM_LUG_TYPES int array.
+
+    keystream - the known drum counts, or the counts modulo 26
+
+    probabilities - TOTAL_PINS pin probabilities or a pin bit vector
+
+    key_wheels - the key wheel setting at the first keystream letter
+
+    num_bars - the number of bars with at least one lug in a non-neutral
+    position; 27 for keys made by the key list generator
+
+    polish - if True, the rounded least squares solution is improved by moving
+    single bars against the rounded pins
+
+    """
+    residues = np.asarray(keystream, dtype=np.intp) % 26
+    a = design_matrix(probabilities, len(residues), key_wheels)
+
+    # Counts of 0 and 1 might also be 26 and 27; leave these letters out:
+    known = residues >= 2
+    a = np.vstack([a[known], np.full((1, NUM_LUG_TYPES), BAR_WEIGHT)])
+    b = np.append(residues[known].astype(np.float64), BAR_WEIGHT * num_bars)
+
+    counts = round_counts(nnls(a, b), num_bars)
+    if polish:
+        bits = np.asarray(probabilities, dtype=np.float64) >= 0.5
+        score = KeystreamScore(residues, counts, bits, key_wheels,
+                               DISPLACEMENT_ERRORS)
+        polish_counts(score)
+        counts = score.counts
+    return counts
+
+
+def recover_lugs(keystream, probabilities, key_wheels='AAAAAA',
+                 num_bars=Drum.NUM_BARS, polish=True):
+    """Returns the recovered lug settings as a key list string, as accepted
+    by Drum.from_key_list(). See recover_counts() for the parameters.
+
+    """
+    return lug_key_list(recover_counts(keystream, probabilities, key_wheels,
+                                       num_bars, polish))
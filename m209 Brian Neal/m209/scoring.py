@@ -0,0 +1,186 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""This module contains incremental scoring of a key against a known keystream.
+
+A search over keys changes one pin or moves the lug of one bar at a time, and
+re-simulating the whole message after every move is wasteful:
+
+    * a pin of key wheel n is only under the guide arm at every
+      WHEEL_SIZES[n]-th letter, so flipping it only changes the guide arm mask
+      of those letters
+    * moving a lug only changes the 64 entry drum count table; the guide arm
+      masks stay the same
+
+The KeystreamScore class keeps, for every guide arm mask m and drum count c,
+the total error cost[m, c] of the letters with mask m if the drum produced c
+for them. The error of a key is then the sum of cost[m, table[m]] over the 64
+masks, so the error after a lug move is computed from 64 entries, and the
+error after a pin flip from the letters under that pin. Both can be evaluated
+without changing the key, and applied when the move is accepted:
+
+    score = KeystreamScore(counts, lug_counts(lugs), pin_bits(pin_list))
+    if score.pin_flip_error(pin) < score.error:
+        score.flip_pin(pin)
+
+Only the drum count modulo 26 can be recovered from a known plaintext, so the
+known keystream is compared modulo 26. The error of a letter is given by an
+error table indexed by the known count modulo 26 and the simulated count:
+MISMATCH_ERRORS counts the letters that differ, DISPLACEMENT_ERRORS also
+measures how far off a count is.
+
+"""
+
+import numpy as np
+
+from . import M209Error
+from .drum import Drum
+from .keystream import (GUIDE_OFFSETS, LUG_TYPE_MASKS, NUM_LUG_TYPES,
+                        TOTAL_PINS, WHEEL_SIZES, count_tables, wheel_positions)
+
+
+# Drum counts range from 0 to 27:
+NUM_COUNTS = Drum.NUM_BARS + 1
+
+# MISMATCH_ERRORS[r, c] is 1 if the count c does not give the substitution of
+# a known count r modulo 26:
+MISMATCH_ERRORS = np.array([[0 if c % 26 == r else 1 for c in range(NUM_COUNTS)]
+                            for r in range(26)], dtype=np.int64)
+
+# DISPLACEMENT_ERRORS[r, c] is the distance of the count c from the nearest
+# count that is congruent to r modulo 26:
+DISPLACEMENT_ERRORS = np.array([[min(abs(c - r), abs(c - r - 26)) for c in range(NUM_COUNTS)]
+                                for r in range(26)], dtype=np.int64)
+
+# The guide arm mask bit of every pin of a pin bit vector:
+PIN_MASK_BITS = np.repeat(1 << np.arange(len(WHEEL_SIZES)),
+                          WHEEL_SIZES).astype(np.uint8)
+
+_ALL_MASKS = np.arange(Drum.NUM_MASKS)
+
+
+def pin_steps(length, key_wheels='AAAAAA'):
+    """Returns a list of TOTAL_PINS int arrays. Entry p holds the letter
+    positions, out of length letters enciphered from the six letter key wheel
+    setting key_wheels, at which pin p of a pin bit vector is under its guide
+    arm.
+
+    """
+    steps = []
+    for pos, size, guide in zip(wheel_positions(key_wheels), WHEEL_SIZES,
+                                GUIDE_OFFSETS):
+        for pin in range(size):
+            steps.append(np.arange((pin - pos - guide) % size, length, size))
+    return steps
+
+
+class KeystreamScore:
+    """Holds a key and its error against a known keystream, and updates the
+    error incrementally when a pin is flipped or a lug is moved.
+
+    The key is given as a lug count vector and a pin bit vector, as returned
+    by m209.keystream.lug_counts() and m209.keystream.pin_bits(). The error is
+    available in the error attribute; it is 0 if the key reproduces the known
+    keystream.
+
+    """
+    def __init__(self, keystream, counts, bits, key_wheels='AAAAAA',
+                 errors=MISMATCH_ERRORS):
+        """Builds the score of a key.
+
+        keystream - the known drum counts, or the counts modulo 26
+
+        counts - the lug count vector of the key
+
+        bits - the pin bit vector of the key
+
+        key_wheels - the key wheel setting at the first keystream letter
+
+        errors - a (26, NUM_COUNTS) table of the error of every simulated
+        count for every known count modulo 26
+
+        """
+        self.residues = np.asarray(keystream, dtype=np.intp) % 26
+        self.counts = np.array(counts, dtype=np.intp)
+        self.bits = np.array(bits, dtype=np.uint8)
+        if self.counts.shape != (NUM_LUG_TYPES, ):
+            raise M209Error("KeystreamScore: invalid lug count vector")
+        if self.bits.shape != (TOTAL_PINS, ):
+            raise M209Error("KeystreamScore: invalid pin bit vector")
+
+        self.errors = np.asarray(errors, dtype=np.int64)
+        self.steps = pin_steps(len(self.residues), key_wheels)
+        self.table = count_tables([self.counts])[0].astype(np.intp)
+
+        self.masks = np.zeros(len(self.residues), dtype=np.uint8)
+        for pin in np.flatnonzero(self.bits):
+            self.masks[self.steps[pin]] |= PIN_MASK_BITS[pin]
+
+        self.cost = np.zeros((Drum.NUM_MASKS, NUM_COUNTS), dtype=np.int64)
+        np.add.at(self.cost, self.masks, self.errors[self.residues])
+        self.error = int(self.cost[_ALL_MASKS, self.table].sum())
+
+    def keystream(self):
+        """Returns the drum counts of the current key as a uint8 array."""
+
+        return self.table[self.masks].astype(np.uint8)
+
+    def matches(self):
+        """Returns the number of letters the current key enciphers like the
+        known keystream.
+
+        """
+        return int(np.count_nonzero(self.table[self.masks] % 26 == self.residues))
+
+    def _flip(self, pin):
+        steps = self.steps[pin]
+        old = self.masks[steps]
+        return steps, old, old ^ PIN_MASK_BITS[pin]
+
+    def pin_flip_error(self, pin):
+        """Returns the error the key would have if pin (an index into the pin
+        bit vector) were flipped. The key is not changed.
+
+        """
+        steps, old, new = self._flip(pin)
+        errors = self.errors[self.residues[steps]]
+        rows = np.arange(len(steps))
+        return self.error + int((errors[rows, self.table[new]] -
+                                 errors[rows, self.table[old]]).sum())
+
+    def flip_pin(self, pin):
+        """Flips pin and returns the new error."""
+
+        steps, old, new = self._flip(pin)
+        errors = self.errors[self.residues[steps]]
+        self.error = self.pin_flip_error(pin)
+        np.subtract.at(self.cost, old, errors)
+        np.add.at(self.cost, new, errors)
+        self.masks[steps] = new
+        self.bits[pin] ^= 1
+        return self.error
+
+    def _moved_table(self, source, target):
+        if self.counts[source] <= 0:
+            raise M209Error("KeystreamScore: no bar of lug type {}".format(source))
+        return self.table + LUG_TYPE_MASKS[target] - LUG_TYPE_MASKS[source]
+
+    def lug_move_error(self, source, target):
+        """Returns the error the key would have if one bar of lug type source
+        were changed to lug type target (indices into LUG_TYPES). The key is
+        not changed.
+
+        """
+        return int(self.cost[_ALL_MASKS, self._moved_table(source, target)].sum())
+
+    def move_lug(self, source, target):
+        """Changes one bar of lug type source to lug type target and returns
+        the new error.
+
+        """
+        self.table = self._moved_table(source, target)
+        self.counts[source] -= 1
+        self.counts[target] += 1
+        self.error = int(self.cost[_ALL_MASKS, self.table].sum())
+        return self.error
@@ -0,0 +1,108 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""test_cache.py - Unit tests for the key schedule cache."""
+
+import unittest
+
+from ..cache import KeyCache, cache_key, cached_keystream, ENTRY_OVERHEAD
+from ..drum import Drum
+from ..keystream import KeySchedule, keystream
+from ..keylist.generate import generate_key_list
+
+
+AA_LUGS = '0-4 0-5*4 0-6*6 1-0*5 1-2 1-5*4 3-0*3 3-4 3-6 5-6'
+
+AA_PIN_LIST = [
+    'FGIKOPRSUVWYZ',
+    'DFGKLMOTUY',
+    'ADEFGIORTUVX',
+    'ACFGHILMRSU',
+    'BCDEFJKLPS',
+    'EFGHIJLMNP'
+]
+
+
+class KeyCacheTestCase(unittest.TestCase):
+
+    def test_cache_key(self):
+
+        reordered_lugs = ' '.join(reversed(AA_LUGS.split()))
+        reordered_pins = [''.join(reversed(pins)) for pins in AA_PIN_LIST]
+        self.assertEqual(cache_key(AA_LUGS, AA_PIN_LIST),
+                         cache_key(reordered_lugs, reordered_pins))
+        self.assertEqual(cache_key([(0, 1), (2, )], None),
+                         cache_key([(2, ), (1, 0)], None))
+        self.assertNotEqual(cache_key(AA_LUGS, AA_PIN_LIST),
+                            cache_key(AA_LUGS, AA_PIN_LIST[:5] + ['']))
+
+        # Equivalent ways of writing the same drum:
+        self.assertEqual(cache_key('1-2*2', None), cache_key('1-2 1-2', None))
+        self.assertEqual(cache_key('0-1', None), cache_key('1-0', None))
+        self.assertEqual(cache_key('1-0', None), cache_key([(0, )], None))
+        self.assertEqual(cache_key(AA_LUGS, None),
+                         cache_key(Drum.from_key_list(AA_LUGS), None))
+        self.assertNotEqual(cache_key('1-2', None), cache_key('1-3', None))
+
+    def test_equivalent_keys_hit(self):
+
+        cache = KeyCache()
+        first = cache.get('1-2*2 3-0', AA_PIN_LIST)
+        second = cache.get('0-3 2-1 1-2', AA_PIN_LIST)
+        self.assertIs(first, second)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_schedule_keystream(self):
+
+        for _ in range(10):
+            key_list = generate_key_list('AA')
+            schedule = KeySchedule(key_list.lugs, key_list.pin_list)
+            for wheels in ['AAAAAA', 'ZYXUSQ', 'MGBKDA']:
+                self.assertEqual(
+                    keystream(key_list.lugs, key_list.pin_list, wheels, 300).tolist(),
+                    schedule.keystream(wheels, 300).tolist())
+
+    def test_hits(self):
+
+        cache = KeyCache()
+        s1 = cache.get(AA_LUGS, AA_PIN_LIST)
+        s2 = cache.get(AA_LUGS, list(AA_PIN_LIST))
+        self.assertIs(s1, s2)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.nbytes)
+
+    def test_eviction(self):
+
+        size = KeySchedule(AA_LUGS, AA_PIN_LIST).nbytes + ENTRY_OVERHEAD
+        cache = KeyCache(max_bytes=3 * size)
+        key_lists = [generate_key_list('AA') for _ in range(5)]
+        for key_list in key_lists:
+            cache.get(key_list.lugs, key_list.pin_list)
+
+        self.assertEqual(3, len(cache))
+        self.assertTrue(cache.nbytes <= 3 * size)
+
+        # the least recently used entries are gone
+        cache.get(key_lists[0].lugs, key_lists[0].pin_list)
+        self.assertEqual(6, cache.misses)
+        cache.get(key_lists[4].lugs, key_lists[4].pin_list)
+        self.assertEqual(1, cache.hits)
+
+        cache.set_max_bytes(0)
+        self.assertEqual(1, len(cache))
+
+    def test_cached_keystream(self):
+
+        cache = KeyCache()
+        for wheels in ['AAAAAA', 'BBBBBB']:
+            self.assertEqual(
+                keystream(AA_LUGS, AA_PIN_LIST, wheels, 100).tolist(),
+                cached_keystream(AA_LUGS, AA_PIN_LIST, wheels, 100,
+                                 cache=cache).tolist())
+        self.assertEqual(1, cache.hits)
@@ -177,3 +177,44 @@ class M209TestCase(unittest.TestCase):
 
         self.assertEqual(settings.lugs, AA_LUGS)
         self.assertEqual(settings.pin_list, AA_PIN_LIST)
+
+    def test_seek(self):
+
+        pt = 'A' * 200
+        wheels = 'YGXREL'
+
+        m1 = M209(AA_LUGS, AA_PIN_LIST)
+        m1.set_key_wheels(wheels)
+        ct = m1.encrypt(pt, group=False)
+
+        for n in [0, 1, 25, 52, 104, 199]:
+            m2 = M209(AA_LUGS, AA_PIN_LIST)
+            m2.set_key_wheels(wheels)
+            m2.seek(n)
+            self.assertEqual(n, m2.letter_counter)
+            self.assertEqual(ct[n:], m2.encrypt(pt[n:], group=False))
+
+        self.assertRaises(M209Error, m1.seek, -1)
+
+    def test_keystream_at(self):
+
+        wheels = 'YGXREL'
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        m.set_key_wheels(wheels)
+        ct = m.encrypt('A' * 500, group=False)
+        expected = [(ord(c) - ord('Z')) % 26 for c in ct]
+
+        m.set_key_wheels(wheels)
+        m.letter_counter = 0
+        for start, length in [(0, 52), (52, 104), (300, 200), (499, 1), (10, 0)]:
+            counts = m.keystream_at(start, length)
+            self.assertEqual(length, len(counts))
+            self.assertEqual(expected[start:start + length],
+                             [count % 26 for count in counts])
+
+        # state is unchanged
+        self.assertEqual(0, m.letter_counter)
+        self.assertEqual(ct, m.encrypt('A' * 500, group=False))
+
+        self.assertRaises(M209Error, m.keystream_at, -1, 10)
+        self.assertRaises(M209Error, m.keystream_at, 0, -1)
@@ -6,7 +6,8 @@
 
 import unittest
 
-from ..drum import Drum, DrumError
+from ..drum import Drum, DrumError, pin_mask
+from ..keylist.data import ALL_DRUM_ROTATE_INPUTS
 
 
 class DrumTestCase(unittest.TestCase):
@@ -129,6 +130,30 @@ class DrumTestCase(unittest.TestCase):
         drum = Drum([(2, 4)] * 10)
         self.assertEqual(10, drum.rotate([False, False, False, False, True, False]))
 
+    def test_count_table(self):
+
+        drum = Drum.from_key_list('1-0*5 0-3*3 0-4 0-5*4 0-6*6 1-2 1-5*4 3-4 3-6 5-6')
+        self.assertEqual(Drum.NUM_MASKS, len(drum.count_table))
+        self.assertEqual(0, drum.rotate_mask(0))
+        self.assertEqual(Drum.NUM_BARS, drum.rotate_mask(63))
+
+        for pins in ALL_DRUM_ROTATE_INPUTS:
+            expected = 0
+            for lug_pair in drum.bars:
+                if any(pins[index] for index in lug_pair):
+                    expected += 1
+
+            mask = pin_mask(pins)
+            self.assertEqual(expected, drum.rotate_mask(mask))
+            self.assertEqual(expected, drum.rotate(pins))
+
+    def test_pin_mask(self):
+
+        self.assertEqual(0, pin_mask([False] * 6))
+        self.assertEqual(63, pin_mask([True] * 6))
+        self.assertEqual(1, pin_mask([True, False, False, False, False, False]))
+        self.assertEqual(40, pin_mask([False, False, False, True, False, True]))
+
     def test_to_key_list(self):
 
         drum = Drum.from_key_list('1-0*5 0-3*3 0-4 0-5*4 0-6*6 1-2 1-5*4 3-4 3-6 5-6')
@@ -72,6 +72,29 @@ class KeyWheelTestCase(unittest.TestCase):
                     self.assertFalse(kw.is_effective())
                 kw.rotate()
 
+    def test_bits(self):
+        letters = 'ABCDEFG'
+        kw = KeyWheel(letters, 'C', 'ADE')
+        self.assertEqual(0b11001, kw.bits)
+        self.assertEqual([True, False, False, True, True, False, False], kw.pins)
+        self.assertEqual('ADE', kw.effective_pins)
+
+        kw.reset_pins()
+        self.assertEqual(0, kw.bits)
+        self.assertEqual('', kw.effective_pins)
+
+        kw.set_pins('EDAA')
+        self.assertEqual(0b11001, kw.bits)
+        self.assertEqual('ADE', kw.effective_pins)
+        self.assertNotIn('effective_pins', KeyWheel.__slots__)
+
+    def test_shared_letters(self):
+        kw1 = KeyWheel(string.ascii_uppercase, 'P', 'ABC')
+        kw2 = KeyWheel(list(string.ascii_uppercase), 'F', 'XYZ')
+        self.assertIs(kw1.letters, kw2.letters)
+        self.assertIs(kw1.letter_offsets, kw2.letter_offsets)
+        self.assertRaises(AttributeError, setattr, kw1, 'foo', 1)
+
     def test_set_pins_bad(self):
         letters = 'ABCDEFG'
         kw = KeyWheel(letters, 'F')
@@ -99,6 +122,20 @@ class KeyWheelTestCase(unittest.TestCase):
                 self.assertTrue(c == kw.display())
                 kw.rotate(1)
 
+    def test_is_effective_at(self):
+        letters = 'ABCDEFG'
+        kw = KeyWheel(letters, 'C', 'ADE')
+        kw.set_pos('F')
+        expected = []
+        for n in range(3 * len(letters)):
+            expected.append(kw.is_effective())
+            kw.rotate()
+
+        kw.set_pos('F')
+        for n, eff in enumerate(expected):
+            self.assertEqual(eff, kw.is_effective_at(n))
+        self.assertEqual('F', kw.display())
+
     def test_set_pos(self):
         letters = string.ascii_uppercase
         kw = KeyWheel(letters, 'P')
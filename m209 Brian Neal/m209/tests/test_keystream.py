@@ -0,0 +1,177 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""test_keystream.py - Unit tests for the NumPy keystream engine."""
+
+import unittest
+
+from .. import M209Error
+from ..converter import M209
+from ..key_wheel import KeyWheelError
+from ..keystream import (keystream, batch_keystream, count_tables, lug_counts,
+                         pin_bits, wheel_positions, TOTAL_PINS)
+from ..keylist.generate import generate_key_list
+
+
+AA_LUGS = '0-4 0-5*4 0-6*6 1-0*5 1-2 1-5*4 3-0*3 3-4 3-6 5-6'
+
+AA_PIN_LIST = [
+    'FGIKOPRSUVWYZ',
+    'DFGKLMOTUY',
+    'ADEFGIORTUVX',
+    'ACFGHILMRSU',
+    'BCDEFJKLPS',
+    'EFGHIJLMNP'
+]
+
+
+def simulate_counts(m, n):
+    """Steps the M209 instance m n times and returns the drum counts."""
+    counts = []
+    for _ in range(n):
+        pins = [kw.is_effective() for kw in m.key_wheels]
+        counts.append(m.drum.rotate(pins))
+        for kw in m.key_wheels:
+            kw.rotate()
+    return counts
+
+
+class KeystreamTestCase(unittest.TestCase):
+
+    def test_matches_drum_counts(self):
+
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        m.set_key_wheels('YGXREL')
+        expected = simulate_counts(m, 500)
+
+        result = keystream(AA_LUGS, AA_PIN_LIST, 'YGXREL', 500)
+        self.assertEqual(result.dtype.name, 'uint8')
+        self.assertEqual(result.tolist(), expected)
+
+    def test_matches_encrypt(self):
+
+        for _ in range(10):
+            key_list = generate_key_list('AA')
+            m = M209(key_list.lugs, key_list.pin_list)
+            wheels = m.set_random_key_wheels()
+            ct = m.encrypt('A' * 300, group=False)
+
+            result = keystream(key_list.lugs, key_list.pin_list, wheels, 300)
+            expected = [(ord(c) - ord('Z')) % 26 for c in ct]
+            self.assertEqual((result % 26).tolist(), expected)
+
+    def test_lug_list(self):
+
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        lugs = m.drum.bars
+        self.assertEqual(keystream(lugs, AA_PIN_LIST).tolist(),
+                         keystream(AA_LUGS, AA_PIN_LIST).tolist())
+
+    def test_empty_settings(self):
+
+        result = keystream(None, None, length=100)
+        self.assertEqual(result.tolist(), [0] * 100)
+
+    def test_invalid_settings(self):
+
+        self.assertRaises(M209Error, keystream, AA_LUGS, AA_PIN_LIST[:5])
+        self.assertRaises(M209Error, keystream, AA_LUGS, AA_PIN_LIST, 'AAA')
+        self.assertRaises(KeyWheelError, keystream, AA_LUGS, AA_PIN_LIST,
+                          'AWAAAA')
+
+
+class BatchKeystreamTestCase(unittest.TestCase):
+
+    def test_lug_counts(self):
+
+        counts = lug_counts(AA_LUGS)
+        self.assertEqual(27, counts.sum())
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        self.assertEqual(m.drum.count_table, count_tables([counts])[0].tolist())
+
+    def test_pin_bits(self):
+
+        bits = pin_bits(AA_PIN_LIST)
+        self.assertEqual(TOTAL_PINS, len(bits))
+        self.assertEqual(sum(len(pins) for pins in AA_PIN_LIST), bits.sum())
+        self.assertEqual([0, 0, 0, 0, 0, 1, 1, 0], bits[:8].tolist())
+        self.assertEqual(0, pin_bits(None).sum())
+
+    def test_batch(self):
+
+        key_lists = [generate_key_list('AA') for _ in range(20)]
+        wheels = [M209().set_random_key_wheels() for _ in key_lists]
+
+        result = batch_keystream(
+                    [lug_counts(k.lugs) for k in key_lists],
+                    [pin_bits(k.pin_list) for k in key_lists],
+                    [wheel_positions(w) for w in wheels],
+                    length=200)
+        self.assertEqual((20, 200), result.shape)
+
+        for row, key_list, w in zip(result, key_lists, wheels):
+            m = M209(key_list.lugs, key_list.pin_list)
+            m.set_key_wheels(w)
+            self.assertEqual(row.tolist(), simulate_counts(m, 200))
+
+    def test_default_positions(self):
+
+        result = batch_keystream([lug_counts(AA_LUGS)], [pin_bits(AA_PIN_LIST)])
+        self.assertEqual(result[0].tolist(),
+                         keystream(AA_LUGS, AA_PIN_LIST, 'AAAAAA').tolist())
+
+    def test_invalid_shapes(self):
+
+        counts = [lug_counts(AA_LUGS)] * 2
+        bits = [pin_bits(AA_PIN_LIST)] * 2
+        self.assertRaises(M209Error, batch_keystream, counts, bits[:1])
+        self.assertRaises(M209Error, batch_keystream, counts, bits, [[0] * 6])
+
+
+class BytesTestCase(unittest.TestCase):
+
+    PLAINTEXT = 'THE PIZZA HAS ARRIVED AT THE FRONT GATE ' * 50
+
+    def test_encrypt_bytes(self):
+
+        for group in (True, False):
+            m1 = M209(AA_LUGS, AA_PIN_LIST)
+            m1.set_key_wheels('FFEGJP')
+            expected = m1.encrypt(self.PLAINTEXT, group=group)
+
+            m2 = M209(AA_LUGS, AA_PIN_LIST)
+            m2.set_key_wheels('FFEGJP')
+            result = m2.encrypt_bytes(self.PLAINTEXT.encode('ascii'), group=group)
+            self.assertEqual(expected.encode('ascii'), result)
+            self.assertEqual(m1.letter_counter, m2.letter_counter)
+            self.assertEqual(m1.encrypt('ABC'), m2.encrypt('ABC'))
+
+    def test_decrypt_bytes(self):
+
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        m.set_key_wheels('FFEGJP')
+        ct = m.encrypt(self.PLAINTEXT)
+
+        for z_sub in (True, False):
+            m.set_key_wheels('FFEGJP')
+            expected = m.decrypt(ct, z_sub=z_sub)
+            m.set_key_wheels('FFEGJP')
+            result = m.decrypt_bytes(bytearray(ct.encode('ascii')), z_sub=z_sub)
+            self.assertEqual(expected.encode('ascii'), result)
+
+    def test_short_input(self):
+
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        self.assertEqual(b'', m.encrypt_bytes(b''))
+        m.set_key_wheels('AAAAAA')
+        self.assertEqual(b'QLRRN TPTFU TRPTN MWQTV JLIJE J',
+                         m.encrypt_bytes(b'A' * 26))
+
+    def test_illegal_chars(self):
+
+        m = M209(AA_LUGS, AA_PIN_LIST)
+        self.assertRaises(M209Error, m.encrypt_bytes, b'ATTACK AT DAWN', spaces=False)
+        self.assertRaises(M209Error, m.encrypt_bytes, b'attack')
+        self.assertRaises(M209Error, m.decrypt_bytes, b'ABCDE FGHIJ', spaces=False)
+        self.assertEqual(0, m.letter_counter)
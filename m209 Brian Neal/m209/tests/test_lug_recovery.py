@@ -0,0 +1,81 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""test_lug_recovery.py - Unit tests for the lug settings recovery."""
+
+import random
+import unittest
+
+import numpy as np
+
+from .. import M209Error
+from ..drum import Drum
+from ..keystream import keystream, lug_counts, pin_bits, TOTAL_PINS
+from ..keylist.generate import generate_key_list
+from ..lug_recovery import (design_matrix, guide_arm_probabilities, nnls,
+                            recover_counts, recover_lugs, round_counts)
+
+
+AA_LUGS = '0-4 0-5*4 0-6*6 1-0*5 1-2 1-5*4 3-0*3 3-4 3-6 5-6'
+
+AA_PIN_LIST = [
+    'FGIKOPRSUVWYZ',
+    'DFGKLMOTUY',
+    'ADEFGIORTUVX',
+    'ACFGHILMRSU',
+    'BCDEFJKLPS',
+    'EFGHIJLMNP'
+]
+
+
+class LugRecoveryTestCase(unittest.TestCase):
+
+    def test_design_matrix(self):
+
+        bits = pin_bits(AA_PIN_LIST)
+        a = design_matrix(bits, 100, 'TNMRSO')
+        counts = lug_counts(AA_LUGS)
+        self.assertEqual((a @ counts).astype(int).tolist(),
+                         keystream(AA_LUGS, AA_PIN_LIST, 'TNMRSO', 100).tolist())
+
+        a = design_matrix(np.full(TOTAL_PINS, 0.5), 10)
+        self.assertTrue(np.allclose(a[:, :6], 0.5))
+        self.assertTrue(np.allclose(a[:, 6:], 0.75))
+
+        self.assertRaises(M209Error, guide_arm_probabilities, bits[:10], 10)
+
+    def test_nnls(self):
+
+        rng = np.random.default_rng(1)
+        a = rng.random((50, 8))
+        x = np.array([0, 2, 0, 1, 3, 0, 0, 5], dtype=float)
+        self.assertTrue(np.allclose(nnls(a, a @ x), x))
+
+        x = nnls(a, a @ x - 10 * a[:, 1])
+        self.assertTrue((x >= 0).all())
+
+    def test_round_counts(self):
+
+        counts = round_counts([2.6, 0.2, 10.1, 14.4, 0, 0.1], 27)
+        self.assertEqual(counts.sum(), 27)
+        self.assertEqual(counts.tolist(), [3, 0, 10, 14, 0, 0])
+
+        # Without any information the bars are spread over all lug types:
+        counts = round_counts(np.zeros(21), 27)
+        self.assertEqual(counts.sum(), 27)
+        self.assertEqual(sorted(set(counts.tolist())), [1, 2])
+        self.assertEqual(round_counts(np.zeros(6), 0).tolist(), [0] * 6)
+
+    def test_known_pins(self):
+
+        for n in range(10):
+            key_list = generate_key_list('AA', rng=random.Random(n))
+            bits = pin_bits(key_list.pin_list)
+            known = keystream(key_list.lugs, key_list.pin_list, 'AAAAAA', 200)
+
+            counts = recover_counts(known, bits)
+            self.assertEqual(counts.tolist(), lug_counts(key_list.lugs).tolist())
+
+            drum = Drum.from_key_list(recover_lugs(known % 26, bits))
+            self.assertEqual(drum.count_table, Drum.from_key_list(key_list.lugs).count_table)
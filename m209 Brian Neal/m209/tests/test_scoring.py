@@ -0,0 +1,95 @@
+# Copyright (C) 2013 by Brian Neal.
+# This file is part of m209, the M-209 simulation.
+# m209 is released under the MIT License (see LICENSE.txt).
+
+"""test_scoring.py - Unit tests for the incremental keystream scoring."""
+
+import random
+import unittest
+
+import numpy as np
+
+from .. import M209Error
+from ..keystream import (keystream, batch_keystream, lug_counts, pin_bits,
+                         wheel_positions, TOTAL_PINS, NUM_LUG_TYPES)
+from ..scoring import (KeystreamScore, pin_steps, DISPLACEMENT_ERRORS,
+                       MISMATCH_ERRORS)
+
+
+AA_LUGS = '0-4 0-5*4 0-6*6 1-0*5 1-2 1-5*4 3-0*3 3-4 3-6 5-6'
+
+AA_PIN_LIST = [
+    'FGIKOPRSUVWYZ',
+    'DFGKLMOTUY',
+    'ADEFGIORTUVX',
+    'ACFGHILMRSU',
+    'BCDEFJKLPS',
+    'EFGHIJLMNP'
+]
+
+
+def full_error(known, counts, bits, key_wheels, errors):
+    """Scores a key by simulating the whole keystream."""
+    simulated = batch_keystream([counts], [bits], [wheel_positions(key_wheels)],
+                                len(known))[0]
+    return int(errors[np.asarray(known) % 26, simulated].sum())
+
+
+class KeystreamScoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.known = keystream(AA_LUGS, AA_PIN_LIST, 'TNMRSO', 300)
+        self.counts = lug_counts(AA_LUGS)
+        self.bits = pin_bits(AA_PIN_LIST)
+
+    def test_correct_key(self):
+
+        for errors in (MISMATCH_ERRORS, DISPLACEMENT_ERRORS):
+            score = KeystreamScore(self.known, self.counts, self.bits, 'TNMRSO', errors)
+            self.assertEqual(score.error, 0)
+            self.assertEqual(score.matches(), 300)
+            self.assertEqual(score.keystream().tolist(), self.known.tolist())
+
+    def test_pin_steps(self):
+
+        steps = pin_steps(100, 'TNMRSO')
+        self.assertEqual(len(steps), TOTAL_PINS)
+        positions = np.sort(np.concatenate(steps))
+        self.assertEqual(positions.tolist(), sorted(list(range(100)) * 6))
+
+    def test_moves(self):
+
+        rng = random.Random(3)
+        for errors in (MISMATCH_ERRORS, DISPLACEMENT_ERRORS):
+            score = KeystreamScore(self.known, self.counts, self.bits, 'TNMRSO', errors)
+            for n in range(200):
+                if rng.random() < 0.5:
+                    pin = rng.randrange(TOTAL_PINS)
+                    expected = score.pin_flip_error(pin)
+                    self.assertEqual(score.flip_pin(pin), expected)
+                else:
+                    source = rng.choice(np.flatnonzero(score.counts).tolist())
+                    target = rng.randrange(NUM_LUG_TYPES)
+                    expected = score.lug_move_error(source, target)
+                    self.assertEqual(score.move_lug(source, target), expected)
+                self.assertEqual(score.error, full_error(self.known, score.counts, score.bits,
+                                                         'TNMRSO', errors))
+
+    def test_evaluate_does_not_change_key(self):
+
+        score = KeystreamScore(self.known, self.counts, self.bits, 'TNMRSO')
+        score.pin_flip_error(7)
+        score.lug_move_error(0, 12)
+        self.assertEqual(score.error, 0)
+        self.assertEqual(score.bits.tolist(), self.bits.tolist())
+        self.assertEqual(score.counts.tolist(), self.counts.tolist())
+
+        self.assertGreater(score.flip_pin(7), 0)
+        self.assertEqual(score.flip_pin(7), 0)
+
+    def test_errors(self):
+
+        empty = lug_counts('1-0')
+        self.assertRaises(M209Error, KeystreamScore(self.known, empty, self.bits).move_lug, 3, 4)
+        self.assertRaises(M209Error, KeystreamScore, self.known, self.counts[:5], self.bits)
+        self.assertRaises(M209Error, KeystreamScore, self.known, self.counts, self.bits[:5])